@@ -1,8 +1,10 @@
 from UserDict import IterableUserDict, UserDict
 from UserList import UserList
+from operator import itemgetter
 
+import numpy
 import simplejson
-from typing import Union
+from typing import Any, Callable, Dict, List, Tuple, Union
 
 
 
@@ -22,11 +24,9 @@ class Condition(IterableUserDict):
         if event is None: return False
         if rule  is None: rule = self
 
-        # Each key in rule is an AND clause
+        # Each key in rule is an AND clause, dotted keys are nested paths unless a literal key, see: get_value()
         for key in rule.keys():
-            event_item = None
-            if key in event:          event_item = event[key]
-            elif hasattr(event, key): event_item = getattr(event, key)
+            event_item = get_value(event, key)
 
             if not event_item:
                 return False
@@ -54,12 +54,244 @@ class Condition(IterableUserDict):
 
         return True
 
+    def paths( self ):  # type: () -> List[Tuple[tuple, Any]]
+        """returns [ (path, rule) ] for each leaf rule, eg: { "name": { "type": "command" } } -> [ (("name", "type"), "command") ]"""
+        return flatten_rules(self.data)
+
+
     @staticmethod
     def compare_item( event_item, rule_item ):
         if callable(rule_item):
-            rule_item = rule_item.__call__()
+            return bool( rule_item(event_item) )  # predicate, eg: lambda x: x.startswith("test")
 
         if isinstance(event_item, (list, UserList)):
             return rule_item in event_item
         else:
             return event_item == rule_item
+
+
+    def compile( self ):  # type: () -> Callable[[Any], bool]
+        """
+        returns a specialised matcher(event) function, equivalent to self.matches(event) but without interpreting the rules per event
+        nested rules are flattened into (path, test) pairs with precomputed accessors, OR-lists of hashable values become frozensets,
+        and tests are ordered by expected selectivity and cost: equality, then set membership (smallest first), then predicates
+        """
+        tests = sorted( compile_rules(self.data), key=itemgetter(0) )
+        tests = tuple( test for cost, test in tests )
+
+        def matcher( event, tests=tests ):
+            if event is None: return False
+            for test in tests:
+                if not test(event): return False
+            return True
+        return matcher
+
+
+    def compile_mask( self ):  # type: () -> Callable[[numpy.recarray], numpy.ndarray]
+        """
+        returns a vectorised mask(chunk) function for numpy.recarray (or structured ndarray) chunks, equivalent to [ matcher(row) for row in chunk ]
+        rules are evaluated per column: equality and OR-lists as array comparisons, predicates are first called with the whole column,
+        falling back to per value calls if they do not return a boolean array. Nested rules fall back to the compiled matcher per row
+        """
+        paths = self.paths()
+        tests = [ compile_column(path[0], rule) for path, rule in paths if len(path) == 1 ]
+        if len(tests) != len(paths) or None in tests:
+            return compile_rows(self.compile())
+
+        def mask( chunk, tests=tests ):
+            output = numpy.ones(len(chunk), dtype=bool)
+            for test in tests:
+                output &= test(chunk)
+                if not output.any(): break
+            return output
+        return mask
+
+
+
+### Compiled matchers, as closures with default argument binding to avoid attribute lookups per event
+
+def compile_rules( rules ):  # type: (Dict) -> List[Tuple[tuple, Callable]]
+    """returns [ (cost, test(event)) ] for each leaf rule, nested dicts are flattened into paths"""
+    tests = []
+    for path, rule in flatten_rules(rules):
+        if isinstance(rule, (dict, UserDict)):
+            tests.append( ((0, 0, len(path)), compile_test(path, truthy)) )  # empty nested rule: value must exist
+        elif isinstance(rule, (list, UserList)):
+            values = list(rule)
+            if values and all( is_hashable(value) for value in values ):
+                tests.append( ((1, len(values), len(path)), compile_test(path, compile_set(frozenset(values)))) )
+            else:
+                tests.append( ((2, len(values), len(path)), compile_test(path, compile_any(values))) )
+        elif callable(rule):
+            tests.append( ((3, 0, len(path)), compile_test(path, rule)) )
+        else:
+            tests.append( ((0, 1, len(path)), compile_test(path, compile_equal(rule))) )
+    return tests
+
+
+def flatten_rules( rules, path=() ):  # type: (Dict, tuple) -> List[Tuple[tuple, Any]]
+    """returns [ (path, rule) ] for each leaf rule, an empty nested rule is a leaf"""
+    output = []
+    for key, rule in rules.items():
+        if isinstance(rule, (dict, UserDict)) and rule:
+            output += flatten_rules(rule, path + (key,))
+        else:
+            output.append( (path + (key,), rule) )
+    return output
+
+
+def is_dotted( key ):  # type: (Any) -> bool
+    return isinstance(key, basestring) and '.' in key
+
+
+def compile_test( path, compare ):  # type: (Tuple[str], Callable) -> Callable
+    """test(event): every value along path must exist and be truthy, then compare(value)"""
+    if len(path) == 1:
+        def test( event, key=path[0], compare=compare ):
+            value = get_value(event, key)
+            return bool(value) and bool(compare(value))
+    else:
+        def test( event, path=path, compare=compare ):
+            value = event
+            for key in path:
+                value = get_value(value, key)
+                if not value: return False
+            return bool(compare(value))
+    return test
+
+
+def get_value( event, key ):  # type: (Any, str) -> Any
+    """
+    event[key] or event.key, a dotted key is first looked up as a literal key, eg: the CSV column "PT08.S1(CO)",
+    and only otherwise as a nested path, eg: "name.type" -> event["name"]["type"]
+    """
+    try:
+        if key in event: return event[key]
+    except TypeError:
+        return None  # event is not a container
+    value = getattr(event, key, None)
+    if value is None and is_dotted(key):
+        return get_path(event, key.split('.'))
+    return value
+
+
+def get_path( event, path ):  # type: (Any, tuple) -> Any
+    """returns the value at path in event, or None if any value along path is missing or falsy"""
+    value = event
+    for key in path:
+        value = get_value(value, key)
+        if not value: return None
+    return value
+
+
+def truthy( value ):  # type: (Any) -> bool
+    return True
+
+
+def compile_equal( rule ):  # type: (Any) -> Callable
+    def compare( value, rule=rule, sequence=(list, UserList) ):
+        if isinstance(value, sequence): return rule in value
+        return value == rule
+    return compare
+
+
+def compile_set( values ):  # type: (frozenset) -> Callable
+    def compare( value, values=values, sequence=(list, UserList) ):
+        try:
+            if isinstance(value, sequence): return any( item in values for item in value )
+            return value in values
+        except TypeError:
+            return any( Condition.compare_item(value, rule) for rule in values )  # unhashable value
+    return compare
+
+
+def compile_any( rules ):  # type: (List[Any]) -> Callable
+    def compare( value, rules=rules ):
+        return any( Condition.compare_item(value, rule) for rule in rules )
+    return compare
+
+
+### Compiled column masks, for numpy.recarray chunks
+
+def compile_column( key, rule ):  # type: (str, Any) -> Union[Callable, None]
+    """test(chunk) returning a boolean mask for a single column rule, or None if the rule cannot be vectorised"""
+    rules = [] if isinstance(rule, (dict, UserDict)) else list(rule) if isinstance(rule, (list, UserList)) else [ rule ]
+    if any( not callable(rule) and not is_hashable(rule) for rule in rules ): return None
+    compare = compile_column_values(rules) if rules else None  # empty nested rule: value must exist
+    truthy  = compare is None or any( callable(rule) or not rule for rule in rules )  # equal to a truthy rule implies truthy
+
+    def test( chunk, key=key, compare=compare, truthy=truthy ):
+        if key not in chunk.dtype.names: return numpy.zeros(len(chunk), dtype=bool)
+        column = chunk[key]
+        if compare is None: return truthy_mask(column)
+        if not truthy:      return compare(column)
+        return truthy_mask(column) & compare(column)  # as compile_test(), values must be truthy
+    return test
+
+
+def compile_column_values( rules ):  # type: (List[Any]) -> Callable
+    """compare(column) returning a mask of values matching any of rules"""
+    values     = [ rule for rule in rules if not callable(rule) ]
+    predicates = [ compile_column_predicate(rule) for rule in rules if callable(rule) ]
+    numbers    = [ value for value in values if value_kind(value) == "number" ]
+    strings    = [ value for value in values if value_kind(value) == "string" ]
+    groups     = dict( [ (kind, numbers) for kind in "biufc" ] + [ (kind, strings) for kind in "SU" ], O=values )  # dtype.kind -> values
+
+    def compare( column, groups=groups, predicates=predicates ):
+        values = groups.get(column.dtype.kind, ())  # other values never match
+        if len(values) == 1 and not predicates: return as_mask(column == values[0], len(column))
+        output = numpy.zeros(len(column), dtype=bool)
+        if len(values) > 8 and column.dtype.kind != "O":
+            output |= numpy.in1d(column, values)
+        else:
+            for value in values: output |= as_mask(column == value, len(column))
+        for predicate in predicates:
+            output |= predicate(column)
+        return output
+    return compare
+
+
+def compile_column_predicate( predicate ):  # type: (Callable) -> Callable
+    def compare( column, predicate=predicate ):
+        try:
+            output = predicate(column)  # eg: lambda x: x > 1000
+            if isinstance(output, numpy.ndarray) and output.shape == column.shape: return output.astype(bool)
+        except Exception:
+            pass  # eg: lambda x: x.startswith("test")
+        return numpy.fromiter( ( bool(value) and bool(predicate(value)) for value in column ), dtype=bool, count=len(column) )
+    return compare
+
+
+def compile_rows( matcher ):  # type: (Callable) -> Callable
+    def mask( chunk, matcher=matcher ):
+        rows = chunk.view(numpy.recarray)  # numpy.record rows support attribute access
+        return numpy.fromiter( ( matcher(row) for row in rows ), dtype=bool, count=len(chunk) )
+    return mask
+
+
+def truthy_mask( column ):  # type: (numpy.ndarray) -> numpy.ndarray
+    if column.dtype.kind in 'biufc': return column != 0
+    if column.dtype.kind in 'SU':    return column != column.dtype.type()
+    return numpy.fromiter( ( bool(value) for value in column ), dtype=bool, count=len(column) )
+
+
+def as_mask( output, length ):  # type: (Any, int) -> numpy.ndarray
+    """column == value returns a scalar rather than an array when the types are not comparable"""
+    if isinstance(output, numpy.ndarray) and output.shape == (length,): return output
+    return numpy.zeros(length, dtype=bool)
+
+
+def value_kind( value ):  # type: (Any) -> str
+    """numbers and strings are only compared with numeric and string columns respectively"""
+    if isinstance(value, (bool, int, long, float, complex, numpy.number, numpy.bool_)): return "number"
+    if isinstance(value, basestring):                                                return "string"
+    return "other"
+
+
+def is_hashable( value ):  # type: (Any) -> bool
+    if callable(value): return False
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
@@ -0,0 +1,140 @@
+import csv
+import os
+
+import numpy
+import pytest
+
+from src.util.Record import Record
+from .Condition import Condition
+from .EventManager import EventManager
+from src.queue.Router import Router
+
+airqualityfile = os.path.join( os.path.dirname(__file__), '../../data/air_quality/AirQualityUCI.csv' )
+
+rules = [
+    {},
+    { "type": "command" },
+    { "type": [ "command", "response" ] },
+    { "type": [ "command", lambda x: x.startswith("resp") ] },
+    { "action": lambda x: x.startswith("test") },
+    { "name": { "type": [ "command", "response" ] }, "action": "testCommand" },
+    { "name": { "type": "command", "id": 1 } },
+    { "name": {} },
+    { "tags": "urgent" },
+    { "tags": [ "urgent", "low" ] },
+    { "type": [] },
+    { "value": 0 },
+    { "name.type": "command" },
+    { "name.type": [ "command", "response" ], "name.id": 1 },
+    { "name.type": lambda x: x.startswith("resp") },
+    { "missing.type": "command" },
+]
+events = [
+    {},
+    { "type": "command" },
+    { "type": "response", "value": 0 },
+    { "type": "other", "action": "testCommand" },
+    { "name": { "type": "command", "id": 1 }, "action": "testCommand" },
+    { "name": { "type": "response" }, "action": "testCommand" },
+    { "name": "command", "action": "other" },
+    { "tags": [ "urgent", "new" ], "type": "command" },
+    { "tags": [ { "unhashable": True } ], "type": [ "command" ] },
+    Record({ "type": "command", "action": "testRecord" }),
+]
+
+
+
+@pytest.mark.parametrize("rule", rules)
+def test_Condition_compile( rule ):
+    condition = Condition(rule)
+    matcher   = condition.compile()
+    for event in events:
+        try:
+            expected = condition.matches(event)
+        except (AttributeError, TypeError):
+            continue  # eg: nested rules on a string value, or predicates on a list value
+        assert matcher(event) == expected, (rule, event)
+    assert matcher(None) is False
+
+
+def test_Condition_compile_order():
+    matcher = Condition({ "action": lambda x: calls.append(x), "type": [ "command", "response" ], "id": 1 }).compile()
+    calls   = []
+    assert matcher({ "action": "test", "type": "command", "id": 2 }) is False
+    assert calls == []  # equality and set membership are tested before predicates
+
+
+def test_Condition_paths():
+    condition = Condition({ "name.type": "command", "name": { "id": 1, "tags": {} }, "action": "test" })
+    assert sorted(condition.paths()) == [ (("action",), "test"), (("name", "id"), 1), (("name", "tags"), {}), (("name.type",), "command") ]
+    assert condition.matches({ "name": { "type": "command", "id": 1, "tags": [ "urgent" ] }, "action": "test" })
+    assert not condition.matches({ "name": { "type": "command", "id": 1 }, "action": "test" })
+
+
+def test_Condition_dotted_column():
+    # dotted keys are literal keys where the event has them, eg: AirQualityUCI.csv columns
+    with open(airqualityfile) as file:
+        row = next(csv.DictReader(file))
+    rule = { "PT08.S1(CO)": "1360", "PT08.S2(NMHC)": [ "1046", "955" ] }
+    assert Condition(rule).matches(row)
+    assert Condition(rule).compile()(row)
+    assert not Condition({ "PT08.S1(CO)": "1292" }).compile()(row)
+    assert Condition({ "PT08.S1(CO)": "1360" }).compile_mask()(numpy.rec.fromrecords([ ("1360",), ("1292",) ], names=[ "PT08.S1(CO)" ])).tolist() == [ True, False ]
+
+    event_manager = EventManager()
+    event_manager.register(lambda event: "value", { "PT08.S1(CO)": "1360" })
+    event_manager.register(lambda event: "predicate", { "PT08.S1(CO)": lambda x: int(x) > 1000 })
+    assert event_manager.trigger(row) == [ "value", "predicate" ]
+    assert event_manager.trigger({ "PT08": { "S1(CO)": "1360" } }) == [ "value", "predicate" ]  # otherwise a nested path
+    assert event_manager.trigger_many(numpy.rec.fromrecords([ ("1360",) ], names=[ "PT08.S1(CO)" ])) == [ "value", "predicate" ]
+
+    router = Router()
+    router.add(0, { "PT08.S1(CO)": "1360" })
+    router.add(1, { "PT08.S1(CO)": "1360", "T": "13.6" })
+    assert router.match(row) == [ 0, 1 ]
+
+
+def test_EventManager_predicate():
+    # usage example from the EventManager docstring
+    event_manager = EventManager()
+    commands      = []
+    event_manager.register(
+        callback=lambda event: commands.append(event),
+        condition={
+            "name":   { "type": [ "command", "response" ] },
+            "action": lambda x: x.startswith("test")
+        },
+    )
+    event_manager.trigger({ "name": { "type": "command" }, "action": "testCommand" })
+    event_manager.trigger({ "name": { "type": "command" }, "action": "otherCommand" })
+    assert [ event["action"] for event in commands ] == [ "testCommand" ]
+
+
+chunk = numpy.rec.fromrecords([
+    ( 1, 749.2, "kitchen", 0 ),
+    ( 2, 1023.5, "lounge", 1 ),
+    ( 3, 0.0, "", 1 ),
+    ( 4, 1200.0, "kitchen", 0 ),
+], names="id,CO2,sensor,Occupancy")
+column_rules = [
+    {},
+    { "sensor": "kitchen" },
+    { "sensor": [ "lounge", "bedroom" ] },
+    { "sensor": [ "sensor_%d" % n for n in range(10) ] + [ "lounge" ] },     # numpy.in1d()
+    { "id": range(2, 20) },
+    { "CO2": lambda x: x > 1000 },                                            # vectorised predicate
+    { "sensor": lambda x: x.startswith("k") },                                # per value predicate
+    { "sensor": [ "lounge", lambda x: x.endswith("chen") ], "id": 4 },
+    { "Occupancy": 1, "CO2": 0.0 },                                           # falsy values never match
+    { "Occupancy": "1" },                                                     # not comparable
+    { "missing": 1 },
+    { "sensor": { "name": "kitchen" } },                                      # nested: matched per row
+]
+
+
+@pytest.mark.parametrize("rule", column_rules)
+def test_Condition_compile_mask( rule ):
+    condition = Condition(rule)
+    matcher   = condition.compile()
+    mask      = condition.compile_mask()(chunk)
+    assert mask.tolist() == [ matcher(row) for row in chunk ], rule
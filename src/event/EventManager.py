@@ -1,9 +1,12 @@
 from Queue import Empty
 from multiprocessing.queues import Queue
 
-from typing import Any, Callable, Dict, List, Set, Union
+import numpy
+from typing import Any, Callable, Dict, List, Set, Tuple, Union
 
-from .Condition import Condition
+from src.util.Batch import Batch, Tracked
+from .Condition import Condition, get_path, is_dotted
+from .ValueIndex import ValueIndex
 
 
 
@@ -16,6 +19,7 @@ class EventManager(object):
 
     queue         = Manager().Queue()
     event_manager = EventManager(queue, async_pool=ProcessPool()).run()
+    event_manager = EventManager(queue).attach(loop)    # or: trigger events as a task on a shared EventLoop() thread
 
     # register events
     commands = []; responses = [];
@@ -37,21 +41,29 @@ class EventManager(object):
     event_manager.trigger({ "type": "response", "value": "complete" })
     """
     
-    def __init__(self, queue=None, debug=False, async_pool=None ):
-        # type: (Queue, bool, Union['ThreadPool', 'ProcessPool']) -> None
-        if queue: assert isinstance(queue, Queue)
+    def __init__(self, queue=None, debug=False, async_pool=None, cache_size=1024 ):
+        # type: (Queue, bool, Union['ThreadPool', 'ProcessPool'], int) -> None
+        if queue: assert hasattr(queue, 'get'), 'EventManager(queue) must be of type Manager().Queue()'
 
         self.queue      = queue       # type: Queue
         self.async_pool = async_pool  # type: Union['ThreadPool', 'ProcessPool']
         self.options = {
-            "async": bool(async_pool),
-            "debug": bool(debug)
+            "async":      bool(async_pool),
+            "debug":      bool(debug),
+            "cache_size": int(cache_size),  # maximum number of event key-sets in rules_index_cache
             }
 
-        # NOTE: first-pass implementation is to use a unindexed list of events
-        self.rules = []                     # type: List[Dict]
-        self.rules_index = { None: set() }  # type: Dict[Any:Set]
-        self.rules_index_cache = {}         # type: Dict[frozenset:List]
+        self.rules = {}                     # type: Dict[int:Dict]  # index -> rule, unregistered rules are deleted
+        self.rules_next_index = 0           # type: int             # indexes are never reused
+        self.rules_index = { None: set() }  # type: Dict[Any:Set]  # top-level key or nested path tuple -> rules
+        self.rules_index_paths = set()      # type: Set[tuple]       # nested paths and dotted keys in rules_index, eg: ("name", "type")
+        self.rules_index_recent = {}        # type: Dict[int:frozenset]  # rules registered since the last merge into rules_index
+        self.rules_index_recent_lookups = 0 # type: int  # number of lookups when rules_index_recent was first added to
+        self.rules_index_cache = {}         # type: Dict[frozenset:List]   # event key-set -> [ indices, last used ]
+        self.rules_index_cache_hits   = 0   # type: int
+        self.rules_index_cache_misses = 0   # type: int
+        self.rules_index_tombstones   = 0   # type: int  # unregistered indexes which may remain in rules_index_cache
+        self.rules_value_index = ValueIndex()  # type: ValueIndex  # (key, value) -> rules, for equality and OR-list rules
 
 
     ##### Public Interface #####
@@ -59,9 +71,17 @@ class EventManager(object):
     def run( self ):  # type: () -> EventManager
         if self.queue:
             while True:
-                event = self.queue.get()
-                if event == Empty: break
-                self.trigger( event )
+                item = self.queue.get()
+                if item is Empty: break
+                self.trigger_many( Tracked.unwrap(item) )  # readers emit Batch() envelopes when batch_size > 1, matched as a whole
+                Tracked.ack(item)
+        return self
+
+
+    def attach( self, loop ):  # type: ('EventLoop') -> EventManager
+        """triggers events from queue as a task on a shared single-threaded EventLoop, rather than blocking in .run()"""
+        assert self.queue is not None, 'EventManager.attach(loop) requires EventManager(queue)'
+        loop.consume(self.queue, self.trigger_many, unpack=False)
         return self
 
 
@@ -69,14 +89,17 @@ class EventManager(object):
         # type: (Callable, Union[Condition,Dict], Union[Dict,None]) -> int
         assert callable(callback)
 
-        index = len(self.rules)  # current length is same as last index after append
+        index     = self.rules_next_index
+        condition = Condition(condition)
         rule = {
-            "condition": Condition(condition),
+            "condition": condition,
+            "matcher":   condition.compile(),  # compiled once, rather than interpreting the condition per event
             "callback":  callback,
             "options":   options or {},
             "index":     index
             }
-        self.rules.append(rule)
+        self.rules[index]      = rule
+        self.rules_next_index += 1
         self._register_index( index, condition )
 
         if self.options['debug']: print self.__class__.__name__, 'register()', rule
@@ -105,10 +128,9 @@ class EventManager(object):
             if self.options['debug']: print self.__class__.__name__, 'unregister(', callback.__name__, condition, ')'
 
             condition = Condition(condition)
-            for index, rule in enumerate(self.rules):
+            for index, rule in self.rules.items():
                 if (
-                        rule is not None
-                    and rule['callback'] == callback
+                        rule['callback'] == callback
                     and (condition is None) or rule['condition'] == condition
                 ):
                     self.unregister_index(index)
@@ -116,14 +138,24 @@ class EventManager(object):
 
     def unregister_index( self, index ):  # type: (int) -> None
         assert isinstance(index, int)
-        if 0 < index < len(self.rules):
-            rule = self.rules[index]
-            self.rules[index] = None  # Use None rather than del to preserve index numbers
+        if index in self.rules:
+            rule = self.rules.pop(index)  # indexes are never reused, so other indexes are preserved
 
             self._unregister_index( index, rule['condition'] )
             if self.options['debug']: print self.__class__.__name__, 'unregister_index(', index, ')', rule
 
 
+    def cache_info( self ):  # type: () -> Dict[str, int]
+        """rules_index_cache statistics, eg: { "hits": 980, "misses": 20, "size": 20, "maxsize": 1024, "tombstones": 3 }"""
+        return {
+            "hits":       self.rules_index_cache_hits,
+            "misses":     self.rules_index_cache_misses,
+            "size":       len(self.rules_index_cache),
+            "maxsize":    self.options['cache_size'],
+            "tombstones": self.rules_index_tombstones,
+        }
+
+
     def trigger( self, event, options=None ):  # type: (Dict, Union[Dict,None]) -> List[Any]
         if self.options['debug']: print self.__class__.__name__, 'START: trigger(', event, options, ')'
 
@@ -131,19 +163,48 @@ class EventManager(object):
         results = []
         for rule in rules:
             options = reduce(lambda a, b: a.update(b or {}) or a, [self.options, rule["options"], options], {})
-            if self.options["async"]:
-                result = self.async_pool.apipe( rule['callback'], event )
-            else:
-                try:
-                    result = rule['callback'].__call__( event )
-                except Exception as exception:
-                    result = exception
-            results.append( result )
+            results.append( self._callback( rule, [ event ] if rule['options'].get('batch') else event ) )
 
         if self.options['debug']: print self.__class__.__name__, 'END:   trigger(', event, options, ')', results
         return results
 
 
+    def trigger_many( self, events, options=None ):
+        # type: (Union[List[Dict], numpy.recarray, Dict], Union[Dict,None]) -> List[Any]
+        """
+        triggers a chunk of events at once, eg: a Batch() envelope or numpy.recarray chunk, a single event is passed to trigger()
+        events are grouped by key-set, then each candidate rule is evaluated once across each group,
+        numpy.recarray chunks are matched with a vectorised mask per rule, see: Condition.compile_mask()
+
+        callbacks registered with options={ "batch": True } are called once with the list of matching events (or recarray rows),
+        other callbacks once per matching event. Callbacks are called in rule order, rather than event order
+        """
+        if not Batch.is_batch(events) and not isinstance(events, list):  # Record() events are tuples
+            return self.trigger( events, options )
+        if self.options['debug']: print self.__class__.__name__, 'START: trigger_many(', len(events), options, ')'
+
+        results = []
+        for rule, matched in self._match_rules_many( events ):
+            if rule['options'].get('batch'):
+                results.append( self._callback( rule, matched ) )
+            else:
+                for event in matched:
+                    if rule['index'] not in self.rules: break  # eg: register_once()
+                    results.append( self._callback( rule, event ) )
+
+        if self.options['debug']: print self.__class__.__name__, 'END:   trigger_many(', len(events), options, ')', results
+        return results
+
+
+    def _callback( self, rule, event ):  # type: (Dict, Any) -> Any
+        if self.options["async"]:
+            return self.async_pool.apipe( rule['callback'], event )
+        try:
+            return rule['callback'].__call__( event )
+        except Exception as exception:
+            return exception
+
+
 
     ##### Indexing Methods #####
 
@@ -151,23 +212,117 @@ class EventManager(object):
         rules   = []
         indices = self._match_rules_index( event )
         for index in indices:
-            if self.rules[index] is None:  # self._match_rules_index() may return unregistered indices
-                rule = self.rules[index]
-                if rule['condition'].matches( event ):
-                    rules.append( rule )
+            rule = self.rules.get(index)  # self._match_rules_index() may return unregistered indices
+            if rule is not None and rule['matcher']( event ):
+                rules.append( rule )
         return rules
 
 
+    def _match_rules_many( self, events ):  # type: (Union[List[Dict], numpy.recarray]) -> List[Tuple[Dict, List]]
+        """returns [ (rule, matching events) ] in rule order, for each rule matching at least one event"""
+        if isinstance(events, numpy.recarray):
+            return self._match_rules_chunk( events )
+
+        groups     = {}  # type: Dict[frozenset, List[int]]  # event key-set -> positions
+        candidates = {}  # type: Dict[int, List[int]]        # rule index -> positions of candidate events
+        for position, event in enumerate(events):
+            groups.setdefault( self._event_keys( event ), [] ).append( position )
+        for event_keys, positions in groups.iteritems():
+            for index in self._match_rules_event_keys( event_keys ):
+                candidates.setdefault( index, [] ).extend( positions )
+        if len(self.rules_value_index):
+            for position, event in enumerate(events):
+                for index in self.rules_value_index.lookup( event ):
+                    candidates.setdefault( index, [] ).append( position )
+
+        matches = []
+        for index in sorted(candidates):
+            rule = self.rules.get(index)  # candidates may include unregistered indices
+            if rule is None: continue
+            positions = candidates[index]
+            if len(groups) > 1: positions.sort()
+            matcher = rule['matcher']
+            matched = [ events[position] for position in positions if matcher( events[position] ) ]
+            if matched: matches.append( (rule, matched) )
+        return matches
+
+
+    def _match_rules_chunk( self, chunk ):  # type: (numpy.recarray) -> List[Tuple[Dict, numpy.recarray]]
+        """
+        numpy.recarray rows share the same flat key-set, so key indexed rules are found once per chunk and masked across the chunk,
+        value indexed rules are masked across only the rows containing their values, see: ValueIndex.lookup_columns()
+        """
+        names      = chunk.dtype.names
+        event_keys = frozenset(names).union( path for path in self.rules_index_paths if len(path) == 1 and path[0] in names )
+        positions  = dict.fromkeys( self._match_rules_event_keys( event_keys ) )  # type: Dict[int, Any]
+        if len(self.rules_value_index):
+            positions.update( self.rules_value_index.lookup_columns( chunk ) )
+
+        array   = chunk.view(numpy.ndarray)  # numpy.recarray field access is implemented in python, ndarray is not
+        matches = []
+        for index in sorted(positions):
+            rule = self.rules.get(index)
+            if rule is None: continue
+            if 'mask' not in rule: rule['mask'] = rule['condition'].compile_mask()  # compiled on first use
+            rows = array if positions[index] is None else array[ positions[index] ]
+            mask = rule['mask']( rows )
+            if mask.all():   matches.append( (rule, rows.view(numpy.recarray)) )
+            elif mask.any(): matches.append( (rule, rows[mask].view(numpy.recarray)) )
+        return matches
+
+
     def _match_rules_index( self, event ):  # type: (Dict) -> List[int]
-        # quick lookup if we have seen this set of keys before
+        """
+        candidate rules for event: rules with an equality or OR-list rule are looked up by (key, value) in rules_value_index,
+        so dispatch cost stays flat as rules are added, other rules are indexed by the keys and nested paths they contain
+        """
+        indices = self._match_rules_key_index( event )
+        if len(self.rules_value_index):
+            candidates = self.rules_value_index.lookup( event )
+            if candidates:
+                indices = sorted( candidates.union(indices) )
+        return indices
+
+
+    def _match_rules_key_index( self, event ):  # type: (Dict) -> List[int]
+        return self._match_rules_event_keys( self._event_keys( event ) )
+
+
+    def _event_keys( self, event ):  # type: (Dict) -> frozenset
+        """event keys, including which indexed nested paths are present"""
         event_keys = frozenset( event.keys() )
-        if event_keys in self.rules_index_cache:
-            return self.rules_index_cache[event_keys]
+        if self.rules_index_paths:
+            event_keys = event_keys.union( path for path in self.rules_index_paths if get_path(event, path) )
+        return event_keys
+
+
+    def _match_rules_event_keys( self, event_keys ):  # type: (frozenset) -> List[int]
+        # quick lookup if we have seen this set of keys before
+        indices = self._match_rules_key_index_cache( event_keys )
+        if self.rules_index_recent:
+            if self.rules_index_cache_hits + self.rules_index_cache_misses - self.rules_index_recent_lookups > 64:
+                self._merge_rules_index_recent()  # rules which outlive 64 lookups are long lived, also appends to indices
+                return indices
+            # recent rules have larger indexes than any rule in rules_index, so appending keeps indices sorted
+            recent = [ index for index, keys in self.rules_index_recent.iteritems() if keys <= event_keys ]
+            if recent: indices = indices + sorted(recent)
+        return indices
+
+
+    def _match_rules_key_index_cache( self, event_keys ):  # type: (frozenset) -> List[int]
+        entry = self.rules_index_cache.get( event_keys )
+        if entry is not None:
+            self.rules_index_cache_hits += 1
+            entry[1] = self.rules_index_cache_hits + self.rules_index_cache_misses
+            return entry[0]
+        self.rules_index_cache_misses += 1
 
         # match all rules containing at least one event key, excluding removed rules
         indices = set( self.rules_index.get(None, []) )
         for key in self.rules_index:
-            if key in event:
+            if key is None:
+                continue  # rules_index[None] contains every rule
+            elif key in event_keys:
                 # rule contains a key in event = possible match for event
                 indices = indices | self.rules_index[key]  # set.union()
             else:
@@ -175,27 +330,96 @@ class EventManager(object):
                 indices = indices - self.rules_index[key]  # set.difference()
 
         indices = sorted(indices)
-        self.rules_index_cache[event_keys] = indices  # invalidated by self._register_index()
+        if len(self.rules_index_cache) >= self.options['cache_size']:
+            self._evict_rules_index_cache()
+        self.rules_index_cache[event_keys] = [ indices, self.rules_index_cache_hits + self.rules_index_cache_misses ]
         return indices
 
 
     def _register_index( self, index, condition ):  # type: (int, Union[Condition,Dict]) -> None
+        """
+        rules are first added to rules_index_recent, which is matched per event, rather than invalidating rules_index_cache
+        short lived rules, eg: register_once(), are then unregistered without ever affecting the cache
+        """
         condition = Condition(condition)
+        if self.rules_value_index.add( index, condition ) is not None:
+            return  # value indexed rules are looked up per event, so rules_index_cache remains valid
+
+        keys  = index_keys( condition )
+        paths = [ key for key in keys if isinstance(key, tuple) and key not in self.rules_index_paths ]
+        if paths:
+            self.rules_index_paths.update(paths)
+            self._invalidate_rules_index_cache()  # a new nested path changes how event key-sets are computed
+
+        if not self.rules_index_recent:
+            self.rules_index_recent_lookups = self.rules_index_cache_hits + self.rules_index_cache_misses
+        self.rules_index_recent[index] = frozenset(keys)
+        if len(self.rules_index_recent) > 64:
+            self._merge_rules_index_recent()
 
-        self._invalidate_rules_index_cache( index, condition )
-        for key in condition.keys() + [ None ]:
-            if key not in self.rules_index: self.rules_index[key] = set()
-            self.rules_index[key].add(index)
-            
 
     def _unregister_index( self, index, condition ):  # type: (int, Union[Condition,Dict]) -> None
         condition = Condition(condition)
-
-        # NOTE: no need to invalidate cache on remove, as None's are filtered post-cache
-        for key in condition.keys() + [ None ]:
+        if index in self.rules_value_index:
+            self.rules_value_index.remove( index, condition )
+            return
+        if index in self.rules_index_recent:
+            del self.rules_index_recent[index]
+            return
+
+        # NOTE: no need to invalidate cache on remove, as unregistered indices are filtered post-cache
+        for key in index_keys( condition ) + [ None ]:
             if key in self.rules_index:
-                self.rules_index[key].remove(index)
+                self.rules_index[key].discard(index)
+                if key is not None and not self.rules_index[key]:
+                    del self.rules_index[key]  # rule churn with distinct keys would otherwise grow rules_index
+
+        self.rules_index_tombstones += 1
+        if self.rules_index_tombstones > max(64, len(self.rules)):
+            self._compact_rules_index_cache()
 
 
-    def _invalidate_rules_index_cache( self, index, condition ):  # type: (int, Union[Condition,Dict]) -> None
-        self.rules_index_cache = {}  # TODO: can this be optimized, or is a full reset quicker?
+    def _merge_rules_index_recent( self ):  # type: () -> None
+        """
+        moves recent rules into rules_index, and incrementally appends them to only the cached key-sets they could match
+        a cached key-set matches the rules whose keys are a subset of the event keys, and recent indexes are the largest,
+        so appending keeps cached lists sorted
+        """
+        recent = sorted( self.rules_index_recent.iteritems() )
+        for index, keys in recent:
+            for key in list(keys) + [ None ]:
+                if key not in self.rules_index: self.rules_index[key] = set()
+                self.rules_index[key].add(index)
+        for event_keys, entry in self.rules_index_cache.iteritems():
+            for index, keys in recent:
+                if keys <= event_keys:
+                    entry[0].append(index)
+        self.rules_index_recent = {}
+
+
+    def _invalidate_rules_index_cache( self ):  # type: () -> None
+        self.rules_index_cache      = {}
+        self.rules_index_tombstones = 0
+
+
+    def _evict_rules_index_cache( self ):  # type: () -> None
+        """evicts the least recently used quarter of the cache, in a batch rather than reordering the cache per lookup"""
+        entries = sorted( self.rules_index_cache.iteritems(), key=lambda item: item[1][1] )
+        for event_keys, entry in entries[ : max(1, len(entries) // 4) ]:
+            del self.rules_index_cache[event_keys]
+
+
+    def _compact_rules_index_cache( self ):  # type: () -> None
+        """removes unregistered indices from cached lists, once they outnumber registered rules"""
+        for entry in self.rules_index_cache.itervalues():
+            entry[0][:] = [ index for index in entry[0] if index in self.rules ]
+        self.rules_index_tombstones = 0
+
+
+
+def index_keys( condition ):  # type: (Condition) -> List[Any]
+    """
+    keys a rule is indexed under in rules_index: top-level keys as before, nested rules and dotted keys as path tuples,
+    as a dotted key may be either a literal key or a nested path of the event, see: Condition.get_value()
+    """
+    return list(set( path[0] if len(path) == 1 and not is_dotted(path[0]) else path for path, rule in condition.paths() ))
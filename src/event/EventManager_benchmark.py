@@ -0,0 +1,123 @@
+import random
+import sys
+import time
+
+import numpy
+from typing import Callable, List
+
+from .Condition import Condition
+from .EventManager import EventManager
+
+
+
+# Benchmark of EventManager dispatch latency as the number of rules grows: python -m src.event.EventManager_benchmark
+# "linear scan" is the cost of matching every rule per event, which the key and (key, value) indexes avoid
+def main():
+    random.seed(0)
+    print "%10s %16s %16s %16s" % ("rules", "register us/rule", "trigger us/event", "linear scan us/event")
+    for count in [ 10, 100, 1000, 10000, 100000 ]:
+        conditions = [ create_condition(n) for n in range(count) ]
+        events     = [ create_event(random.randrange(count)) for n in range(10000) ]
+
+        event_manager = EventManager()
+        start = time.time()
+        for condition in conditions:
+            event_manager.register(callback, condition)
+        register = time.time() - start
+
+        start = time.time()
+        for event in events:
+            event_manager.trigger(event)
+        trigger = time.time() - start
+
+        scan = benchmark_scan(conditions, events[:100]) / 100 if count <= 10000 else None
+        print "%10d %16.2f %16.2f %16s" % (count, register / count * 1e6, trigger / len(events) * 1e6,
+                                          "%.2f" % (scan * 1e6) if scan is not None else "-")
+        sys.stdout.flush()
+
+    # register_once() churn with heterogeneous events: every register() used to reset rules_index_cache
+    print
+    print "%10s %16s %16s %16s" % ("rules", "static us/event", "churn us/event", "cache hit rate")
+    for count in [ 10, 100, 1000, 10000 ]:
+        event_manager = EventManager()
+        for n in range(count):
+            event_manager.register(callback, { "field_%d" % (n % 100): lambda value: value > 0 })
+        events = [ create_sparse_event(n) for n in range(10000) ]
+
+        static = benchmark_churn(event_manager, events, churn=False)
+        churn  = benchmark_churn(event_manager, events, churn=True)
+        info   = event_manager.cache_info()
+        print "%10d %16.2f %16.2f %16.2f" % (count, static / len(events) * 1e6, churn / len(events) * 1e6,
+                                             info["hits"] / float(info["hits"] + info["misses"]))
+        sys.stdout.flush()
+
+    # trigger() per event, vs trigger_many() per batch of 1000 dict events, vs trigger_many() per numpy.recarray chunk
+    print
+    print "%10s %16s %16s %16s" % ("rules", "trigger us/event", "many us/event", "chunk us/event")
+    for count in [ 10, 1000, 100000 ]:
+        event_manager = EventManager()
+        for n in range(count):
+            event_manager.register(callback, create_condition(n))
+        events = [ create_event(random.randrange(count)) for n in range(10000) ]
+        chunks = [ create_chunk(events[n:n+1000]) for n in range(0, len(events), 1000) ]
+
+        start = time.time()
+        for event in events: event_manager.trigger(event)
+        trigger = time.time() - start
+
+        start = time.time()
+        for n in range(0, len(events), 1000): event_manager.trigger_many(events[n:n+1000])
+        many = time.time() - start
+
+        start = time.time()
+        for chunk in chunks: event_manager.trigger_many(chunk)
+        chunk = time.time() - start
+        print "%10d %16.2f %16.2f %16.2f" % (count, trigger / len(events) * 1e6, many / len(events) * 1e6, chunk / len(events) * 1e6)
+        sys.stdout.flush()
+
+
+def create_condition( n ):  # type: (int) -> dict
+    """9 in 10 rules are equality rules on type, 1 in 10 are OR-lists on name with a predicate"""
+    if n % 10: return { "type": "type_%d" % n, "source": "sensor" }
+    else:      return { "name": [ "name_%d" % n, "alias_%d" % n ], "value": lambda value: value > 0 }
+
+
+def create_event( n ):  # type: (int) -> dict
+    return { "type": "type_%d" % n, "name": "name_%d" % n, "source": "sensor", "value": 1 }
+
+
+def create_sparse_event( n ):  # type: (int) -> dict
+    """events with one of 1000 distinct key-sets, eg: packets with optional header fields"""
+    random.seed(n % 1000)
+    return { "field_%d" % key: 1 for key in random.sample(range(100), 5) }
+
+
+def create_chunk( events ):  # type: (List[dict]) -> numpy.recarray
+    names = [ "type", "name", "source", "value" ]
+    return numpy.rec.fromrecords([ tuple( event[name] for name in names ) for event in events ], names=names)
+
+
+def callback( event ):
+    return event
+
+
+def benchmark_churn( event_manager, events, churn ):  # type: (EventManager, List[dict], bool) -> float
+    """returns seconds to trigger events, optionally registering a one-off rule before each event"""
+    start = time.time()
+    for event in events:
+        if churn: event_manager.register_once(callback, { "field_0": lambda value: value > 0 })
+        event_manager.trigger(event)
+    return time.time() - start
+
+
+def benchmark_scan( conditions, events ):  # type: (List[dict], List[dict]) -> float
+    matchers = [ Condition(condition).compile() for condition in conditions ]
+    start    = time.time()
+    for event in events:
+        for matcher in matchers:
+            if matcher(event): callback(event)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import numpy
+
+from .EventManager import EventManager
+from .ValueIndex import ValueIndex
+
+
+
+def test_ValueIndex():
+    index = ValueIndex()
+    assert index.add(0, { "type": [ "command", "response" ], "action": "test" }) == ("action",)
+    assert index.add(1, { "action": lambda x: x.startswith("test") }) is None
+    assert index.add(2, { "type": "command" }) == ("type",)
+    assert index.lookup({ "type": "command", "action": "test" }) == { 0, 2 }
+    assert index.lookup({ "type": [ "response", "command" ] })   == { 2 }
+    index.remove(2, { "type": "command" })
+    assert index.lookup({ "type": "command" }) == set()
+    assert index.index == { ("action",): { "test": { 0 } } }
+
+
+def test_ValueIndex_selectivity():
+    index = ValueIndex()
+    assert index.add(0, { "source": "sensor", "type": "type_0" }) == ("source",)  # ties in sorted order
+    assert index.add(1, { "source": "sensor", "type": "type_1" }) == ("type",)    # "source": "sensor" already has a rule
+    assert index.add(2, { "source": "other",  "type": "type_1" }) == ("source",)
+    assert index.lookup({ "source": "sensor", "type": "type_1" }) == { 0, 1 }
+
+
+def test_ValueIndex_lookup_columns():
+    index = ValueIndex()
+    index.add(0, { "sensor": "kitchen" })
+    index.add(1, { "sensor": [ "lounge", "kitchen" ], "CO2": lambda x: x > 1000 })
+    index.add(2, { "Occupancy": 1 })
+    index.add(3, { "missing": 1 })
+    chunk     = numpy.rec.fromrecords([ ("kitchen", 0), ("lounge", 1), ("kitchen", 1), ("bedroom", 0) ], names="sensor,Occupancy")
+    positions = { id: positions.tolist() for id, positions in index.lookup_columns(chunk).items() }
+    assert positions == { 0: [ 0, 2 ], 1: [ 0, 1, 2 ], 2: [ 1, 2 ] }
+
+
+def test_EventManager_value_index():
+    event_manager = EventManager()
+    events        = []
+    indexes       = [ event_manager.register(events.append, { "type": "type_%d" % n }) for n in range(1000) ]
+    event_manager.register(events.append, { "type": [ "type_1", "type_2" ], "value": lambda x: x > 1 })
+    event_manager.register(events.append, { "value": lambda x: x > 2 })
+
+    assert len(event_manager.rules_value_index) == 1001
+    assert event_manager._match_rules_index({ "type": "type_1", "value": 2 }) == [ 1, 1000, 1001 ]  # candidates, not all 1002 rules
+    assert len(event_manager.trigger({ "type": "type_1", "value": 2 })) == 2
+    assert len(event_manager.trigger({ "type": "type_5", "value": 3 })) == 2
+    assert len(event_manager.trigger({ "value": 3 })) == 1
+
+    event_manager.unregister_index(indexes[5])
+    assert len(event_manager.trigger({ "type": "type_5", "value": 3 })) == 1
+
+
+def test_ValueIndex_nested_paths():
+    index = ValueIndex()
+    assert index.add(0, { "header.protocol": [ "tcp", "udp" ] })   == ("header.protocol",)
+    assert index.add(1, { "header": { "protocol": "icmp" } })      == ("header", "protocol")
+    assert index.add(2, { "header": { "flags": { "syn": True } } }) == ("header", "flags", "syn")
+    assert index.lookup({ "header": { "protocol": "udp" } })  == { 0 }
+    assert index.lookup({ "header": { "protocol": "icmp", "flags": { "syn": True } } }) == { 1, 2 }
+    assert index.lookup({ "header": "udp" }) == set()
+    assert index.lookup({ "protocol": "udp" }) == set()
+
+
+def test_EventManager_nested_paths():
+    event_manager = EventManager()
+    events        = []
+    dotted = event_manager.register(events.append, { "header.protocol": "tcp", "header.port": lambda x: x < 1024 })
+    nested = event_manager.register(events.append, { "header": { "port": lambda x: x >= 1024 } })
+    other  = event_manager.register(events.append, { "payload": lambda x: len(x) > 2 })
+
+    assert event_manager.rules_index_paths == { ("header", "port") }
+    assert event_manager._match_rules_index({ "header": { "protocol": "tcp", "port": 80 } })    == [ dotted, nested ]
+    assert event_manager._match_rules_index({ "header": { "protocol": "udp" }, "payload": "" }) == [ other ]  # pruned by path
+    assert event_manager._match_rules_index({ "header": { "port": 8080 }, "payload": "" })      == [ nested, other ]
+
+    assert len(event_manager.trigger({ "header": { "protocol": "tcp", "port": 80 } }))   == 1
+    assert len(event_manager.trigger({ "header": { "protocol": "tcp", "port": 8080 } })) == 1
+    assert len(event_manager.trigger({ "header": "tcp", "payload": "data" }))          == 1
+    assert [ event.get("payload") for event in events ] == [ None, None, "data" ]
+
+    event_manager.unregister_index(nested)
+    assert event_manager.trigger({ "header": { "port": 8080 } }) == []
+
+
+def test_EventManager_unregister_first_rule():
+    event_manager = EventManager()
+    index         = event_manager.register(lambda event: event, { "type": "command" })
+    assert index == 0
+    event_manager.unregister_index(index)
+    assert event_manager.rules == {}
+    assert event_manager.trigger({ "type": "command" }) == []
+
+
+def test_EventManager_cache_incremental():
+    event_manager = EventManager()
+    events        = []
+    event_manager.register(events.append, { "action": lambda x: x.startswith("test") })
+    event_manager.trigger({ "action": "test", "id": 1 })
+    event_manager.trigger({ "action": "test", "id": 2 })
+    event_manager.trigger({ "value": 1 })
+    assert event_manager.cache_info() == { "hits": 1, "misses": 2, "size": 2, "maxsize": 1024, "tombstones": 0 }
+
+    # new rules are matched from rules_index_recent, rather than resetting the cache
+    event_manager.register(events.append, { "id": lambda x: x > 2 })
+    event_manager.register(events.append, { "other": lambda x: True })
+    assert len(event_manager.trigger({ "action": "test", "id": 3 })) == 2
+    assert event_manager._match_rules_index({ "value": 2 }) == []
+    assert event_manager.cache_info()["hits"] == 3
+
+    # once merged, recent rules are appended to only the cached key-sets they could match
+    for n in range(100):
+        event_manager.register(events.append, { "id": lambda x: True })
+    assert len(event_manager.rules_index_recent) < 64
+    assert event_manager.rules_index_cache[frozenset([ "action", "id" ])][0][:3] == [ 0, 1, 3 ]
+    assert event_manager.rules_index_cache[frozenset([ "value" ])][0] == []
+    assert event_manager._match_rules_index({ "action": "test", "id": 1 }) == [ 0, 1 ] + range(3, 103)
+    assert event_manager.cache_info()["misses"] == 2
+
+    # a new nested path changes how event key-sets are computed
+    event_manager.register(events.append, { "name.id": lambda x: x > 0 })
+    assert event_manager.cache_info()["size"] == 0
+
+
+def test_EventManager_cache_lru():
+    event_manager = EventManager(cache_size=2)
+    event_manager.register(lambda event: event, { "a": lambda x: True })
+    for event in [ { "a": 1 }, { "b": 1 }, { "a": 1 }, { "c": 1 } ]:
+        event_manager.trigger(event)
+    assert set(event_manager.rules_index_cache.keys()) == { frozenset("a"), frozenset("c") }  # { "b" } was least recently used
+    assert event_manager.cache_info()["hits"] == 1
+
+
+def test_EventManager_cache_churn():
+    event_manager = EventManager()
+    events        = []
+    event_manager.register(events.append, { "type": lambda x: x == "response" })
+    for n in range(1000):
+        event_manager.register_once(events.append, { "id": lambda x: True })
+        event_manager.trigger({ "type": "command", "id": n })
+        event_manager.trigger({ "type": "response" })
+
+    assert len(events) == 2000
+    assert sorted(event_manager.rules.keys()) == [ 0 ]
+    assert event_manager.cache_info()["misses"] == 2  # the cache stays warm during rule churn
+    assert event_manager.rules_index_recent == {}
+    assert event_manager.rules_index_cache[frozenset([ "type" ])][0] == [ 0 ]  # long lived rules are merged
+
+
+def test_EventManager_cache_compaction():
+    event_manager = EventManager()
+    indexes       = [ event_manager.register(lambda event: event, { "id": lambda x: True }) for n in range(200) ]
+    assert event_manager._match_rules_index({ "id": 1 }) == range(200)
+    for index in indexes[:150]:
+        event_manager.unregister_index(index)
+
+    assert event_manager.trigger({ "id": 1 }) == [ { "id": 1 } ] * 50
+    assert event_manager.cache_info()["tombstones"] <= 64
+    assert len(event_manager.rules_index_cache[frozenset([ "id" ])][0]) <= 50 + 64  # unregistered indices are compacted
+
+
+
+def create_trigger_many_event_manager( calls ):
+    event_manager = EventManager()
+    event_manager.register(lambda event: calls.append(("type", event["id"])), { "type": [ "command", "response" ] })
+    event_manager.register(lambda event: calls.append(("action", event["id"])), { "action": lambda x: x.startswith("test") })
+    event_manager.register(lambda event: calls.append(("name", event["id"])), { "name.type": lambda x: x == "command" })
+    event_manager.register(lambda events: calls.append(("batch", [ event["id"] for event in events ])), {}, { "batch": True })
+    return event_manager
+
+
+def test_EventManager_trigger_many():
+    events = [
+        { "id": 0, "type": "command", "action": "testCommand" },
+        { "id": 1, "type": "other" },
+        { "id": 2, "name": { "type": "command" } },
+        { "id": 3, "type": "response", "action": "other" },
+        { "id": 4, "action": "testResponse", "name": { "type": "response" } },
+    ]
+    expected = []
+    event_manager = create_trigger_many_event_manager(expected)
+    for event in events: event_manager.trigger(event)
+
+    calls = []
+    event_manager = create_trigger_many_event_manager(calls)
+    results = event_manager.trigger_many(events)
+    assert calls == [ ("type", 0), ("type", 3), ("action", 0), ("action", 4), ("name", 2), ("batch", [ 0, 1, 2, 3, 4 ]) ]
+    assert sorted( call for call in calls if call[0] != "batch" ) == sorted( call for call in expected if call[0] != "batch" )
+    assert len(results) == 6
+
+    assert event_manager.trigger_many(events[0]) == [ None, None, None ]  # a single event is passed to trigger()
+    assert calls[-1] == ("batch", [ 0 ])
+
+
+def test_EventManager_trigger_many_once():
+    event_manager = EventManager()
+    calls         = []
+    event_manager.register_once(calls.append, { "type": "command" })
+    event_manager.trigger_many([ { "type": "command", "id": n } for n in range(3) ])
+    assert [ event["id"] for event in calls ] == [ 0 ]
+
+
+def test_EventManager_trigger_many_chunk():
+    chunk = numpy.rec.fromrecords([ (n, 700.0 + n * 100, "kitchen" if n % 2 else "lounge") for n in range(10) ], names="id,CO2,sensor")
+    event_manager = EventManager()
+    rows   = []
+    chunks = []
+    event_manager.register(lambda row: rows.append(row.id), { "sensor": "kitchen", "CO2": lambda x: x > 1000 })
+    event_manager.register(lambda rows: chunks.append(rows), { "CO2": lambda x: x > 1200 }, { "batch": True })
+    event_manager.register(lambda row: rows.append(-1), { "sensor": "bedroom" })
+    event_manager.register(lambda row: rows.append(-1), { "name.type": "command" })
+
+    event_manager.trigger_many(chunk)
+    assert rows == [ 5, 7, 9 ]
+    assert len(chunks) == 1 and isinstance(chunks[0], numpy.recarray)
+    assert chunks[0]['id'].tolist() == [ 6, 7, 8, 9 ]
@@ -0,0 +1,138 @@
+from UserDict import UserDict
+from UserList import UserList
+from operator import itemgetter
+
+import numpy
+from typing import Any, Dict, List, Set, Tuple, Union
+
+from .Condition import Condition, flatten_rules, get_path
+
+
+
+class ValueIndex(object):
+    """
+    Inverted index of conditions by (path, value), for equality and OR-list rules
+
+    Each condition is indexed under a single path with an equality or OR-list rule of hashable values,
+    so lookup(event) costs one hash lookup per indexed path, regardless of the number of conditions.
+    Nested rules are indexed by their full path, eg: { "name": { "type": ... } } -> ("name", "type"),
+    dotted keys as a path of one, eg: ("name.type",), looked up as a literal key first, see: Condition.get_value()
+    Where a condition has several indexable paths, the path whose values currently have the fewest conditions is chosen,
+    so a value shared by most conditions (eg: { "source": "sensor" }) does not become a single large bucket.
+    Candidates returned by lookup() still need a full match, unless the indexed rule is the whole condition.
+    Lookups follow Condition.matches(): falsy event values never match, and list event values match if any element matches
+
+    ### Usage:
+    index = ValueIndex()
+    index.add(0, Condition({ "name.type": [ "command", "response" ], "action": "test" }))  # ("action",)
+    index.add(1, Condition({ "action": lambda x: x.startswith("test") }))               # None: not indexable
+    index.add(2, Condition({ "name": { "type": "command" } }))                          # ("name", "type")
+    index.lookup({ "name": { "type": "command" } })     # set([ 2 ])
+    """
+
+    def __init__( self ):
+        self.index = {}  # type: Dict[tuple, Dict[Any, Set[int]]]       # path -> value -> ids
+        self.paths = {}  # type: Dict[int, Tuple[tuple, List[Any]]]     # id -> (indexed path, values)
+
+
+    def __len__( self ):
+        return len(self.paths)
+
+
+    def __contains__( self, id ):  # type: (int) -> bool
+        return id in self.paths
+
+
+    def add( self, id, condition ):  # type: (int, Union[Condition, Dict]) -> Union[tuple, None]
+        """indexes condition under id, returns the indexed path, or None if the condition has no indexable rule"""
+        rules = indexable_rules(condition)
+        if not rules: return None
+        path, rule = min(rules, key=lambda path_rule: self.count(*path_rule))  # most selective path, ties in sorted order
+
+        values = self.index.setdefault(path, {})
+        for value in rule_values(rule):
+            values.setdefault(value, set()).add(id)
+        self.paths[id] = ( path, rule_values(rule) )
+        return path
+
+
+    def remove( self, id, condition=None ):  # type: (int, Union[Condition, Dict, None]) -> None
+        if id not in self.paths: return
+        path, rule = self.paths.pop(id)
+
+        values = self.index[path]
+        for value in rule:
+            values[value].discard(id)
+            if not values[value]: del values[value]
+        if not values: del self.index[path]
+
+
+    def count( self, path, rule ):  # type: (tuple, Any) -> int
+        """number of conditions currently indexed under path for the values of rule"""
+        values = self.index.get(path, {})
+        return sum( len(values.get(value, ())) for value in rule_values(rule) )
+
+
+    def lookup( self, event ):  # type: (Any) -> Set[int]
+        """returns ids of conditions which may match event"""
+        output = set()
+        for path, values in self.index.iteritems():
+            for value in event_values(event, path):
+                ids = values.get(value)
+                if ids: output |= ids
+        return output
+
+
+    def lookup_columns( self, chunk ):  # type: (numpy.recarray) -> Dict[int, numpy.ndarray]
+        """
+        returns { id: positions of rows in a numpy.recarray chunk which the condition may match },
+        rows are grouped by distinct column value with a single sort per indexed column, then looked up once per distinct value
+        """
+        output = {}  # type: Dict[int, List[numpy.ndarray]]
+        names  = chunk.dtype.names
+        for path, values in self.index.iteritems():
+            if len(path) != 1 or path[0] not in names: continue
+            distinct, inverse = numpy.unique(chunk[path[0]], return_inverse=True)
+            order = numpy.argsort(inverse, kind='mergesort')  # stable, so positions remain in row order
+            ends  = numpy.cumsum(numpy.bincount(inverse))
+            for n, value in enumerate(distinct.tolist()):
+                ids = values.get(value)
+                if not ids or not value: continue
+                positions = order[ ends[n-1] if n else 0 : ends[n] ]
+                for id in ids:
+                    output.setdefault(id, []).append(positions)
+        return { id: positions[0] if len(positions) == 1 else numpy.sort(numpy.concatenate(positions))
+                 for id, positions in output.iteritems() }
+
+
+
+def indexable_rules( condition ):  # type: (Union[Condition, Dict]) -> List[Tuple[tuple, Any]]
+    """returns [ (path, rule) ] for leaf rules of equality or OR-lists of hashable values, in sorted order"""
+    rules = []
+    for path, rule in sorted(flatten_rules(condition), key=itemgetter(0)):
+        values = rule_values(rule)
+        if values and all( is_indexable(value) for value in values ):
+            rules.append( (path, rule) )
+    return rules
+
+
+def rule_values( rule ):  # type: (Any) -> List[Any]
+    return list(rule) if isinstance(rule, (list, UserList)) else [ rule ]
+
+
+def is_indexable( value ):  # type: (Any) -> bool
+    if callable(value) or isinstance(value, (dict, list, UserDict, UserList)): return False
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def event_values( event, path ):  # type: (Any, tuple) -> List[Any]
+    """values of event at path to look up in the index"""
+    value = get_path(event, path)
+    if not value:                            return ()
+    if isinstance(value, (list, UserList)):  return [ element for element in value if is_indexable(element) ]
+    if is_indexable(value):                  return ( value, )
+    return ()
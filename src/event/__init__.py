@@ -1,2 +1,3 @@
 from .Condition import Condition
 from .EventManager import EventManager
+from .ValueIndex import ValueIndex
@@ -3,6 +3,7 @@ from Queue import Empty
 from glob2 import glob
 
 from src.readers.CSVReader import CSVReader
+from src.util.Batch import Batch, Tracked
 from src.util.MultiProcessing import MultiProcessing
 
 
@@ -18,7 +19,7 @@ def main():
 
     def start_reader(filename):
         print "START - start_reader(", queue, ")"
-        CSVReader(filename, queue=queue, wrapper=dict, start=True)
+        CSVReader(filename, queue=queue, wrapper=dict, start=True, batch_size=1000)
         print "END   - start_reader(", queue, ")"
     pool.amap(start_reader, filenames)
 
@@ -31,12 +32,14 @@ def main():
 
         while queue_count > 0:
             item = queue.get()
-            if item == Empty:
+            if item is Empty:
                 queue_count -= 1
             else:
-                item_count += 1
-                if item_count % 1000 == 0:
-                    print queue.qsize(), item
+                for row in Batch.unpack(item):  # readers emit Batch() envelopes when batch_size > 1
+                    item_count += 1
+                    if item_count % 1000 == 0:
+                        print queue.qsize(), row
+                Tracked.ack(item)  # readers with checkpoint_ack=True skip acknowledged rows after a restart
 
         print "END - print_queue(", queue, queue.qsize(), ")"
     # print_queue(queue)
@@ -0,0 +1,398 @@
+import importlib
+import multiprocessing
+import pkgutil
+import threading
+import Queue as queue_module
+from Queue import Empty
+
+import simplejson
+from glob2 import glob
+from typing import Any, Callable, Dict, List, Union
+
+from src.event.EventManager import EventManager
+from src.queue.Serializer import serialized_queue
+from src.util.Batch import Batch, BatchWriter, Tracked
+from src.util.MultiProcessing import MultiProcessing
+
+
+
+class Stage(object):
+    """
+    Node in a Pipeline() graph: a source, multiplexer, transform, sink or events stage
+
+    Each stage has a single input queue (multiplexers have one input queue per upstream producer),
+    and is executed by `parallelism` workers on threads or processes.
+    Every worker puts a single Queue.Empty when finished, so downstream stages count one Queue.Empty per upstream worker
+    """
+
+    kinds = ("source", "multiplexer", "transform", "sink", "events")
+
+    def __init__( self, name, kind, target=None, inputs=(), **options ):
+        # type: (str, str, Union[Callable, type, str, None], List[str], **Any) -> None
+        assert kind in self.kinds, 'Stage(kind) must be one of: %s' % (self.kinds,)
+
+        self.name    = name
+        self.kind    = kind
+        self.target  = resolve(target) if isinstance(target, basestring) else target
+        self.inputs  = [ inputs ] if isinstance(inputs, basestring) else list(inputs)
+        self.options = options
+        self.files   = []         # type: List[str]    # source filenames, one worker per file
+        self.input_queues = []    # type: List[Any]    # one shared queue, or one per upstream worker for multiplexers
+        self.outputs      = []    # type: List[Any]    # per worker: list of downstream queues
+        self.workers      = []    # type: List[Union[threading.Thread, multiprocessing.Process]]
+
+        if self.kind == "source":
+            patterns   = [ options['files'] ] if isinstance(options['files'], basestring) else options['files']
+            self.files = sorted( filename for pattern in patterns for filename in glob(pattern) )
+            assert self.files, 'Stage(%s) files matched no filenames: %s' % (name, patterns)
+        else:
+            assert self.inputs, 'Stage(%s) requires inputs=' % name
+        if self.kind != "events":
+            assert self.target is not None, 'Stage(%s) requires a reader, multiplexer or function' % name
+
+
+    @property
+    def parallelism( self ):  # type: () -> int
+        if self.kind == "source":      return len(self.files)
+        if self.kind == "multiplexer": return 1
+        return max(1, int(self.options['parallelism']))
+
+
+
+class Pipeline(object):
+    """
+    Declarative pipeline graph of sources, multiplexers, transform stages and sinks, wired together with queues
+
+    Each stage declares its inputs by name, plus per-stage options (with pipeline-wide defaults):
+        parallelism: number of workers reading from the stage input queue (sources use one worker per file)
+        executor:    "thread" or "process"
+        queue:       "multiprocessing" (default), "manager", "thread" (Queue.Queue, threads only) or a queue_factory(maxsize=)
+        batch_size:  rows per queue.put() written by the stage, batch_size > 1 emits Batch() envelopes
+        serializer:  encoding of items on the stage input queue, eg: "marshal", see: SerializedQueue
+
+    Transform functions are called once per row, returning None to drop the row.
+    Sinks are called once per row, events stages trigger an EventManager() with the declared rules.
+    Functions and classes can be passed directly, or by name as "module.path:attribute",
+    with short names resolved from src.readers, src.queue and src.util, eg: "CSVReader"
+
+    ### Usage:
+    pipeline = Pipeline(batch_size=1000)
+    pipeline.source("occupancy", "CSVReader", files="./data/occupancy_data/*.txt", options={ "timestamp": "date" })
+    pipeline.multiplexer("merge", "SortedQueueMultiplexer", inputs="occupancy", options={ "sort_key": "timestamp" })
+    pipeline.transform("co2", "mymodule:high_co2", inputs="merge", parallelism=4, executor="process")
+    pipeline.sink("print", "mymodule:print_row", inputs="co2")
+    output = pipeline.output("co2")             # queue receiving a copy of the stage output, terminated by Queue.Empty
+    pipeline.run().join()
+
+    Pipeline.from_config("pipeline.json").run().join()     # or: python -m src.pipeline pipeline.json
+    """
+
+    defaults = {
+        "parallelism": 1,                   # type: int
+        "executor":    "thread",            # type: str    # "thread" or "process"
+        "queue":       "multiprocessing",   # type: Union[str, Callable]
+        "maxsize":     0,                   # type: int    # input queue maxsize, 0 = unbounded
+        "batch_size":  1,                   # type: int
+        "batch_timeout": None,              # type: float
+        "serializer":  None,                # type: Union[str, List]  # input queues are SerializedQueue(), see: src.queue.Serializer
+        }
+    executors = ("thread", "process")
+
+
+    def __init__( self, *args, **kwargs ):
+        self.options     = reduce(lambda a, b: dict(a, **b), [self.defaults] + list(args) + [kwargs])
+        self.stages      = {}   # type: Dict[str, Stage]
+        self.order       = []   # type: List[str]
+        self._outputs    = {}   # type: Dict[str, List[Any]]
+        self._multiplexers = [] # type: List[Any]
+        self.is_running  = False
+
+
+    @classmethod
+    def from_config( cls, config ):  # type: (Union[str, Dict]) -> Pipeline
+        """
+        constructs a Pipeline from a dict or JSON config file:
+        { "defaults": { ... }, "stages": [ { "type": "source", "name": "occupancy", "reader": "CSVReader", ... } ], "outputs": [] }
+        """
+        if isinstance(config, basestring):
+            with open(config) as file:
+                config = simplejson.load(file)
+
+        pipeline = cls(config.get('defaults', {}))
+        for stage in config['stages']:
+            stage = dict(stage)
+            kind  = stage.pop('type')
+            assert kind in Stage.kinds, 'Pipeline.from_config() stage type must be one of: %s' % (Stage.kinds,)
+            getattr(pipeline, kind)(**stage)  # keys match the arguments of .source(), .multiplexer(), .transform() etc
+        for name in config.get('outputs', []):
+            pipeline.output(name)
+        return pipeline
+
+
+    ### Graph Declaration
+
+    def add( self, name, kind, target=None, inputs=(), **options ):
+        # type: (str, str, Union[Callable, type, str, None], List[str], **Any) -> Pipeline
+        assert name not in self.stages, 'Pipeline.add(%s) duplicate stage name' % name
+        assert not self.is_running,     'Pipeline.add(%s) stages must be added before run()' % name
+
+        options = dict(self.options, **options)
+        assert options['executor'] in self.executors, 'Pipeline.add(%s) executor must be one of: %s' % (name, self.executors)
+        assert not (options['executor'] == "process" and options['queue'] == "thread"), \
+            'Pipeline.add(%s) queue="thread" cannot be shared with executor="process"' % name
+
+        self.stages[name] = Stage(name, kind, target, inputs, **options)
+        self.order.append(name)
+        return self
+
+
+    def source( self, name, reader, files, options=None, **kwargs ):  # type: (str, Union[type, str], Union[str, List[str]], Dict, **Any) -> Pipeline
+        """reader class, eg: CSVReader, is constructed once per file as reader(filename, queue=, **options)"""
+        return self.add(name, "source", reader, files=files, reader_options=options or {}, **kwargs)
+
+    def multiplexer( self, name, multiplexer, inputs, options=None, **kwargs ):  # type: (str, Union[type, str], List[str], Dict, **Any) -> Pipeline
+        """multiplexer class, eg: SortedQueueMultiplexer, receives one input queue per upstream worker"""
+        return self.add(name, "multiplexer", multiplexer, inputs, multiplexer_options=options or {}, **kwargs)
+
+    def transform( self, name, function, inputs, **kwargs ):  # type: (str, Union[Callable, str], List[str], **Any) -> Pipeline
+        """function(row) returns the output row, or None to drop the row"""
+        return self.add(name, "transform", function, inputs, **kwargs)
+
+    def sink( self, name, function, inputs, **kwargs ):  # type: (str, Union[Callable, str], List[str], **Any) -> Pipeline
+        """function(row) is called for each row"""
+        return self.add(name, "sink", function, inputs, **kwargs)
+
+    def events( self, name, rules, inputs, **kwargs ):  # type: (str, List[Dict], List[str], **Any) -> Pipeline
+        """rules: [ { "callback": Callable or "module:function", "condition": { ... }, "options": { ... } } ]"""
+        return self.add(name, "events", None, inputs, rules=rules, **kwargs)
+
+
+    def output( self, name ):  # type: (str) -> Any
+        """returns a queue receiving a copy of the output of stage name, terminated by a single Queue.Empty"""
+        assert name in self.stages,   'Pipeline.output(%s) unknown stage' % name
+        assert not self.is_running,   'Pipeline.output(%s) must be called before run()' % name
+        queue = self._construct_queue(self.stages[name].options)
+        self._outputs.setdefault(name, []).append(queue)
+        return queue
+
+
+    ### Wiring
+
+    def _construct_queue( self, options ):  # type: (Dict) -> Any
+        factory = options['queue']
+        if   factory == "multiprocessing": queue = multiprocessing.Queue(maxsize=options['maxsize'])
+        elif factory == "manager":         queue = MultiProcessing().Manager().Queue(maxsize=options['maxsize'])
+        elif factory == "thread":          queue = queue_module.Queue(maxsize=options['maxsize'])
+        else:
+            assert callable(factory), 'Pipeline(queue) must be "multiprocessing", "manager", "thread" or queue_factory(maxsize=)'
+            queue = factory(maxsize=options['maxsize'])
+        return serialized_queue(queue, options['serializer'])
+
+
+    def _sorted_stages( self ):  # type: () -> List[Stage]
+        """returns stages in topological order, raising ValueError on unknown inputs or cycles"""
+        output  = []
+        visited = {}  # name -> True when complete, False while visiting
+        def visit( name, path ):
+            if name not in self.stages:
+                raise ValueError('Pipeline stage %s has unknown input: %s' % (path[-1], name))
+            if visited.get(name) is False:
+                raise ValueError('Pipeline contains a cycle: %s' % ' -> '.join(path + [ name ]))
+            if name in visited: return
+            visited[name] = False
+            for input in self.stages[name].inputs: visit(input, path + [ name ])
+            visited[name] = True
+            output.append(self.stages[name])
+        for name in self.order: visit(name, [])
+        return output
+
+
+    def _wire( self, stages ):  # type: (List[Stage]) -> None
+        """creates input queues for each stage, and the list of downstream queues written by each upstream worker"""
+        for stage in stages:
+            stage.outputs = [ [] for n in range(stage.parallelism) ]
+            for queue in self._outputs.get(stage.name, []):
+                multiplexer = self._relay(stage, queue)
+                for outputs in stage.outputs: outputs.append( multiplexer.input_queue() )
+
+        for stage in stages:
+            if stage.kind == "multiplexer":
+                for input in stage.inputs:
+                    for outputs in self.stages[input].outputs:
+                        queue = self._construct_queue(stage.options)
+                        stage.input_queues.append(queue)
+                        outputs.append(queue)
+            elif stage.kind != "source":
+                if stage.options['queue'] == "thread" and any( self.stages[input].options['executor'] == "process" for input in stage.inputs ):
+                    raise ValueError('Pipeline stage %s queue="thread" cannot be written by executor="process" inputs' % stage.name)
+                queue = self._construct_queue(stage.options)
+                stage.input_queues = [ queue ]
+                for input in stage.inputs:
+                    for outputs in self.stages[input].outputs: outputs.append(queue)
+
+
+    def _relay( self, stage, queue ):  # type: (Stage, Any) -> Any
+        """Pipeline.output() queues are fed by a QueueMultiplexer, which merges the stage workers into a single Queue.Empty"""
+        from src.queue.QueueMultiplexer import QueueMultiplexer
+        multiplexer = QueueMultiplexer(queue_factory=lambda maxsize=0: self._construct_queue(stage.options))
+        multiplexer.output_queue(queue)
+        self._multiplexers.append(multiplexer)
+        return multiplexer
+
+
+    ### Execution
+
+    def run( self ):  # type: () -> Pipeline
+        """wires queues and starts all stage workers, returns self for chaining .join()"""
+        assert not self.is_running, 'Pipeline.run() can only be called once'
+        self.is_running = True
+
+        stages = self._sorted_stages()
+        self._wire(stages)
+        for multiplexer in self._multiplexers:
+            self._start("thread", multiplexer._run_thread, ())
+
+        for stage in reversed(stages):  # start consumers before producers
+            if stage.kind == "source":
+                if stage.options['reader_options'].get('checkpoint'):
+                    stage.options['reader_options'] = dict({ "checkpoint_ack": self._acknowledges(stage) }, **stage.options['reader_options'])
+                for filename, outputs in zip(stage.files, stage.outputs):
+                    stage.workers.append( self._start(stage.options['executor'], run_source, (stage, filename, outputs)) )
+            elif stage.kind == "multiplexer":
+                stage.workers.append( self._start(stage.options['executor'], run_multiplexer, (stage, stage.outputs[0])) )
+            else:
+                producers = sum( self.stages[input].parallelism for input in stage.inputs )
+                finished  = multiprocessing.Value('i', 0)
+                for outputs in stage.outputs:
+                    stage.workers.append( self._start(stage.options['executor'], run_worker, (stage, outputs, producers, finished)) )
+        return self
+
+
+    def _acknowledges( self, stage ):  # type: (Stage) -> bool
+        """
+        checkpointed sources emit Tracked() envelopes when every consumer is a worker stage, which acknowledges processed items,
+        so a restarted pipeline re-reads rows that were still queued, and skips rows that were processed
+        """
+        consumers = [ other for other in self.stages.values() if stage.name in other.inputs ]
+        return bool(consumers) \
+           and all( other.kind in ("transform", "sink", "events") for other in consumers ) \
+           and all( options['serializer'] in (None, "pickle") for options in [ stage.options ] + [ other.options for other in consumers ] )
+
+
+    @staticmethod
+    def _start( executor, target, args ):  # type: (str, Callable, tuple) -> Union[threading.Thread, multiprocessing.Process]
+        worker = (threading.Thread if executor == "thread" else multiprocessing.Process)(target=target, args=args)
+        worker.daemon = True
+        worker.start()
+        return worker
+
+
+    def join( self, timeout=None ):  # type: (Union[float, None]) -> Pipeline
+        """waits for all stage workers to finish"""
+        for name in self.order:
+            for worker in self.stages[name].workers:
+                worker.join(timeout)
+        return self
+
+
+
+### Stage Workers, executed on threads or processes
+
+def run_source( stage, filename, outputs ):  # type: (Stage, str, List[Any]) -> None
+    options = dict(stage.options['reader_options'])
+    options.setdefault('batch_size',    stage.options['batch_size'])
+    options.setdefault('batch_timeout', stage.options['batch_timeout'])
+    if isinstance(options.get('wrapper'), basestring):
+        options['wrapper'] = resolve(options['wrapper'])
+    stage.target(filename, queue=FanOut(outputs), start=True, **options)  # readers put Queue.Empty when finished
+
+
+def run_multiplexer( stage, outputs ):  # type: (Stage, List[Any]) -> None
+    multiplexer = stage.target(stage.options['multiplexer_options'])
+    for queue in stage.input_queues: multiplexer.input_queue(queue)
+    for queue in outputs:            multiplexer.output_queue(queue)
+    multiplexer._run_thread()
+
+
+def run_worker( stage, outputs, producers, finished ):  # type: (Stage, List[Any], int, Any) -> None
+    """
+    Workers of a stage compete for items on a shared input queue.
+    The worker reading the last upstream Queue.Empty puts an extra Queue.Empty for each of its sibling workers
+
+    Tracked() items from checkpointed sources are acknowledged once processed,
+    for transform stages once their output rows have been put onto the downstream queues
+    """
+    queue    = stage.input_queues[0]
+    function = stage.target if stage.kind != "events" else create_event_manager(stage.options['rules']).trigger_many
+    writer   = BatchWriter(FanOut(outputs), stage.options['batch_size'], stage.options['batch_timeout']) \
+               if stage.kind == "transform" else None
+    tracked  = []  # Tracked() items whose output rows may still be buffered in writer
+
+    while True:
+        item = queue.get()
+        if item is Empty:
+            with finished.get_lock():
+                finished.value += 1
+                count = finished.value
+            if count == producers:
+                for n in range(stage.parallelism - 1): queue.put(Empty)
+            if count >= producers: break
+            continue
+
+        if stage.kind == "events":
+            function(Tracked.unwrap(item))  # EventManager.trigger_many() matches a whole Batch() envelope at once
+        else:
+            for row in Batch.unpack(item):
+                output = function(row)
+                if writer is not None and output is not None:
+                    writer.put(output)
+
+        if isinstance(item, Tracked): tracked.append(item)
+        if tracked and (writer is None or not len(writer)):
+            for item in tracked: Tracked.ack(item)
+            tracked = []
+
+    if writer is not None:
+        writer.flush()
+    for item in tracked: Tracked.ack(item)
+    for output in outputs:
+        output.put(Empty)
+
+
+def create_event_manager( rules ):  # type: (List[Dict]) -> EventManager
+    event_manager = EventManager()
+    for rule in rules:
+        callback = rule['callback']
+        event_manager.register(resolve(callback) if isinstance(callback, basestring) else callback,
+                               rule.get('condition', {}), rule.get('options'))
+    return event_manager
+
+
+
+class FanOut(object):
+    """Queue-like wrapper, copying each put() to a list of downstream queues"""
+
+    def __init__( self, queues ):  # type: (List[Any]) -> None
+        self.queues = queues
+
+    def put( self, item, block=True, timeout=None ):  # type: (Any, bool, Union[float, None]) -> None
+        for queue in self.queues:
+            queue.put(item, block, timeout)
+
+
+
+def resolve( name ):  # type: (str) -> Any
+    """resolves "module.path:attribute", or a short name from src.readers, src.queue or src.util, eg: "CSVReader" """
+    if ':' in name:
+        module, attribute = name.split(':', 1)
+        return reduce(getattr, attribute.split('.'), importlib.import_module(module))
+
+    for package in ("src.readers", "src.queue", "src.util"):
+        try:
+            module = importlib.import_module(package + '.' + name)  # modules are named after their class
+            return getattr(module, name)
+        except ImportError:
+            if pkgutil.find_loader(package + '.' + name): raise  # the module exists, but one of its own imports failed
+            module = importlib.import_module(package)
+            if hasattr(module, name): return getattr(module, name)
+    raise ValueError('Pipeline cannot resolve: %s' % name)
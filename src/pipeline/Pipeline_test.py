@@ -0,0 +1,124 @@
+import os
+from multiprocessing import Process
+from Queue import Empty, Queue
+
+import pytest
+
+from src.readers.CSVReader import CSVReader
+from src.util.Batch import Batch
+from . import Pipeline
+from .Pipeline import resolve
+
+datadir  = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/' )
+datafile = os.path.join( datadir, 'datatest.txt' )
+occupied = []
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get(timeout=30)
+        if item is Empty: break
+        items.extend( Batch.unpack(item) )
+    return items
+
+
+def high_co2( row ):
+    return row if float(row['CO2']) > 1000 else None
+
+
+def test_Pipeline_transform():
+    pipeline = Pipeline(batch_size=100)
+    pipeline.source("occupancy", "CSVReader", files=datafile, options={ "columns": [ "index", "CO2" ] })
+    pipeline.transform("co2", high_co2, inputs="occupancy", parallelism=3, executor="process")
+    output = pipeline.output("co2")
+    pipeline.run()
+
+    rows = read_queue(output)
+    pipeline.join()
+    assert len(rows) == 595
+    assert all( float(row['CO2']) > 1000 for row in rows )
+    assert len(set( row['index'] for row in rows )) == len(rows)  # each row is processed by exactly one worker
+
+
+def test_Pipeline_from_config():
+    pipeline = Pipeline.from_config({
+        "defaults": { "batch_size": 1000 },
+        "stages": [
+            { "type": "source",      "name": "occupancy", "reader": "CSVReader", "files": datadir + "datatest*.txt",
+              "options": { "timestamp": "date", "wrapper": "Record" } },
+            { "type": "multiplexer", "name": "merge", "multiplexer": "SortedQueueMultiplexer", "inputs": "occupancy",
+              "options": { "sort_key": "timestamp" } },
+            { "type": "events",      "name": "occupied", "inputs": "merge",
+              "rules": [ { "callback": "src.pipeline.Pipeline_test:occupied.append", "condition": { "Occupancy": "1" } } ] },
+            ],
+        })
+    output = pipeline.output("merge")
+    pipeline.run()
+
+    rows = read_queue(output)
+    pipeline.join()
+    timestamps = [ row.timestamp for row in rows ]
+    assert len(rows) == 12417
+    assert timestamps == sorted(timestamps)
+    assert len(occupied) == sum( row.Occupancy == "1" for row in rows )
+
+
+def run_checkpointed( tmpdir, crash_at=None ):
+    """runs two checkpointed sources into a sink, which kills the process before writing its crash_at'th row"""
+    filename = str(tmpdir.join('output.txt'))
+    written  = []
+
+    def sink( row ):
+        if len(written) == crash_at: os._exit(1)
+        with open(filename, 'a') as output:
+            output.write("%s,%s\n" % (row['date'], row['index']))
+        written.append(row)
+
+    pipeline = Pipeline(batch_size=100)
+    pipeline.source("occupancy", "CSVReader", files=[ datafile, os.path.join(datadir, 'datatraining.txt') ],
+                    options={ "checkpoint": str(tmpdir), "checkpoint_interval": 0 })
+    pipeline.sink("output", sink, inputs="occupancy")
+    process = Process(target=lambda: pipeline.run().join())
+    process.start()
+    process.join(60)
+    return process.exitcode
+
+
+def test_Pipeline_checkpoint( tmpdir ):
+    rows = [ "%s,%s" % (row['date'], row['index'])
+             for filename in [ datafile, os.path.join(datadir, 'datatraining.txt') ]
+             for row in read_queue( CSVReader(filename, queue=Queue(), start=True).queue ) ]
+
+    assert run_checkpointed(tmpdir, crash_at=500) == 1
+    assert len(tmpdir.join('output.txt').readlines()) == 500
+    assert run_checkpointed(tmpdir) == 0
+    output = tmpdir.join('output.txt').read().splitlines()
+    assert sorted(output) == sorted(rows)                          # no duplicated or lost rows across the crash
+
+    assert run_checkpointed(tmpdir) == 0
+    assert len(tmpdir.join('output.txt').readlines()) == len(rows)  # a completed pipeline resumes as a no-op
+
+
+def test_Pipeline_resolve( tmpdir, monkeypatch ):
+    import src.readers
+    assert resolve("CSVReader") is CSVReader
+    assert resolve("src.readers.CSVReader:CSVReader") is CSVReader
+    with pytest.raises(ValueError):
+        resolve("MissingReader")
+
+    # an ImportError raised inside the resolved module is not mistaken for a missing module
+    tmpdir.join('BrokenReader.py').write("import missing_dependency\nclass BrokenReader(object): pass\n")
+    monkeypatch.setattr(src.readers, '__path__', src.readers.__path__ + [ str(tmpdir) ])
+    with pytest.raises(ImportError):
+        resolve("BrokenReader")
+
+
+def test_Pipeline_invalid():
+    with pytest.raises(ValueError):
+        Pipeline().transform("a", high_co2, inputs="b").transform("b", high_co2, inputs="a").run()
+    with pytest.raises(ValueError):
+        Pipeline().transform("a", high_co2, inputs="missing").run()
+    with pytest.raises(AssertionError):
+        Pipeline(executor="process", queue="thread").transform("a", high_co2, inputs="b")
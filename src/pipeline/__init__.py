@@ -0,0 +1 @@
+from .Pipeline import Pipeline, Stage
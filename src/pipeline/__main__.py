@@ -0,0 +1,17 @@
+import sys
+
+from .Pipeline import Pipeline
+
+
+
+# Config-file runner: python -m src.pipeline pipeline.json
+def main( argv ):
+    if len(argv) != 2:
+        print "Usage: python -m src.pipeline pipeline.json"
+        return 1
+    Pipeline.from_config(argv[1]).run().join()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,236 @@
+import cPickle
+import ctypes
+import os
+import struct
+import tempfile
+import time
+import uuid
+from Queue import Empty, Full
+from collections import deque
+from multiprocessing import Condition
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+from typing import Any, Union
+
+
+
+class BroadcastLog(object):
+    """
+    Shared-memory append-only broadcast log, for one-to-many fan-out without per-consumer copies
+
+    Each put() pickles the item once and appends it to a shared ring of bytes,
+    every BroadcastReader reads through its own cursor, so fan-out cost stays flat as readers are added
+    (compared to one pickle + pipe write per output_queue)
+
+    When the log is full, readers whose cursor is behind the space required are slow readers, handled by policy=
+        "block": put() waits until slow readers catch up, raising Queue.Full after timeout
+        "drop":  slow readers skip the oldest items, counted in reader.dropped
+        "spill": the oldest items are written to a per-reader spill file in spill_directory, which the reader
+                 reads before resuming from the log, so no items are lost and put() never waits
+
+    Assumes a single writer process/thread. Readers must be created before forking consumer processes,
+    the same as multiprocessing.Queue()
+
+    ### Usage:
+    log     = BroadcastLog(size=16*1024*1024, policy="block")
+    readers = [ log.reader(), log.reader() ]
+    log.put({ "timestamp": 1010 })
+    log.put(Queue.Empty)
+    readers[0].get()                # { "timestamp": 1010 }
+    QueueMultiplexer(broadcast=True).output_queue()     # returns a BroadcastReader
+    """
+
+    policies    = ("block", "drop", "spill")
+    max_readers = 64
+    header      = struct.Struct('<I')  # record length prefix
+
+
+    def __init__( self, size=16*1024*1024, policy="block", spill_directory=None ):  # type: (int, str, str) -> None
+        assert policy in self.policies, 'BroadcastLog(policy) must be one of: %s' % (self.policies,)
+
+        self.size            = size
+        self.policy          = policy
+        self.spill_directory = spill_directory or tempfile.gettempdir()
+        self.id              = uuid.uuid4().hex[:8]
+
+        self._buffer    = RawArray('c', size)
+        self._tail      = RawValue(ctypes.c_ulonglong, 0)                 # bytes written
+        self._cursors   = RawArray(ctypes.c_ulonglong, self.max_readers)  # bytes read, per reader
+        self._active    = RawArray(ctypes.c_byte,      self.max_readers)
+        self._dropped   = RawArray(ctypes.c_ulonglong, self.max_readers)  # items dropped, per reader
+        self._spilled   = RawArray(ctypes.c_ulonglong, self.max_readers)  # bytes written to spill file, per reader
+        self._readers   = RawValue(ctypes.c_int, 0)
+        self._condition = Condition()
+
+        self._records     = deque()  # (position, length) of records still in the log, writer only
+        self._spill_files = {}       # writer only
+
+
+    def reader( self ):  # type: () -> BroadcastReader
+        """registers a new reader, starting from the current end of the log"""
+        with self._condition:
+            index = self._readers.value
+            assert index < self.max_readers, 'BroadcastLog.reader() max_readers exceeded'
+            self._readers.value   += 1
+            self._cursors[index]   = self._tail.value
+            self._active[index]    = 1
+        return BroadcastReader(self, index)
+
+
+    def spill_path( self, index ):  # type: (int) -> str
+        return os.path.join(self.spill_directory, "broadcast.%s.%d.spill" % (self.id, index))
+
+
+    ### Writer
+
+    def put( self, item, block=True, timeout=None ):  # type: (Any, bool, Union[float,None]) -> None
+        data   = cPickle.dumps(item, cPickle.HIGHEST_PROTOCOL)
+        record = self.header.pack(len(data)) + data
+        assert len(record) <= self.size, 'BroadcastLog.put() item larger than log size'
+
+        with self._condition:
+            self._reserve(len(record), block, timeout)
+            position = self._tail.value
+            self._write(position, record)
+            self._records.append( (position, len(record)) )
+            self._tail.value = position + len(record)
+            self._condition.notify_all()
+
+
+    def put_nowait( self, item ):  # type: (Any) -> None
+        return self.put(item, False)
+
+
+    def _active_readers( self ):
+        return [ n for n in range(self._readers.value) if self._active[n] ]
+
+
+    def _reserve( self, length, block, timeout ):  # type: (int, bool, Union[float,None]) -> None
+        """ensures length bytes are free at the end of the log, applying policy to slow readers"""
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            readers = self._active_readers()
+            oldest  = min([ self._cursors[n] for n in readers ] or [ self._tail.value ])
+            while self._records and sum(self._records[0]) <= oldest:
+                self._records.popleft()  # read by all readers
+
+            start = self._tail.value + length - self.size  # readers must have read up to start
+            slow  = [ n for n in readers if self._cursors[n] < start ]
+            if not slow: return
+
+            if self.policy == "block":
+                remaining = deadline - time.time() if deadline is not None else None
+                if not block or (remaining is not None and remaining <= 0):
+                    raise Full
+                self._condition.wait(remaining)
+            else:
+                for n in slow: self._evict(n, start)
+
+
+    def _evict( self, index, start ):  # type: (int, int) -> None
+        """advances a slow reader past start, dropping or spilling the records it skips"""
+        cursor = self._cursors[index]
+        for position, length in self._records:
+            if position < cursor: continue
+            if cursor >= start:   break
+            if self.policy == "spill":
+                self._spill(index, self._read(position, length))
+            else:
+                self._dropped[index] += 1
+            cursor = position + length
+        self._cursors[index] = cursor
+
+
+    def _spill( self, index, record ):  # type: (int, str) -> None
+        if index not in self._spill_files:
+            self._spill_files[index] = open(self.spill_path(index), 'ab')
+        file = self._spill_files[index]
+        file.write(record)
+        file.flush()  # visible to the reader before _spilled is updated
+        self._spilled[index] += len(record)
+
+
+    ### Ring Buffer
+
+    def _write( self, position, data ):  # type: (int, str) -> None
+        offset = position % self.size
+        split  = min(len(data), self.size - offset)
+        ctypes.memmove(ctypes.addressof(self._buffer) + offset, data[:split], split)
+        if split < len(data):
+            ctypes.memmove(ctypes.addressof(self._buffer), data[split:], len(data) - split)
+
+
+    def _read( self, position, length ):  # type: (int, int) -> str
+        offset = position % self.size
+        split  = min(length, self.size - offset)
+        data   = ctypes.string_at(ctypes.addressof(self._buffer) + offset, split)
+        if split < length:
+            data += ctypes.string_at(ctypes.addressof(self._buffer), length - split)
+        return data
+
+
+
+class BroadcastReader(object):
+    """Consumer cursor into a BroadcastLog, with the get() / get_nowait() surface of multiprocessing.Queue()"""
+
+    def __init__( self, log, index ):  # type: (BroadcastLog, int) -> None
+        self.log          = log
+        self.index        = index
+        self.spill_file   = None
+        self.spill_offset = 0
+
+
+    @property
+    def dropped( self ):  # type: () -> int
+        return self.log._dropped[self.index]
+
+
+    def get( self, block=True, timeout=None ):  # type: (bool, Union[float,None]) -> Any
+        log      = self.log
+        deadline = time.time() + timeout if timeout is not None else None
+        with log._condition:
+            while True:
+                if log._spilled[self.index] > self.spill_offset:
+                    data = None  # spilled records are older than the cursor, so are read first
+                    break
+                cursor = log._cursors[self.index]
+                if cursor < log._tail.value:
+                    length = log.header.unpack(log._read(cursor, log.header.size))[0]
+                    data   = log._read(cursor + log.header.size, length)
+                    log._cursors[self.index] = cursor + log.header.size + length
+                    log._condition.notify_all()  # wake a blocked writer
+                    break
+                remaining = deadline - time.time() if deadline is not None else None
+                if not block or (remaining is not None and remaining <= 0):
+                    raise Empty
+                log._condition.wait(remaining)
+
+        if data is None:
+            data = self._read_spill()
+        return cPickle.loads(data)
+
+
+    def get_nowait( self ):  # type: () -> Any
+        return self.get(False)
+
+
+    def _read_spill( self ):  # type: () -> str
+        if self.spill_file is None:
+            self.spill_file = open(self.log.spill_path(self.index), 'rb')
+        self.spill_file.seek(self.spill_offset)
+        length = self.log.header.unpack(self.spill_file.read(self.log.header.size))[0]
+        data   = self.spill_file.read(length)
+        self.spill_offset += self.log.header.size + length
+        return data
+
+
+    def close( self ):  # type: () -> None
+        """unregisters the reader, so it no longer holds back the writer, and removes its spill file"""
+        with self.log._condition:
+            self.log._active[self.index] = 0
+            self.log._condition.notify_all()
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+        try:    os.remove(self.log.spill_path(self.index))
+        except OSError: pass
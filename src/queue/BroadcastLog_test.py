@@ -0,0 +1,81 @@
+from Queue import Empty, Full
+from multiprocessing import Process, Queue
+
+import pytest
+
+from . import BroadcastLog, QueueMultiplexer
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get(timeout=5)
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def test_BroadcastLog():
+    log     = BroadcastLog(size=1024)
+    readers = [ log.reader(), log.reader() ]
+    for n in range(100):
+        log.put({ "timestamp": n })  # records wrap around the ring
+        assert readers[0].get()["timestamp"] == n
+        assert readers[1].get()["timestamp"] == n
+    log.put(Empty)
+    assert [ read_queue(reader) for reader in readers ] == [ [], [] ]
+    with pytest.raises(Empty):
+        readers[0].get_nowait()
+
+
+def test_BroadcastLog_block():
+    log    = BroadcastLog(size=256, policy="block")
+    reader = log.reader()
+    with pytest.raises(Full):
+        for n in range(100): log.put(n, timeout=0.01)
+    written = n
+    log.reader().close()  # closed readers do not hold back the writer
+    assert [ reader.get() for n in range(written) ] == range(written)
+
+
+@pytest.mark.parametrize("policy", [ "drop", "spill" ])
+def test_BroadcastLog_slow_reader( tmpdir, policy ):
+    log  = BroadcastLog(size=256, policy=policy, spill_directory=str(tmpdir))
+    fast = log.reader()
+    slow = log.reader()
+    for n in range(100):
+        log.put(n)  # never blocks
+        assert fast.get() == n
+    log.put(Empty)
+
+    items = read_queue(slow)
+    if policy == "drop":
+        assert slow.dropped == 100 - len(items)
+        assert items == range(100 - len(items), 100)  # most recent items are kept
+    else:
+        assert slow.dropped == 0
+        assert items == range(100)                    # spilled items are read first, in order
+    slow.close()
+    assert tmpdir.listdir() == []
+
+
+def consumer( reader, output ):
+    output.put( read_queue(reader) )
+
+
+def test_QueueMultiplexer_broadcast():
+    multiplexer = QueueMultiplexer(broadcast=True, broadcast_size=4096)
+    input_queue = multiplexer.input_queue()
+    readers     = [ multiplexer.output_queue() for n in range(3) ]
+    results     = Queue()
+    processes   = [ Process(target=consumer, args=(reader, results)) for reader in readers ]
+    for process in processes: process.start()
+
+    for n in range(1000): input_queue.put({ "timestamp": n })
+    input_queue.put(Empty)
+    multiplexer._run_thread()
+
+    expected = [ { "timestamp": n } for n in range(1000) ]
+    assert [ results.get(timeout=5) for process in processes ] == [ expected ] * 3
+    for process in processes: process.join()
@@ -0,0 +1,228 @@
+import select
+import time
+from Queue import Empty
+from collections import deque
+
+from typing import Any, Callable, List, Union
+
+from src.util.Batch import Batch, Tracked
+
+
+
+class EventLoop(object):
+    """
+    Single-threaded event loop, running many multiplexers and stream consumers as cooperative tasks
+
+    Compared to QueueMultiplexer.run(), which starts a thread per multiplexer, thousands of lightweight streams
+    can share a single thread: tasks are only stepped when one of their input queues has data, and steps never block.
+        LocalQueue():            in-process deque, ready whenever it contains items, no locks / pickling / pipes
+        multiprocessing.Queue(): bridges process boundaries, all pipe handles are waited on with a single poll() / select()
+        other queue types:       eg: Manager().Queue() proxies, fall back to adaptive polling (poll_min to poll_max)
+
+    Tasks implement: _run_queues(), _run_step(), _is_complete() and _run_thread_complete(),
+    see: QueueMultiplexer.attach(), SortedQueueMultiplexer.attach(), EventManager.attach() and EventLoop.consume()
+
+    A put() onto a full bounded output queue blocks the whole loop, so queues written inside the loop should be unbounded
+
+    ### Usage:
+    loop        = EventLoop()
+    multiplexer = SortedQueueMultiplexer(sort_key="timestamp", queue_factory=LocalQueue).attach(loop)
+    input_queue = multiplexer.input_queue(multiprocessing.Queue())  # written by another process
+    output      = multiplexer.output_queue()                        # LocalQueue
+    loop.consume(output, lambda row: print_row(row))                # called for each row, until Queue.Empty
+    loop.run()                                                      # returns once every task is complete
+    """
+
+    defaults = {
+        "wait_timeout": 0.1,     # type: float  # max seconds blocked waiting for input, before stepping every task
+        "poll_min":     0.0001,  # type: float  # adaptive polling interval for input queues that cannot be waited on
+        "poll_max":     0.01,    # type: float
+        }
+
+
+    def __init__( self, *args, **kwargs ):
+        self.options    = reduce(lambda a, b: dict(a, **b), [self.defaults] + list(args) + [kwargs])
+        self.tasks      = []  # type: List[Any]
+        self.is_running = False
+        self._poll      = self.options['poll_min']
+
+
+    def add( self, task ):  # type: (Any) -> Any
+        """registers a task, returns task"""
+        for method in ('_run_queues', '_run_step', '_is_complete', '_run_thread_complete'):
+            assert hasattr(task, method), 'EventLoop.add(task) task must implement %s()' % method
+        self.tasks.append(task)
+        return task
+
+
+    def consume( self, queue, callback, unpack=True ):  # type: (Any, Callable, bool) -> Consumer
+        """
+        calls callback(item) for each item in queue, unpacking Batch() envelopes unless unpack=False, until Queue.Empty
+        Tracked() envelopes are acknowledged once callback has returned, see: FileReader(checkpoint_ack=True)
+        """
+        return self.add( Consumer(queue, callback, unpack=unpack) )
+
+
+    def run( self ):  # type: () -> EventLoop
+        """runs until every task is complete, or stop() is called"""
+        self.is_running = True
+        while self.tasks and self.is_running:
+            if self.run_once(): self._poll = self.options['poll_min']
+            else:               self._poll = min(self._poll * 2, self.options['poll_max'])
+        self.is_running = False
+        return self
+
+
+    def stop( self ):  # type: () -> None
+        self.is_running = False
+
+
+    def run_once( self, timeout=None ):  # type: (Union[float, None]) -> int
+        """waits for any task to be ready, then steps each ready task once, returns number of items processed"""
+        count = 0
+        for task in self._wait(self.options['wait_timeout'] if timeout is None else timeout):
+            count += task._run_step()
+            if task._is_complete():
+                task._run_thread_complete()
+                self.tasks.remove(task)
+        return count
+
+
+    def _wait( self, timeout ):  # type: (float) -> List[Any]
+        """
+        returns tasks with an input queue ready to read, plus tasks which can only be polled
+        returns every task after timeout seconds without data, allowing idle_timeout and completion checks
+        """
+        ready   = []
+        polled  = []
+        handles = {}  # pipe handle -> tasks
+        for task in self.tasks:
+            for queue in task._run_queues():
+                if isinstance(queue, LocalQueue):
+                    if queue.qsize(): ready.append(task); break
+                    continue
+                handle = fileno(queue)
+                if handle is None:   polled.append(task); break
+                handles.setdefault(handle, []).append(task)
+
+        if ready or polled:
+            timeout = 0 if ready else min(timeout, self._poll)
+        handles_ready = wait_for_handles(handles.keys(), timeout)
+        if not (ready or polled or handles_ready):
+            return list(self.tasks)  # timeout
+
+        tasks = ready + polled + [ task for handle in handles_ready for task in handles[handle] ]
+        seen  = set()
+        return [ task for task in tasks if not (id(task) in seen or seen.add(id(task))) ]
+
+
+
+class LocalQueue(object):
+    """
+    In-process queue for passing items between tasks running on the same EventLoop thread,
+    with the put() / get() / get_nowait() surface of multiprocessing.Queue(), but without locks, pickling or pipes
+
+    get() never blocks (raising Queue.Empty when no items are available) and put() never blocks (maxsize is ignored),
+    as a single-threaded EventLoop cannot wait on itself. Use multiprocessing.Queue() across threads or processes
+
+    ### Usage:
+    QueueMultiplexer(queue_factory=LocalQueue).attach(loop)
+    """
+
+    def __init__( self, maxsize=0 ):  # type: (int) -> None
+        self.items = deque()
+
+
+    def put( self, item, block=True, timeout=None ):  # type: (Any, bool, Union[float, None]) -> None
+        self.items.append(item)
+
+    def put_nowait( self, item ):  # type: (Any) -> None
+        self.items.append(item)
+
+
+    def get( self, block=True, timeout=None ):  # type: (bool, Union[float, None]) -> Any
+        try:
+            return self.items.popleft()
+        except IndexError:
+            raise Empty
+
+    def get_nowait( self ):  # type: () -> Any
+        return self.get(False)
+
+
+    def qsize( self ):  # type: () -> int
+        return len(self.items)
+
+    def empty( self ):  # type: () -> bool
+        return not self.items
+
+    def full( self ):  # type: () -> bool
+        return False
+
+
+
+class Consumer(object):
+    """EventLoop task calling callback(item) for each item in queue, unpacking Batch() envelopes, until Queue.Empty"""
+
+    def __init__( self, queue, callback, burst_size=1000, unpack=True ):  # type: (Any, Callable, int, bool) -> None
+        assert hasattr(queue, 'get'), 'Consumer(queue) must be of type Manager().Queue()'
+        assert callable(callback)
+
+        self.queue       = queue
+        self.callback    = callback
+        self.burst_size  = burst_size
+        self.unpack      = unpack       # False: callback(envelope) is passed whole Batch() envelopes, eg: EventManager.trigger_many()
+        self.is_complete = False
+
+
+    def _run_queues( self ):  # type: () -> List[Any]
+        return [ self.queue ] if not self.is_complete else []
+
+
+    def _run_step( self ):  # type: () -> int
+        count = 0
+        while count < self.burst_size and not self.is_complete:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break                           # Queue.Empty as exception
+            if item is Empty:
+                self.is_complete = True
+                break
+            if self.unpack:
+                for row in Batch.unpack(item):
+                    self.callback(row)
+            else:
+                self.callback(Tracked.unwrap(item))
+            Tracked.ack(item)
+            count += 1
+        return count
+
+
+    def _is_complete( self ):  # type: () -> bool
+        return self.is_complete
+
+
+    def _run_thread_complete( self ):  # type: () -> None
+        pass
+
+
+
+def fileno( queue ):  # type: (Any) -> Union[int, None]
+    """returns the pipe handle of a multiprocessing.Queue(), or None if queue cannot be waited on"""
+    try:
+        return queue._reader.fileno()
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+
+def wait_for_handles( handles, timeout ):  # type: (List[int], float) -> List[int]
+    """blocks until any handle is ready to read, or timeout seconds, using poll() where available as select() is limited to 1024 handles"""
+    if not handles:
+        if timeout: time.sleep(timeout)
+        return []
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        for handle in handles: poller.register(handle, select.POLLIN)
+        return [ handle for handle, event in poller.poll(timeout * 1000) ]
+    return select.select(handles, [], [], timeout)[0]
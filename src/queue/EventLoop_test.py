@@ -0,0 +1,90 @@
+import os
+import threading
+from Queue import Empty
+from multiprocessing import Process, Queue
+
+import pytest
+
+from src.event.EventManager import EventManager
+from src.readers.CSVReader import CSVReader
+from src.util.Batch import Batch
+from . import EventLoop, LocalQueue, QueueMultiplexer, SortedQueueMultiplexer
+
+datafile = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+
+
+def producer( queue, start, stop ):
+    for n in range(start, stop, 2):
+        queue.put({ "timestamp": n })
+    queue.put(Empty)
+
+
+def test_LocalQueue():
+    queue = LocalQueue()
+    queue.put(1)
+    queue.put(Empty)
+    assert queue.qsize() == 2
+    assert queue.get() == 1
+    assert queue.get_nowait() is Empty
+    with pytest.raises(Empty):
+        queue.get()  # never blocks
+
+
+def test_EventLoop_SortedQueueMultiplexer():
+    # thousands of streams on a single thread
+    loop    = EventLoop()
+    threads = threading.active_count()
+    outputs = []
+    for n in range(500):
+        multiplexer = SortedQueueMultiplexer(sort_key="timestamp", queue_factory=LocalQueue).attach(loop)
+        inputs      = [ multiplexer.input_queue() for i in range(4) ]
+        output      = []
+        loop.consume(multiplexer.output_queue(), output.append)
+        outputs.append(output)
+        for i, input_queue in enumerate(inputs):
+            input_queue.put(Batch( { "timestamp": t } for t in range(i, 40, 4) ))
+            input_queue.put(Empty)
+
+    assert loop.run().tasks == []
+    assert threading.active_count() <= threads  # no thread per multiplexer
+    assert all( [ row["timestamp"] for row in output ] == range(40) for output in outputs )
+
+
+def test_EventLoop_Process():
+    # multiprocessing.Queue() inputs bridge process boundaries, and are waited on without a thread per multiplexer
+    loop        = EventLoop()
+    sorted      = SortedQueueMultiplexer(sort_key="timestamp", queue_factory=LocalQueue).attach(loop)
+    fifo        = QueueMultiplexer(queue_factory=LocalQueue).attach(loop)
+    processes   = [ Process(target=producer, args=(sorted.input_queue(Queue()), n, 1000)) for n in range(2) ]
+    processes  += [ Process(target=producer, args=(fifo.input_queue(Queue()), 0, 100)) ]
+    for process in processes: process.start()
+
+    event_manager = EventManager(sorted.output_queue()).attach(loop)
+    events        = []
+    event_manager.register(events.append, { "timestamp": range(10, 1000, 10) })
+    fifo_output   = []
+    loop.consume(fifo.output_queue(), fifo_output.append)
+
+    loop.run()
+    for process in processes: process.join()
+    assert [ event["timestamp"] for event in events ] == range(10, 1000, 10)
+    assert [ row["timestamp"] for row in fifo_output ] == range(0, 100, 2)
+
+
+def test_EventLoop_consume_ack( tmpdir ):
+    # Tracked() items are acknowledged once consumed, from a different process to the reader
+    options = { "checkpoint": str(tmpdir), "checkpoint_interval": 0, "checkpoint_ack": True, "batch_size": 100 }
+    reader  = CSVReader(datafile, queue=Queue(), **options)
+    process = Process(target=reader.start)
+    process.start()
+
+    loop    = EventLoop()
+    rows    = []
+    loop.consume(reader.queue, rows.append)
+    loop.run()
+    process.join()
+    assert len(rows) == 2665
+    assert all( isinstance(row, dict) for row in rows )
+
+    resumed = CSVReader(datafile, queue=Queue(), start=True, **options)
+    assert resumed.queue.get() is Empty
@@ -1,12 +1,39 @@
+import select
 import time
 from Queue import Empty
+from collections import deque
+from itertools import izip
 from multiprocessing import Queue
 from operator import itemgetter
 
+import numpy
 from sortedcontainers import SortedList
-from typing import Any, Callable, Union
+from typing import Any, Callable, Dict, List, Tuple, Union
 
+from src.event.Condition import Condition
+from src.util.Batch import Batch
 from src.util.MultiProcessing import MultiProcessing
+from .BroadcastLog import BroadcastLog
+from .Router import Router
+from .Serializer import serialized_queue
+from .SortKey import SortKey
+
+
+
+class Watermark(object):
+    """
+    Input queue item for SortedQueueMultiplexer, declaring that no later item from the same input queue
+    will sort before value, allowing low-frequency inputs to advance the merge without sending data
+
+    ### Usage:
+    input_queue.put(Watermark(1422886740))
+    """
+
+    def __init__( self, value ):  # type: (Any) -> None
+        self.value = value
+
+    def __repr__( self ):
+        return 'Watermark(%r)' % (self.value,)
 
 
 
@@ -14,7 +41,7 @@ class QueueMultiplexer(object):
     """
     QueueMultiplexer allows several input queues to be merged into a single output queue
 
-    This class implements a non-blocking round-robin FIFO queue multiplexer
+    This class implements an event-driven round-robin FIFO queue multiplexer
     See SortedQueueMultiplexer() subclass for a sorted/chronological queue multiplexer with blocking
 
     ### Usage:
@@ -23,7 +50,9 @@ class QueueMultiplexer(object):
     input_queue_1 = multiplexer.input_queue()                   # generate new input_queue
     input_queue_2 = multiplexer.input_queue(Manager().Queue())  # register external input_queue
     output_queue  = multiplexer.output_queue()   # multiple output queues can be registered
+    kitchen_queue = multiplexer.output_queue(route={ "sensor": "kitchen" })  # routed output queues receive only matching items
     multiplexer.run()                            # many-to-many multiplexing requires registering queues before .run()
+    multiplexer.attach(loop)                     # or: run many multiplexers as tasks on a single EventLoop() thread
 
     input_queue_1.put("value_1")                 # input data from other processes into input queues
     input_queue_2.put("value_2")
@@ -33,6 +62,9 @@ class QueueMultiplexer(object):
     while True:
         item = output_queue.get()                # "value_1", "value_2"
         if item == Queue.Empty: break            # a single Queue.Empty is returned when all input queues have been terminated
+
+    Batch() envelopes are forwarded intact (round-robin per batch), so consumers should use Batch.unpack(item)
+    Routed output queues receive a sub-batch of the matching rows, Queue.Empty and Watermark() are sent to every output queue
     """
 
     defaults = {
@@ -40,6 +72,16 @@ class QueueMultiplexer(object):
         "maxsize_output": 0,            # type: int
         "wait_for_n_input_queues":  1,  # type: int
         "wait_for_n_output_queues": 1,  # type: int
+        "queue_factory":  None,         # type: Callable  # queue_factory(maxsize=) for generated queues, default multiprocessing.Queue
+        "burst_size":     1000,         # type: int    # max items read from a ready input queue before moving to the next
+        "wait_timeout":   0.1,          # type: float  # max seconds blocked waiting for input, before checking for new queues
+        "poll_min":       0.0001,       # type: float  # adaptive polling interval for input queues that cannot be waited on
+        "poll_max":       0.01,         # type: float
+        "broadcast":        False,         # type: bool   # output_queue() returns a BroadcastReader, items are written once
+        "broadcast_size":   16*1024*1024,  # type: int    # bytes of shared memory for the BroadcastLog
+        "broadcast_policy": "block",       # type: str    # slow readers: "block", "drop" or "spill"
+        "broadcast_spill":  None,          # type: str    # spill directory, default tempfile.gettempdir()
+        "serializer":       None,          # type: Union[str, List, Serializer]  # generated queues are SerializedQueue(), see: Serializer
         }
 
 
@@ -51,14 +93,19 @@ class QueueMultiplexer(object):
         self._input_queues  = []
         self._output_queues = []
         self.thread_pool    = None
+        self.router         = None  # type: Router  # created by the first output_queue(route=)
+        self.broadcast_log  = BroadcastLog(self.options['broadcast_size'], self.options['broadcast_policy'],
+                                           self.options['broadcast_spill']) if self.options['broadcast'] else None
 
 
     def _construct_input_queue( self ):  # type: () -> Queue
-        return Queue(maxsize=self.options['maxsize_input'])
+        queue = (self.options['queue_factory'] or Queue)(maxsize=self.options['maxsize_input'])
+        return serialized_queue(queue, self.options['serializer'])
 
 
     def _construct_output_queue( self ):  # type: () -> Queue
-        return Queue(maxsize=self.options['maxsize_output'])
+        queue = (self.options['queue_factory'] or Queue)(maxsize=self.options['maxsize_output'])
+        return serialized_queue(queue, self.options['serializer'])
 
 
     def input_queue( self, queue=None ):  # type: (Union[Queue, None]) -> Queue
@@ -72,9 +119,22 @@ class QueueMultiplexer(object):
         return queue
 
 
-    def output_queue( self, queue=None ):  # type: (Union[Queue, None]) -> Queue
-        """registers/generates a new output queue"""
-        if queue is not None:
+    def output_queue( self, queue=None, route=None ):  # type: (Union[Queue, None], Union[Callable, Condition, Dict, None]) -> Queue
+        """
+        registers/generates a new output queue, or a BroadcastReader in broadcast mode
+        route= delivers only matching items to this output queue: a predicate callable, or a Condition / dict, see: Router
+        """
+        if route is not None or self.router is not None:
+            assert self.broadcast_log is None, 'output_queue(route=) cannot be used in broadcast mode'
+            if self.router is None:
+                self.router = Router()
+                for n in range(len(self._output_queues)): self.router.add(n)  # previous output queues receive every item
+            self.router.add(len(self._output_queues), route)
+
+        if self.broadcast_log is not None:
+            assert queue is None, 'output_queue(queue) cannot register external queues in broadcast mode'
+            queue = self.broadcast_log.reader()
+        elif queue is not None:
             assert hasattr(queue, 'get'), 'output_queue(queue) must be of type Manager().Queue()'
             assert hasattr(queue, 'put'), 'output_queue(queue) must be of type Manager().Queue()'
         else:
@@ -103,6 +163,17 @@ class QueueMultiplexer(object):
         return self
 
 
+    def attach( self, loop ):  # type: ('EventLoop') -> QueueMultiplexer
+        """
+        Runs the multiplexer as a task on a shared single-threaded EventLoop, rather than a thread per multiplexer via .run()
+        Returns self for chaining from constructor
+        """
+        assert not self.is_running, 'attach(loop) cannot be combined with run()'
+        self.is_running = True
+        loop.add(self)
+        return self
+
+
     def _run_thread( self ):  # type: () -> None
         self._run_thread_wait()
         self._run_thread_loop()
@@ -124,27 +195,121 @@ class QueueMultiplexer(object):
 
 
     def _run_thread_loop( self ):
-        """Implements a non-blocking round-robin FIFO queue multiplexer"""
+        """
+        Implements an event-driven round-robin FIFO queue multiplexer
+
+        Blocks until any input_queue has data, then reads each ready input_queue in round-robin order,
+        draining up to burst_size items at a time so a busy input_queue cannot starve the others.
+        multiprocessing.Queue() inputs are waited on via select() on their pipe handles,
+        other queue types (eg: Manager().Queue() proxies) fall back to a blocking get() for a single input_queue,
+        or adaptive polling (doubling from poll_min to poll_max while idle) for several
+        """
+        poll = self.options['poll_min']
         while not self._should_thread_terminate():      # exit loop when all input_queues = None
-            for n, input_queue in enumerate(self._input_queues):
-                if input_queue is None: continue        # ignore terminated queues
+            ready = self._wait_for_input_queues(self.options['wait_timeout'])
+            if ready is not None:
+                for n in ready:
+                    self._drain_input_queue(n)
+            else:
+                active = [ n for n, input_queue in enumerate(self._input_queues) if input_queue is not None ]
+                block  = len(active) == 1
+                count  = sum( self._drain_input_queue(n, block=block) for n in active )
+                if count or block:
+                    poll = self.options['poll_min']
+                else:
+                    time.sleep(poll)
+                    poll = min(poll * 2, self.options['poll_max'])
+
+
+    ### EventLoop Task Interface
+
+    def _run_queues( self ):  # type: () -> List[Queue]
+        """input_queues to wait on before the next _run_step()"""
+        return [ input_queue for input_queue in self._input_queues if input_queue is not None ]
+
 
-                try:   item = input_queue.get_nowait()  # skip rather than block on empty but unterminated queues
-                except Empty: continue                  # Queue.Empty as exception
+    def _run_step( self ):  # type: () -> int
+        """non-blocking: drains each active input_queue once, returns number of items moved"""
+        return sum( self._drain_input_queue(n) for n, input_queue in enumerate(self._input_queues) if input_queue is not None )
 
-                if item == Empty:
-                    self._input_queues[n] = None        # Terminate queue
-                    continue
 
-                # Add item to all output_queues
-                for output_queue in self._output_queues:
-                    output_queue.put(item)
+    def _is_complete( self ):  # type: () -> bool
+        """True once input_queues have been registered and all of them have been terminated"""
+        return bool(self._input_queues) and all( input_queue is None for input_queue in self._input_queues )
+
+
+    def _wait_for_input_queues( self, timeout, indexes=None ):  # type: (float, List[int]) -> Union[List[int], None]
+        """
+        blocks until any input_queue (or those in indexes) has data ready to read, or timeout seconds
+        returns indexes of ready input_queues, or None if any input_queue cannot be waited on
+        """
+        handles = {}
+        for n, input_queue in enumerate(self._input_queues):
+            if input_queue is None: continue            # ignore terminated queues
+            if indexes is not None and n not in indexes: continue
+            try:
+                handles[ input_queue._reader.fileno() ] = n  # multiprocessing.Queue() pipe
+            except (AttributeError, IOError, OSError, ValueError):
+                return None
+        try:
+            ready, _, _ = select.select(handles.keys(), [], [], timeout)
+        except (select.error, IOError, OSError, ValueError):
+            return None                                 # eg: windows pipes are not selectable
+        return sorted( handles[handle] for handle in ready )
+
+
+    def _drain_input_queue( self, index, block=False ):  # type: (int, bool) -> int
+        """moves up to burst_size items from input_queue to all output_queues, returns number of items moved"""
+        input_queue = self._input_queues[index]
+        count       = 0
+        while count < self.options['burst_size']:
+            try:
+                if block and count == 0: item = input_queue.get(True, self.options['wait_timeout'])
+                else:                    item = input_queue.get_nowait()  # skip rather than block on empty but unterminated queues
+            except Empty:
+                break                                   # Queue.Empty as exception
+
+            if item is Empty:  # is rather than ==, as numpy.recarray == compares elementwise
+                self._input_queues[index] = None        # Terminate queue
+                break
+
+            self._put_output(item)
+            count += 1
+        return count
+
+
+    def _put_output( self, item ):  # type: (Any) -> None
+        """adds item to all output_queues, will block thread if any output queue is full"""
+        if self.broadcast_log is not None:
+            self.broadcast_log.put(item)  # written once, read by every BroadcastReader
+        elif self.router is not None and item is not Empty and not isinstance(item, Watermark):
+            self._put_routed(item)
+        else:
+            for output_queue in self._output_queues:
+                output_queue.put(item)
+
+
+    def _put_routed( self, item ):  # type: (Any) -> None
+        """adds item to output_queues with a matching route, Batch() envelopes are split into a sub-batch per output_queue"""
+        if not Batch.is_batch(item):
+            for n in self.router.match(item):
+                self._output_queues[n].put(item)
+            return
+
+        positions = {}  # output_queue index -> positions of matching rows
+        for position, row in enumerate(item):
+            for n in self.router.match(row):
+                positions.setdefault(n, []).append(position)
+        for n in sorted(positions):
+            if len(positions[n]) == len(item):   subset = item
+            elif isinstance(item, numpy.ndarray): subset = item[positions[n]]  # numpy.recarray chunk
+            else:                                 subset = Batch( item[position] for position in positions[n] )
+            self._output_queues[n].put(subset)
 
 
     def _run_thread_complete( self ):
         # Add Queue.Empty to all output_queues, once all input has been read
-        for output_queue in self._output_queues:
-            output_queue.put(Empty)
+        self._put_output(Empty)
 
 
 
@@ -178,6 +343,14 @@ class SortedQueueMultiplexer(QueueMultiplexer):
     while True:
         item = output_queue.get()                # 1010, 1019, 1020, 1020, 1021, 1030
         if item == Queue.Empty: break            # a single Queue.Empty is returned when all input queues have been terminated
+
+    # low-frequency or stalled inputs: bound output latency with watermarks and idle_timeout
+    multiplexer = SortedQueueMultiplexer(sort_key='timestamp', idle_timeout=1.0)
+    input_queue_2.put(Watermark(1040))           # input_queue_2 has no items before 1040
+
+    # inputs that are slightly out of order: bounded reordering buffer per input, with late items as a side output
+    multiplexer = SortedQueueMultiplexer(sort_key='timestamp', max_lateness=5)  # or max_disorder=100 items
+    late_queue  = multiplexer.late_queue()
     """
 
     defaults = dict(QueueMultiplexer.defaults, **{
@@ -185,7 +358,10 @@ class SortedQueueMultiplexer(QueueMultiplexer):
         "maxsize_output": 0,             # type: int
         "wait_for_n_output_queues": 1,   # type: int
         "sort_key": None,                # type: Union[str,list,Callable]
-        "sort_reverse": False            # type: bool
+        "sort_reverse": False,           # type: bool
+        "idle_timeout": None,            # type: float  # seconds without data before an input_queue is ignored, None = wait forever
+        "max_lateness": None,            # type: Any    # per input reordering, items up to max_lateness sort_key units out of order
+        "max_disorder": None,            # type: int    # per input reordering, items up to max_disorder positions out of order
         })
 
 
@@ -193,84 +369,261 @@ class SortedQueueMultiplexer(QueueMultiplexer):
         super(SortedQueueMultiplexer, self).__init__(*args, **kwargs)
 
         self.sort_pop_index   = 0 if self.options['sort_reverse'] == False else -1
+        self.sort_key         = SortKey(self.options['sort_key'])  # compiled once, rather than per item
+        self.batch_buffer     = {}  # remaining items from Batch() envelopes, indexed by input_queue
         self.peek_buffer_dict = {}
         self.peek_buffer_list = SortedList(key=itemgetter(0,1))  # sort on (sort_key, index)
+        self.watermarks       = {}  # sort_key of the last item or Watermark() read, indexed by input_queue
+        self.last_seen        = {}  # time.time() of the last item read, indexed by input_queue
+        self.reorder_buffer   = {}  # SortedList of (sort_key, sequence, item) not yet released, indexed by input_queue
+        self.reorder_max_key  = {}  # max sort_key read, indexed by input_queue
+        self.reorder_closed   = set()  # input_queues which have read Queue.Empty, but have items in reorder_buffer
+        self.reorder_sequence = 0
+        self.output_watermark = None  # sort_key of the last item written to output_queues
+        self.late_count       = 0
+        self._late_queues     = []
+        self.is_reordering    = self.options['max_lateness'] is not None or self.options['max_disorder'] is not None
+        assert not (self.is_reordering and self.options['sort_reverse']), \
+            'SortedQueueMultiplexer(max_lateness=, max_disorder=) requires sort_reverse=False'
+
+
+    def late_queue( self, queue=None ):  # type: (Union[Queue, None]) -> Queue
+        """
+        registers/generates a side output queue for items later than max_lateness / max_disorder,
+        or which sort before items already written to output, eg: from an idle input_queue that resumes with old data
+        """
+        if queue is None:
+            queue = self._construct_output_queue()
+        self._late_queues.append(queue)
+        return queue
 
 
     def _sort_key( self, item ):  # type: (Any) -> Any
-        """Sort function used by SortedDict peek_buffer"""
-
-        output = item
-
-        if self.options['sort_key'] is None:
-            pass  # short-circuit common case
-
-        elif callable( self.options['sort_key'] ):
-            output = self.options['sort_key'].__call__(item)
+        """Sort function used by SortedDict peek_buffer, see: SortKey"""
+        return self.sort_key.extract(item)
 
-        elif isinstance(self.options['sort_key'], (str, list)):
-            # extracts nested key "a.b.c" or ["a", "b", "c"] and evaluates result if callable()
-            # was: output = pydash.result(item, self.options['sort_key'])
 
-            sort_keys = self.options['sort_key']
-            if isinstance(self.options['sort_key'], str):
-                sort_keys = sort_keys.split('.')
-            for key in sort_keys:
-                try:
-                    if key in output:          output = output[key]    # output["a"]["b"]["c"]
-                    elif hasattr(output, key): output = getattr(output, key)
-                    else:                      output = None
-
-                    if callable(output):       output = output.__call__()
-                    if output is None:         break
-                except:
-                    output = None
-                    break
-
-        return output
-
-
-    def _update_peek_buffer( self, index, force=False ):  # type: (int) -> None
+    def _update_peek_buffer( self, index, block=False, timeout=None ):  # type: (int, bool, float) -> bool
         """
-        updates numbered slot in peek_buffer from relevant input_queue
+        updates numbered slot in peek_buffer from relevant input_queue, returns True if the slot was filled
         no-op if peek_buffer is already populated or input_queue has been terminated
         will terminate input_queue if Queue.Empty is returned
-        blocks thread when input_queue is empty
+        Watermark() items advance the watermark of the input_queue, and are not added to the peek_buffer
+        blocks thread for up to timeout seconds if block=True and input_queue is empty
         """
-        if (force or index not in self.peek_buffer_dict) and (self._input_queues[index] is not None):
-            item = self._input_queues[index].get()  # will block if input queue is empty
+        while index not in self.peek_buffer_dict and self._input_queues[index] is not None:
+            try:
+                if self.is_reordering: sort_key, item = self._get_reordered_item(index, block, timeout)
+                else:                  sort_key, item = self._get_input_item(index, block, timeout)
+            except Empty:
+                return False                        # Queue.Empty as exception: no data yet
+            self.last_seen[index] = time.time()
+
             if item is Empty:
                 self._input_queues[index] = None    # mark input_queue as terminated
+            elif isinstance(item, Watermark):
+                self.watermarks[index] = item.value
             else:
                 # OPTIMIZATION: sort results in both dict() and SortedList
                 # Assumes _run_thread_loop() will: self.peek_buffer_list.pop(index); del self.peek_buffer_dict[index]
-                sort_key = self._sort_key(item)
+                if not self.is_reordering:
+                    self.watermarks[index]   = sort_key  # input queues are assumed to be ordered
                 self.peek_buffer_dict[index] = (sort_key, index, item)
                 self.peek_buffer_list.add(     (sort_key, index, item) )
+                return True
+        return False
 
 
-    def _run_thread_loop( self ):  # type: () -> None
+    def _get_input_item( self, index, block=True, timeout=None ):  # type: (int, bool, float) -> Tuple[Any, Any]
         """
-        Implements a sorted/chronological queue multiplexer with blocking
+        reads the next (sort_key, item) from input_queue, unpacking Batch() envelopes one item at a time
+        sort keys for a Batch() are extracted for the whole batch at once, sort_key is None for Queue.Empty and Watermark()
+        """
+        while not self.batch_buffer.get(index):
+            item = self._input_queues[index].get(block, timeout)  # raises Queue.Empty if input queue is empty
+            if Batch.is_batch(item):
+                self.batch_buffer[index] = deque(izip(self.sort_key.batch(item), item))
+            elif item is Empty or isinstance(item, Watermark):
+                return None, item
+            else:
+                return self.sort_key.extract(item), item
+        return self.batch_buffer[index].popleft()
 
-        Store next entry from all input_queues in peek_buffer,
-        write sorted min/max value to all output queues and update peek_buffer
 
-        Blocks thread if any output_queue is full, or any input_queue is empty but not terminated
+    def _get_reordered_item( self, index, block=True, timeout=None ):  # type: (int, bool, float) -> Tuple[Any, Any]
         """
-        while not self._should_thread_terminate():  # exit loop when all input_queues = None
-            # Create peek_buffer entries for any new input_queues since last loop
-            for n in range(len(self.peek_buffer_dict), len(self._input_queues)):
-                self._update_peek_buffer(n, force=False)
+        reads the next (sort_key, item) from input_queue via a bounded reordering buffer, for input_queues that are not quite ordered
+
+        Items are held in reorder_buffer until they sort before the watermark of the input_queue:
+        max_lateness advances the watermark to (max sort_key read - max_lateness),
+        max_disorder advances the watermark when more than max_disorder items are buffered.
+        Items which sort before the watermark on arrival are late, and are written to late_queue() rather than output
+        """
+        buffer = self.reorder_buffer.setdefault(index, SortedList(key=itemgetter(0,1)))
+        while True:
+            if buffer and (index in self.reorder_closed or index in self.watermarks and buffer[0][0] <= self.watermarks[index]):
+                (sort_key, sequence, item) = buffer.pop(0)
+                return sort_key, item
+            if index in self.reorder_closed:
+                self.reorder_closed.discard(index)
+                return None, Empty
+
+            sort_key, item = self._get_input_item(index, block, timeout)  # raises Queue.Empty if input queue is empty
+            if item is Empty:
+                self.reorder_closed.add(index)
+                continue
+            if isinstance(item, Watermark):
+                self._advance_watermark(index, item.value)
+                continue
+
+            if index in self.watermarks and sort_key < self.watermarks[index]:
+                self._put_late(item)
+                continue
+
+            self.reorder_sequence += 1
+            buffer.add( (sort_key, self.reorder_sequence, item) )
+            self.reorder_max_key[index] = max(self.reorder_max_key.get(index, sort_key), sort_key)
+            if self.options['max_lateness'] is not None:
+                self._advance_watermark(index, self.reorder_max_key[index] - self.options['max_lateness'])
+            if self.options['max_disorder'] is not None and len(buffer) > self.options['max_disorder']:
+                self._advance_watermark(index, buffer[0][0])
+
+
+    def _advance_watermark( self, index, value ):  # type: (int, Any) -> None
+        if index not in self.watermarks or value > self.watermarks[index]:
+            self.watermarks[index] = value
+
+
+    def _put_late( self, item ):  # type: (Any) -> None
+        self.late_count += 1
+        for late_queue in self._late_queues:
+            late_queue.put(item)
+
 
-            # Grab next min/max item from the peek_buffer
+    def _is_late( self, sort_key ):  # type: (Any) -> bool
+        """True if sort_key sorts before the last item written to output, so can no longer be emitted in order"""
+        if self.output_watermark is None: return False
+        if self.options['sort_reverse'] == False: return sort_key < self.output_watermark
+        else:                                     return sort_key > self.output_watermark
+
+
+    def _is_idle( self, index, now ):  # type: (int, float) -> bool
+        return self.options['idle_timeout'] is not None \
+           and now - self.last_seen.setdefault(index, now) > self.options['idle_timeout']
+
+
+    def _waiting_input_queues( self ):  # type: () -> List[int]
+        """indexes of active input_queues without an item in the peek_buffer"""
+        return [ n for n, input_queue in enumerate(self._input_queues)
+                 if input_queue is not None and n not in self.peek_buffer_dict ]
+
+
+    def _is_below_watermark( self, sort_key, now ):  # type: (Any, float) -> bool
+        """
+        True if no waiting input_queue can produce an item that sorts before sort_key
+        an input_queue without data is bounded by its watermark (the last sort_key or Watermark() it produced),
+        unless declared idle after idle_timeout seconds
+        """
+        for n in self._waiting_input_queues():
+            if self._is_idle(n, now): continue
+            watermark = self.watermarks.get(n, None)
+            if watermark is None:                                          return False
+            if self.options['sort_reverse'] == False and sort_key > watermark: return False
+            if self.options['sort_reverse'] == True  and sort_key < watermark: return False
+        return True
+
+
+    def _emit_peek_buffer( self ):  # type: () -> int
+        """
+        writes all items below the minimum active watermark to the output queues, returns number of items written
+        items sorting before the output watermark are written to late_queue() instead
+        """
+        count = 0
+        now   = time.time()
+        while self.peek_buffer_list:
             # WAS: values = sorted(self.peek_buffer_dict.values(), key=itemgetter(0,1), reverse=self.options['sort_reverse'] )
-            (sort_key, index, item) = self.peek_buffer_list.pop( index=self.sort_pop_index )
+            (sort_key, index, item) = self.peek_buffer_list[self.sort_pop_index]
+            if not self._is_below_watermark(sort_key, now): break
+
+            self.peek_buffer_list.pop( index=self.sort_pop_index )
             del self.peek_buffer_dict[index]
 
             # Add item to all output_queues, will block thread if any output queue is full
-            for output_queue in self._output_queues:
-                output_queue.put(item)
+            if self._is_late(sort_key):
+                self._put_late(item)  # an idle input_queue resumed behind the output
+            else:
+                self._put_output(item)
+                self.output_watermark = sort_key
+            count += 1
 
             # Read the next value from the same input_queue
-            self._update_peek_buffer(index, force=True)
+            self._update_peek_buffer(index)
+        return count
+
+
+    def _wait_for_peek_buffer( self, poll ):  # type: (float) -> None
+        """blocks until a waiting input_queue has data, or an input_queue is due to be declared idle"""
+        now     = time.time()
+        waiting = self._waiting_input_queues()
+        timeout = self.options['wait_timeout']
+        if not waiting: return
+        if self.options['idle_timeout'] is not None:
+            for n in waiting:
+                if not self._is_idle(n, now):
+                    timeout = min(timeout, self.last_seen[n] + self.options['idle_timeout'] - now)
+        timeout = max(0, timeout)
+
+        if len(waiting) == 1:
+            self._update_peek_buffer(waiting[0], block=True, timeout=timeout)
+        elif self._wait_for_input_queues(timeout, waiting) is None:
+            time.sleep(min(poll, timeout))
+
+
+    ### EventLoop Task Interface
+
+    def _run_queues( self ):  # type: () -> List[Queue]
+        """only waiting input_queues can unblock output, input_queues with an item in the peek_buffer are read after it is emitted"""
+        return [ self._input_queues[n] for n in self._waiting_input_queues() ]
+
+
+    def _run_step( self ):  # type: () -> int
+        """non-blocking: fills the peek_buffer from waiting input_queues, then emits sorted items, returns number of items written"""
+        # Create peek_buffer entries for any new input_queues since last loop
+        now = time.time()
+        for n in self._waiting_input_queues():
+            if self.reorder_buffer.get(n) and self._is_idle(n, now):
+                self._advance_watermark(n, self.reorder_buffer[n][-1][0])  # release buffered items from idle inputs
+            self._update_peek_buffer(n)
+        return self._emit_peek_buffer()
+
+
+    def _is_complete( self ):  # type: () -> bool
+        return super(SortedQueueMultiplexer, self)._is_complete() and not self.peek_buffer_list
+
+
+    def _run_thread_loop( self ):  # type: () -> None
+        """
+        Implements a sorted/chronological queue multiplexer with watermarks
+
+        Store next entry from all input_queues in peek_buffer, then write sorted min/max values to all output queues
+        while they are below the watermark of every waiting input_queue (an input_queue without data in peek_buffer).
+        The watermark of an input_queue is the sort_key of its last item, or can be advanced with a Watermark() item.
+        With idle_timeout=None, output blocks until every active input_queue has produced data,
+        otherwise input_queues without data for idle_timeout seconds are ignored until they produce data again,
+        so output latency is bounded by idle_timeout rather than by the slowest input_queue
+
+        Blocks thread if any output_queue is full, or any input_queue is empty but not terminated
+        """
+        poll = self.options['poll_min']
+        while not self._should_thread_terminate() or self.peek_buffer_list:  # exit loop when all input_queues = None
+            if self._run_step():
+                poll = self.options['poll_min']
+            elif not self._should_thread_terminate():
+                self._wait_for_peek_buffer(poll)
+                poll = min(poll * 2, self.options['poll_max'])
+
+
+    def _run_thread_complete( self ):
+        super(SortedQueueMultiplexer, self)._run_thread_complete()
+        for late_queue in self._late_queues:
+            late_queue.put(Empty)
@@ -1,11 +1,38 @@
-from Queue import Empty
+import threading
+import time
+from Queue import Empty, Queue
+from multiprocessing import Process
 
-from . import QueueMultiplexer, SortedQueueMultiplexer
+import numpy
+import pytest
 
+from src.util.Batch import Batch
+from src.util.Record import Record
+from . import QueueMultiplexer, Router, SortKey, SortedQueueMultiplexer, Watermark
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def put_items( queue, items ):
+    for item in items: queue.put(item)
+
+
+def put_from_process( queue, items ):
+    """puts items from a child process, which joins its multiprocessing.Queue() feeder thread on exit, so all items are in the pipe"""
+    process = Process(target=put_items, args=(queue, items))
+    process.start()
+    process.join()
 
 
 def test_QueueMultiplexer():
-    multiplexer = QueueMultiplexer()             # chaining .run() is suitable for one-to-many multiplexing
+    multiplexer = QueueMultiplexer(burst_size=1) # chaining .run() is suitable for one-to-many multiplexing
 
     input_queue_1 = multiplexer.input_queue()    # generate new input_queue
     input_queue_2 = multiplexer.input_queue()    # register external input_queue
@@ -14,16 +41,10 @@ def test_QueueMultiplexer():
         multiplexer.output_queue(),              # multiple output queues can be registered
     ]
 
-    # input data from other processes into input queues
-    input_queue_1.put("value_1_1")
-    input_queue_1.put("value_1_2")
-    input_queue_2.put("value_2_1")
-    input_queue_2.put("value_2_2")
-    input_queue_2.put("value_2_3")
-
-    # mark termination of each input queue with Queue.Empty
-    input_queue_1.put(Empty)
-    input_queue_2.put(Empty)
+    # input data from other processes into input queues, marking termination of each input queue with Queue.Empty
+    # round-robin order is only deterministic once every item has been flushed to the pipe
+    put_from_process(input_queue_1, [ "value_1_1", "value_1_2", Empty ])
+    put_from_process(input_queue_2, [ "value_2_1", "value_2_2", "value_2_3", Empty ])
 
     # pytest doesn't like running code in separate threads, so run synchronously after all data has been loaded
     multiplexer._run_thread()
@@ -43,6 +64,96 @@ def test_QueueMultiplexer():
 
 
 
+def test_QueueMultiplexer_burst():
+    multiplexer   = QueueMultiplexer(burst_size=2)
+    input_queue_1 = multiplexer.input_queue()
+    input_queue_2 = multiplexer.input_queue()
+    output_queue  = multiplexer.output_queue()
+
+    put_from_process(input_queue_1, [ "value_1_%d" % n for n in range(5) ] + [ Empty ])
+    put_from_process(input_queue_2, [ "value_2_%d" % n for n in range(3) ] + [ Empty ])
+
+    multiplexer._run_thread()
+    items = read_queue(output_queue)
+    assert items == [ "value_1_0", "value_1_1", "value_2_0", "value_2_1",
+                      "value_1_2", "value_1_3", "value_2_2", "value_1_4" ]
+
+    # input queues without a pipe handle fall back to polling
+    multiplexer   = QueueMultiplexer(burst_size=2)
+    input_queue_1 = multiplexer.input_queue(Queue())
+    input_queue_2 = multiplexer.input_queue(Queue())
+    output_queue  = multiplexer.output_queue(Queue())
+    for n in range(3): input_queue_1.put(n)
+    input_queue_1.put(Empty)
+    input_queue_2.put(Empty)
+    multiplexer._run_thread()
+    assert read_queue(output_queue) == [ 0, 1, 2 ]
+
+
+def test_QueueMultiplexer_idle():
+    multiplexer  = QueueMultiplexer()
+    input_queue  = multiplexer.input_queue()
+    output_queue = multiplexer.output_queue()
+    thread       = threading.Thread(target=multiplexer._run_thread)
+    thread.start()
+
+    # idle input queues block in select() rather than spinning
+    cpu_time = time.clock()
+    time.sleep(0.5)
+    assert time.clock() - cpu_time < 0.1
+
+    input_queue.put("value")
+    assert output_queue.get(timeout=1) == "value"
+    input_queue.put(Empty)
+    thread.join(1)
+    assert output_queue.get(timeout=1) is Empty
+
+
+def test_Router():
+    router = Router()
+    for n in range(100):
+        router.add(n, { "sensor": "sensor_%d" % n, "CO2": [ 749.2, 760.4 ] })
+    router.add(100, { "sensor": [ "sensor_1", "sensor_2" ] })
+    router.add(101, lambda item: item["CO2"] > 1000)
+    router.add(102)
+
+    assert router.scanned[0][0] == 101  # dict conditions are indexed, rather than scanned
+    assert router.match({ "sensor": "sensor_1",  "CO2": 749.2 }) == [ 1, 100, 102 ]
+    assert router.match({ "sensor": "sensor_1",  "CO2": 1001 })  == [ 100, 101, 102 ]
+    assert router.match({ "sensor": [ "sensor_2", "sensor_3" ], "CO2": 760.4 }) == [ 2, 3, 100, 102 ]
+    assert router.match({ "CO2": 0 }) == [ 102 ]
+
+
+def test_Router_nested_paths():
+    router = Router()
+    router.add(0, { "header": { "protocol": "tcp", "port": 80 } })
+    router.add(1, { "header.protocol": "udp" })
+    assert router.matchers[0] is not None and router.matchers[1] is None  # only single leaf rules are exact index matches
+    assert router.match({ "header": { "protocol": "tcp", "port": 80 } })  == [ 0 ]
+    assert router.match({ "header": { "protocol": "tcp", "port": 443 } }) == []
+    assert router.match({ "header": { "protocol": "udp" } })              == [ 1 ]
+
+
+def test_QueueMultiplexer_route():
+    multiplexer = QueueMultiplexer()
+    input_queue = multiplexer.input_queue()
+    everything  = multiplexer.output_queue()
+    kitchen     = multiplexer.output_queue(route={ "sensor": "kitchen" })
+    high_co2    = multiplexer.output_queue(route=lambda item: item["CO2"] > 1000)
+
+    rows = [ { "sensor": sensor, "CO2": CO2 } for sensor in [ "kitchen", "lounge" ] for CO2 in [ 749.2, 1001 ] ]
+    input_queue.put(rows[0])
+    input_queue.put(Batch(rows[1:]))
+    input_queue.put(Watermark(1422886800))
+    input_queue.put(Empty)
+    multiplexer._run_thread()
+
+    items = read_queue(everything)
+    assert items[:2] == [ rows[0], rows[1:] ] and items[2].value == 1422886800
+    assert [ item for item in read_queue(kitchen)  if not isinstance(item, Watermark) ] == [ rows[0], Batch(rows[1:2]) ]
+    assert [ item for item in read_queue(high_co2) if not isinstance(item, Watermark) ] == [ Batch([ rows[1], rows[3] ]) ]
+
+
 def test_SortedQueueMultiplexer():
     multiplexer   = SortedQueueMultiplexer(sort_key="timestamp")             # chaining .run() is suitable for one-to-many multiplexing
 
@@ -87,3 +198,160 @@ def test_SortedQueueMultiplexer():
         if item is not Empty:
             assert item['timestamp'] >= last_timestamp
             last_timestamp = item['timestamp']
+
+
+
+def test_SortKey():
+    class Event(dict):
+        timestamp = 1030
+
+    assert SortKey(None)(1010) == 1010
+    assert SortKey(lambda item: -item)(1010) == -1010
+    assert SortKey("timestamp")({ "timestamp": 1010 }) == 1010
+    assert SortKey("timestamp")({ "timestamp": lambda: 1020 }) == 1020   # callable values are evaluated
+    assert SortKey("timestamp")(Event()) == 1030                           # attribute fallback
+    assert SortKey("timestamp")({}) is None
+    assert SortKey("a.b.c")({ "a": { "b": { "c": 1040 } } }) == 1040
+    assert SortKey(["a", "timestamp"])({ "a": Event() }) == 1030
+    assert SortKey("a.b.c")({ "a": { "b": None } }) is None
+
+    chunk = numpy.rec.fromarrays([ [ 3, 1, 2 ] ], names=[ "timestamp" ])
+    assert SortKey("timestamp").batch(chunk) == [ 3, 1, 2 ]
+    assert SortKey("timestamp").batch(Batch([ { "timestamp": 3 }, { "timestamp": 1 } ])) == [ 3, 1 ]
+
+
+def test_SortedQueueMultiplexer_Batch():
+    multiplexer   = SortedQueueMultiplexer(sort_key="timestamp")
+
+    input_queue_1 = multiplexer.input_queue()
+    input_queue_2 = multiplexer.input_queue()
+    output_queue  = multiplexer.output_queue()
+
+    # Batch() envelopes are unpacked and sorted item by item
+    input_queue_1.put(Batch([ { "timestamp": n } for n in range(0,10,2) ]))
+    input_queue_1.put(Batch([ { "timestamp": n } for n in range(10,20,2) ]))
+    input_queue_2.put(Batch([ { "timestamp": n } for n in range(1,20,2) ]))
+    input_queue_1.put(Empty)
+    input_queue_2.put(Empty)
+
+    multiplexer._run_thread()
+
+    items = []
+    while True:
+        item = output_queue.get()
+        if item == Empty: break
+        items.append( item['timestamp'] )
+
+    assert items == range(0,20)
+
+
+def test_SortedQueueMultiplexer_Record():
+    multiplexer   = SortedQueueMultiplexer(sort_key="timestamp")
+    input_queue_1 = multiplexer.input_queue()
+    input_queue_2 = multiplexer.input_queue()
+    output_queue  = multiplexer.output_queue()
+
+    Row = Record.type([ "timestamp", "value" ])
+    input_queue_1.put(Batch([ Row([ n, "a" ]) for n in range(0,10,2) ]))
+    input_queue_2.put(Batch([ Row([ n, "b" ]) for n in range(1,10,2) ]))
+    input_queue_1.put(Empty)
+    input_queue_2.put(Empty)
+
+    multiplexer._run_thread()
+
+    items = []
+    while True:
+        item = output_queue.get()
+        if item is Empty: break
+        items.append( item.timestamp )
+
+    assert items == range(0,10)
+
+
+def test_SortedQueueMultiplexer_watermark():
+    multiplexer   = SortedQueueMultiplexer(sort_key="timestamp")
+    input_queue_1 = multiplexer.input_queue()
+    input_queue_2 = multiplexer.input_queue()
+    output_queue  = multiplexer.output_queue()
+    thread        = threading.Thread(target=multiplexer._run_thread)
+    thread.start()
+
+    for n in range(10): input_queue_1.put({ "timestamp": n })
+    with pytest.raises(Empty):
+        output_queue.get(timeout=0.2)           # blocked until input_queue_2 produces data
+
+    input_queue_2.put(Watermark(4))             # input_queue_2 has nothing before timestamp 4
+    assert [ output_queue.get(timeout=1)['timestamp'] for n in range(5) ] == range(5)
+    with pytest.raises(Empty):
+        output_queue.get(timeout=0.2)
+
+    input_queue_2.put({ "timestamp": 6.5 })
+    input_queue_1.put(Empty)
+    input_queue_2.put(Empty)
+    thread.join(1)
+    assert [ item['timestamp'] for item in read_queue(output_queue) ] == [ 5, 6, 6.5, 7, 8, 9 ]
+
+
+def test_SortedQueueMultiplexer_idle_timeout():
+    multiplexer   = SortedQueueMultiplexer(sort_key="timestamp", idle_timeout=0.2)
+    input_queue_1 = multiplexer.input_queue()
+    input_queue_2 = multiplexer.input_queue()
+    output_queue  = multiplexer.output_queue()
+    thread        = threading.Thread(target=multiplexer._run_thread)
+    thread.start()
+
+    # input_queue_2 is declared idle, so does not stall input_queue_1
+    for n in range(5): input_queue_1.put({ "timestamp": n })
+    started = time.time()
+    assert [ output_queue.get(timeout=1)['timestamp'] for n in range(5) ] == range(5)
+    assert time.time() - started < 0.5
+
+    input_queue_2.put({ "timestamp": 10 })
+    input_queue_1.put({ "timestamp": 11 })
+    input_queue_1.put(Empty)
+    input_queue_2.put(Empty)
+    thread.join(1)
+    assert [ item['timestamp'] for item in read_queue(output_queue) ] == [ 10, 11 ]
+
+
+def test_SortedQueueMultiplexer_idle_resume_late():
+    multiplexer   = SortedQueueMultiplexer(sort_key="timestamp", idle_timeout=0.2)
+    input_queue_1 = multiplexer.input_queue()
+    input_queue_2 = multiplexer.input_queue()
+    output_queue  = multiplexer.output_queue()
+    late_queue    = multiplexer.late_queue()
+    thread        = threading.Thread(target=multiplexer._run_thread)
+    thread.start()
+
+    for n in range(5): input_queue_1.put({ "timestamp": n })
+    assert [ output_queue.get(timeout=1)['timestamp'] for n in range(5) ] == range(5)
+
+    # idle input_queue_2 resumes with timestamps before those already emitted
+    input_queue_2.put({ "timestamp": 2.5 })
+    input_queue_2.put({ "timestamp": 4 })
+    input_queue_2.put({ "timestamp": 6 })
+    input_queue_1.put({ "timestamp": 7 })
+    input_queue_1.put(Empty)
+    input_queue_2.put(Empty)
+    thread.join(1)
+    assert [ item['timestamp'] for item in read_queue(output_queue) ] == [ 4, 6, 7 ]   # output remains sorted
+    assert [ item['timestamp'] for item in read_queue(late_queue) ]   == [ 2.5 ]
+    assert multiplexer.late_count == 1
+
+
+def test_SortedQueueMultiplexer_reorder():
+    for options in [ { "max_lateness": 3 }, { "max_disorder": 3 } ]:
+        multiplexer   = SortedQueueMultiplexer(sort_key="timestamp", **options)
+        input_queue_1 = multiplexer.input_queue()
+        input_queue_2 = multiplexer.input_queue()
+        output_queue  = multiplexer.output_queue()
+        late_queue    = multiplexer.late_queue()
+
+        # each input is out of order by up to 2 positions / timestamps, except 0.5 which is too late
+        put_from_process(input_queue_1, [ { "timestamp": n } for n in [ 2, 0, 4, 6, 8, 10, 0.5, 12 ] ] + [ Empty ])
+        put_from_process(input_queue_2, [ { "timestamp": n } for n in [ 1, 3, 7, 5, 11, 9, 13 ] ]     + [ Empty ])
+
+        multiplexer._run_thread()
+        assert [ item['timestamp'] for item in read_queue(output_queue) ] == range(14), options
+        assert [ item['timestamp'] for item in read_queue(late_queue) ]   == [ 0.5 ], options
+        assert multiplexer.late_count == 1
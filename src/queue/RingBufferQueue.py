@@ -0,0 +1,130 @@
+from Queue import Empty, Full
+from _multiprocessing import SemLock
+from multiprocessing import Lock, Semaphore
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+import numpy
+from typing import Any, List, Union
+
+from src.util.Batch import Batch
+from src.util.Record import Record
+
+
+
+class RingBufferQueue(object):
+    """
+    Shared-memory ring buffer queue for fixed-width records, with the same put() / get() / get_nowait() surface
+    as multiprocessing.Queue(), but without pickling or pipes: items are written directly into a numpy structured array
+    in shared memory, and read back out as a Record (supporting both row['CO2'] and row.CO2)
+
+    Records are described by a numpy dtype, eg: a timestamp plus N float64 fields.
+    put() accepts dicts, Records, numpy.records, tuples and lists in dtype field order,
+    Batch() envelopes and numpy.recarray chunks are written one record per slot.
+    Queue.Empty is stored as a sentinel flag, so can still be used to mark termination of the queue
+
+    Slots are guarded by a pair of semaphores (free / used) plus a lock for head and tail counters,
+    so multiple producers and consumers are supported. The queue is shared by forking (eg: Process(args=[queue])),
+    not by pickling, the same as multiprocessing.Queue()
+
+    ### Usage:
+    queue = RingBufferQueue([ ("timestamp", numpy.int64), ("CO2", numpy.float64) ], maxsize=32767)
+    queue.put({ "timestamp": 1422886740, "CO2": 749.2 })
+    queue.put(Queue.Empty)
+    row = queue.get()               # Record(timestamp=1422886740, CO2=749.2)
+    QueueMultiplexer(queue_factory=RingBufferQueue.factory(dtype))
+    """
+
+    default_maxsize = 32767  # SEM_VALUE_MAX on macOS, slots are counted by a multiprocessing.Semaphore()
+
+
+    def __init__( self, dtype, maxsize=0 ):  # type: (Any, int) -> None
+        self.dtype   = numpy.dtype(dtype)
+        self.maxsize = maxsize if maxsize > 0 else self.default_maxsize
+        assert self.dtype.names, 'RingBufferQueue(dtype) must be a numpy structured dtype, eg: [("timestamp", numpy.int64)]'
+        assert self.maxsize <= SemLock.SEM_VALUE_MAX, \
+            'RingBufferQueue(maxsize=%d) exceeds the platform semaphore limit SEM_VALUE_MAX=%d' % (self.maxsize, SemLock.SEM_VALUE_MAX)
+
+        self._buffer = RawArray('c', self.maxsize * self.dtype.itemsize)
+        self._flags  = RawArray('B', self.maxsize)  # 1 = Queue.Empty sentinel
+        self._head   = RawValue('L', 0)             # number of items read
+        self._tail   = RawValue('L', 0)             # number of items written
+        self._lock   = Lock()
+        self._free   = Semaphore(self.maxsize)
+        self._used   = Semaphore(0)
+        self._attach()
+
+
+    def _attach( self ):  # type: () -> None
+        self._array  = numpy.frombuffer(self._buffer, dtype=self.dtype)
+        self._record = Record.type(self.dtype.names)
+
+
+    def __getstate__( self ):
+        return dict(self.__dict__, _array=None, _record=None)  # numpy views and Record types are recreated
+
+    def __setstate__( self, state ):
+        self.__dict__.update(state)
+        self._attach()
+
+
+    @staticmethod
+    def factory( dtype ):
+        """returns a queue_factory(maxsize=) for QueueMultiplexer(queue_factory=)"""
+        return lambda maxsize=0: RingBufferQueue(dtype, maxsize=maxsize)
+
+
+    ### Queue Interface
+
+    def put( self, item, block=True, timeout=None ):  # type: (Any, bool, Union[float,None]) -> None
+        if Batch.is_batch(item):
+            for row in item: self.put(row, block, timeout)
+            return
+
+        values = None if item is Empty else self._to_values(item)
+        if not self._free.acquire(block, timeout):
+            raise Full
+        with self._lock:
+            slot = self._tail.value % self.maxsize
+            if values is None:
+                self._flags[slot] = 1
+            else:
+                self._flags[slot] = 0
+                self._array[slot] = values
+            self._tail.value += 1
+        self._used.release()
+
+
+    def put_nowait( self, item ):  # type: (Any) -> None
+        return self.put(item, False)
+
+
+    def get( self, block=True, timeout=None ):  # type: (bool, Union[float,None]) -> Union[Record, type]
+        if not self._used.acquire(block, timeout):
+            raise Empty
+        with self._lock:
+            slot   = self._head.value % self.maxsize
+            is_end = self._flags[slot]
+            values = None if is_end else self._array[slot].tolist()  # copy out of the ring before releasing the slot
+            self._head.value += 1
+        self._free.release()
+        return Empty if is_end else self._record(values)
+
+
+    def get_nowait( self ):  # type: () -> Union[Record, type]
+        return self.get(False)
+
+
+    def qsize( self ):  # type: () -> int
+        return self._tail.value - self._head.value
+
+    def empty( self ):  # type: () -> bool
+        return self.qsize() == 0
+
+    def full( self ):  # type: () -> bool
+        return self.qsize() >= self.maxsize
+
+
+    def _to_values( self, item ):  # type: (Any) -> Union[tuple, List]
+        if isinstance(item, (tuple, list)) and not isinstance(item, Record):
+            return tuple(item)
+        return tuple( item[name] for name in self.dtype.names )  # dict, Record or numpy.record
@@ -0,0 +1,80 @@
+import os
+from Queue import Empty, Full
+from _multiprocessing import SemLock
+from multiprocessing import Process
+
+import numpy
+import pytest
+
+from src.readers.CSVReader import CSVReader
+from src.util.Batch import Batch
+from . import RingBufferQueue, SortedQueueMultiplexer
+
+dtype    = [ ("timestamp", numpy.int64), ("CO2", numpy.float64) ]
+datafile = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def test_RingBufferQueue():
+    queue = RingBufferQueue(dtype, maxsize=4)
+    queue.put({ "timestamp": 1, "CO2": 749.2 })
+    queue.put(( 2, 760.4 ))
+    queue.put(Batch([ { "timestamp": 3, "CO2": 1.0 } ]))
+    queue.put(Empty)
+    with pytest.raises(Full):
+        queue.put_nowait(( 5, 0.0 ))
+
+    assert queue.qsize() == 4
+    row = queue.get()
+    assert row["timestamp"] == row.timestamp == 1
+    assert row.CO2 == 749.2
+    assert [ item.timestamp for item in read_queue(queue) ] == [ 2, 3 ]
+    with pytest.raises(Empty):
+        queue.get_nowait()
+
+    # slots are reused once read
+    for n in range(10):
+        queue.put(( n, 0.0 ))
+        assert queue.get().timestamp == n
+
+
+def test_RingBufferQueue_maxsize():
+    assert RingBufferQueue(dtype).maxsize <= 32767                 # portable default, SEM_VALUE_MAX is 32767 on macOS
+    with pytest.raises(AssertionError):
+        RingBufferQueue(dtype, maxsize=SemLock.SEM_VALUE_MAX + 1)
+
+
+def producer( queue, start ):
+    for n in range(start, 1000, 2):
+        queue.put({ "timestamp": n, "CO2": n / 2.0 })
+    queue.put(Empty)
+
+
+def test_RingBufferQueue_Process():
+    multiplexer = SortedQueueMultiplexer(sort_key="timestamp", queue_factory=RingBufferQueue.factory(dtype))
+    processes   = [ Process(target=producer, args=(multiplexer.input_queue(), n)) for n in range(2) ]
+    output      = multiplexer.output_queue()
+    for process in processes: process.start()
+
+    multiplexer._run_thread()
+    for process in processes: process.join()
+
+    items = read_queue(output)
+    assert [ item.timestamp for item in items ] == range(0, 1000)
+    assert items[-1].CO2 == 999 / 2.0
+
+
+def test_RingBufferQueue_CSVReader():
+    queue = RingBufferQueue([ ("index", numpy.int64), ("CO2", numpy.float64) ], maxsize=4096)
+    rows  = read_queue( CSVReader(datafile, queue=queue, start=True, columns=[ "index", "CO2" ], batch_size=100).queue )
+    assert len(rows) == 2665
+    assert rows[0].index == 140 and rows[0].CO2 == 749.2
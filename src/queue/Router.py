@@ -0,0 +1,61 @@
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from src.event.Condition import Condition
+from src.event.ValueIndex import ValueIndex
+
+
+
+class Router(object):
+    """
+    Content-based routing of items to output queues, see: QueueMultiplexer.output_queue(route=)
+
+    Each output is registered with a route: None (receives every item), a predicate callable, or a Condition / dict.
+    Conditions with an equality or OR-list rule on a key or nested path are indexed by (path, value), see: ValueIndex,
+    so matching an item costs one hash lookup per indexed key rather than one Condition.matches() per output.
+    Candidates from the index are then fully matched, unless the indexed rule is the whole condition.
+    Predicates and conditions without an indexable rule are evaluated for every item
+
+    ### Usage:
+    router = Router()
+    router.add(0, { "sensor": [ "kitchen", "lounge" ] })
+    router.add(1, lambda item: item["CO2"] > 1000)
+    router.match({ "sensor": "kitchen", "CO2": 749.2 })    # [ 0 ]
+    """
+
+    def __init__( self ):
+        self.everything = []            # type: List[int]                       # outputs without a route
+        self.scanned    = []            # type: List[Tuple[int, Callable]]      # outputs matched by calling route(item)
+        self.index      = ValueIndex()  # type: ValueIndex
+        self.matchers   = {}            # type: Dict[int, Union[Callable, None]]  # indexed outputs -> compiled full match, None = exact
+
+
+    def __len__( self ):
+        return len(self.everything) + len(self.scanned) + len(self.index)
+
+
+    def add( self, output, route=None ):  # type: (int, Union[Callable, Condition, Dict, None]) -> None
+        if route is None:
+            self.everything.append(output)
+            return
+        if callable(route) and not isinstance(route, (dict, Condition)):
+            self.scanned.append( (output, route) )
+            return
+
+        condition = Condition(route)
+        if self.index.add(output, condition) is None:
+            self.scanned.append( (output, condition.compile()) )
+        else:
+            self.matchers[output] = condition.compile() if len(condition.paths()) > 1 else None
+
+
+    def match( self, item ):  # type: (Any) -> List[int]
+        """returns the outputs item should be delivered to, in registration order"""
+        outputs = set(self.everything)
+        for output in self.index.lookup(item):
+            matcher = self.matchers[output]
+            if matcher is None or matcher(item):
+                outputs.add(output)
+        for output, route in self.scanned:
+            if route(item):
+                outputs.add(output)
+        return sorted(outputs)
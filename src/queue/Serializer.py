@@ -0,0 +1,265 @@
+import cPickle
+import marshal
+import struct
+from Queue import Empty
+from operator import itemgetter
+
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from src.util.Batch import Batch
+from src.util.Record import Record
+
+try:
+    import msgpack                      # optional: pip install msgpack
+except ImportError:
+    msgpack = None
+
+
+
+class SerializedQueue(object):
+    """
+    Queue wrapper, encoding items with a serializer strategy before they cross a multiprocessing.Queue() or Manager().Queue()
+
+    put() sends each item (or Batch() envelope) as a single encoded str, which the underlying queue pickles as a plain
+    byte string. get() decodes it again. Both ends of the queue must use the same serializer.
+    Queue.Empty is sent as-is, and items the serializer cannot encode (eg: Watermark() with marshal) fall back
+    to default pickling inside a 1-tuple
+
+    ### Usage:
+    queue = SerializedQueue(multiprocessing.Queue(), "marshal")
+    queue = SerializedQueue(multiprocessing.Queue(), StructSerializer([ ("timestamp", "q"), ("CO2", "d") ]))
+    QueueMultiplexer(serializer="marshal")          # generated input/output queues are SerializedQueue()
+    CSVReader(filename, queue=queue, serializer="marshal")
+    """
+
+    def __init__( self, queue, serializer ):  # type: (Any, Union[str, List, 'Serializer']) -> None
+        assert hasattr(queue, 'get'), 'SerializedQueue(queue) must be of type Manager().Queue()'
+        assert hasattr(queue, 'put'), 'SerializedQueue(queue) must be of type Manager().Queue()'
+
+        self.queue      = queue
+        self.serializer = get_serializer(serializer)
+        self.dumps      = self.serializer.dumps
+        self.loads      = self.serializer.loads
+
+
+    @property
+    def _reader( self ):
+        return self.queue._reader  # multiprocessing.Queue() pipe, for select() in QueueMultiplexer and EventLoop
+
+
+    def put( self, item, block=True, timeout=None ):  # type: (Any, bool, Union[float,None]) -> None
+        if item is not Empty:
+            try:
+                item = self.dumps(item)
+            except self.serializer.errors:
+                item = (item,)  # not encodable, use default pickling
+        self.queue.put(item, block, timeout)
+
+
+    def put_nowait( self, item ):  # type: (Any) -> None
+        return self.put(item, False)
+
+
+    def get( self, block=True, timeout=None ):  # type: (bool, Union[float,None]) -> Any
+        item = self.queue.get(block, timeout)  # raises Queue.Empty if queue is empty
+        if type(item) is str: return self.loads(item)
+        if type(item) is tuple: return item[0]
+        return item  # Queue.Empty
+
+
+    def get_nowait( self ):  # type: () -> Any
+        return self.get(False)
+
+
+    def qsize( self ):  # type: () -> int
+        return self.queue.qsize()
+
+    def empty( self ):  # type: () -> bool
+        return self.queue.empty()
+
+    def full( self ):  # type: () -> bool
+        return self.queue.full()
+
+
+
+class Serializer(object):
+    """Serializer strategy: dumps(item) -> str and loads(str) -> item, for rows and Batch() envelopes"""
+
+    name   = None                         # type: str
+    errors = (TypeError, ValueError)      # type: Tuple[type]  # raised by dumps() for items that cannot be encoded
+
+    def dumps( self, item ):  # type: (Any) -> str
+        raise NotImplementedError
+
+    def loads( self, data ):  # type: (str) -> Any
+        raise NotImplementedError
+
+
+
+class PickleSerializer(Serializer):
+    """cPickle with HIGHEST_PROTOCOL, supports any picklable item"""
+
+    name = "pickle"
+
+    def __init__( self, protocol=cPickle.HIGHEST_PROTOCOL ):  # type: (int) -> None
+        self.protocol = protocol
+
+    def dumps( self, item ):  # type: (Any) -> str
+        return cPickle.dumps(item, self.protocol)
+
+    def loads( self, data ):  # type: (str) -> Any
+        return cPickle.loads(data)
+
+
+
+class MarshalSerializer(Serializer):
+    """
+    marshal, the fastest encoding of builtin types (dict, list, tuple, str, int, float)
+    Record rows are sent as dicts, Batch() envelopes are preserved
+    """
+
+    name = "marshal"
+
+    def dumps( self, item ):  # type: (Any) -> str
+        if Batch.is_batch(item):
+            return 'B' + marshal.dumps([ to_builtin(row) for row in item ])
+        return 'R' + marshal.dumps(to_builtin(item))
+
+    def loads( self, data ):  # type: (str) -> Any
+        item = marshal.loads(data[1:])
+        return Batch(item) if data[0] == 'B' else item
+
+
+
+class MsgpackSerializer(Serializer):
+    """msgpack compact binary encoding of builtin types, requires: pip install msgpack"""
+
+    name   = "msgpack"
+    errors = (TypeError, ValueError, OverflowError)
+
+    def __init__( self ):
+        assert msgpack is not None, 'MsgpackSerializer requires: pip install msgpack'
+
+    def dumps( self, item ):  # type: (Any) -> str
+        if Batch.is_batch(item):
+            return 'B' + msgpack.packb([ to_builtin(row) for row in item ], use_bin_type=False)
+        return 'R' + msgpack.packb(to_builtin(item), use_bin_type=False)
+
+    def loads( self, data ):  # type: (str) -> Any
+        item = msgpack.unpackb(data[1:], raw=True)
+        return Batch(item) if data[0] == 'B' else item
+
+
+
+class StructSerializer(Serializer):
+    """
+    Fixed-width schema rows packed with struct, the most compact encoding for flat rows of numbers
+    fields are (name, struct format) pairs, eg: [ ("timestamp", "q"), ("CO2", "d") ]
+    put() accepts dicts, Records, numpy.records, tuples and lists in field order, with values converted to the field type
+    (eg: CSVReader strings to float), get() returns Record rows
+
+    ### Usage:
+    StructSerializer([ ("timestamp", "q"), ("Temperature", "d"), ("CO2", "d"), ("Occupancy", "B") ])
+    """
+
+    name   = "struct"
+    errors = (TypeError, ValueError, KeyError, IndexError, AttributeError, struct.error)
+    header = struct.Struct('<cI')  # 'R' or 'B', number of rows
+
+
+    def __init__( self, fields ):  # type: (List[Tuple[str, str]]) -> None
+        assert fields, 'StructSerializer(fields) requires [ (name, struct format), ... ]'
+        self.fields     = [ tuple(field) for field in fields ]
+        self.names      = tuple( name for name, format in self.fields )
+        self.format     = ''.join( format for name, format in self.fields )
+        self.row        = struct.Struct('<' + self.format)
+        self.getter     = itemgetter(*self.names) if len(self.names) > 1 else lambda item: ( item[self.names[0]], )
+        self.converters = [ converter(format) for name, format in self.fields ]
+        self.record     = Record.type(self.names)
+        self.structs    = {}  # type: Dict[int, struct.Struct]  # struct for a batch of N rows, packed in a single call
+
+
+    def __getstate__( self ):
+        return { "fields": self.fields }  # structs, getters and Record types are recreated
+
+    def __setstate__( self, state ):
+        self.__init__(state['fields'])
+
+
+    def _struct( self, count ):  # type: (int) -> struct.Struct
+        if count not in self.structs:
+            self.structs[count] = struct.Struct('<' + self.format * count)
+        return self.structs[count]
+
+
+    def _values( self, item ):  # type: (Any) -> List[Any]
+        """slow path: tuples and lists in field order, or values which need converting to the field type"""
+        if isinstance(item, (tuple, list)) and not isinstance(item, Record):
+            values = item
+        else:
+            values = [ item[name] for name in self.names ]  # dict, Record or numpy.record
+        return [ convert(value) for convert, value in zip(self.converters, values) ]
+
+
+    def dumps( self, item ):  # type: (Any) -> str
+        if Batch.is_batch(item):
+            packer = self._struct(len(item))
+            try:
+                data = packer.pack(*[ value for row in item for value in self.getter(row) ])
+            except self.errors:
+                data = packer.pack(*[ value for row in item for value in self._values(row) ])
+            return self.header.pack('B', len(item)) + data
+        try:
+            data = self.row.pack(*self.getter(item))
+        except self.errors:
+            data = self.row.pack(*self._values(item))
+        return self.header.pack('R', 1) + data
+
+
+    def loads( self, data ):  # type: (str) -> Any
+        kind, count = self.header.unpack_from(data)
+        values      = self._struct(count).unpack_from(data, self.header.size)
+        record      = self.record
+        width       = len(self.names)
+        rows        = [ record(values[n:n+width]) for n in xrange(0, len(values), width) ]
+        return Batch(rows) if kind == 'B' else rows[0]
+
+
+
+serializers = {
+    "pickle":  PickleSerializer,
+    "marshal": MarshalSerializer,
+    "msgpack": MsgpackSerializer,
+    }
+
+
+def get_serializer( serializer ):  # type: (Union[str, List, Serializer]) -> Serializer
+    """returns a Serializer from a name, a list of StructSerializer fields, or an existing Serializer"""
+    if isinstance(serializer, basestring):
+        assert serializer in serializers, 'get_serializer() must be one of: %s' % (sorted(serializers),)
+        return serializers[serializer]()
+    if isinstance(serializer, (list, tuple)):
+        return StructSerializer(serializer)
+    assert hasattr(serializer, 'dumps') and hasattr(serializer, 'loads'), 'get_serializer() requires dumps() and loads()'
+    return serializer
+
+
+def serialized_queue( queue, serializer ):  # type: (Any, Union[str, List, Serializer, None]) -> Any
+    """wraps queue in a SerializedQueue, unless serializer is None"""
+    if serializer is None or isinstance(queue, SerializedQueue):
+        return queue
+    return SerializedQueue(queue, serializer)
+
+
+def to_builtin( item ):  # type: (Any) -> Any
+    """Records are sent as dicts by builtin-type serializers"""
+    return dict(item) if isinstance(item, Record) else item
+
+
+def converter( format ):  # type: (str) -> Callable
+    """value conversion for a struct format character"""
+    code = format.lstrip('<>!=@0123456789')
+    if code in 'fd':        return float
+    if code in 'bBhHiIlLqQ': return int
+    if code == '?':         return bool
+    return str
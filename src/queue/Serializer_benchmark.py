@@ -0,0 +1,94 @@
+import cPickle
+import os
+import sys
+import time
+from Queue import Empty
+from Queue import Queue as ThreadQueue
+from multiprocessing import Process, Queue
+
+from typing import Any, Dict, List, Tuple
+
+from src.readers.CSVReader import CSVReader
+from src.util.Batch import Batch
+from src.util.Record import Record
+from .Serializer import SerializedQueue, converter, get_serializer, msgpack
+
+datadir  = os.path.join( os.path.dirname(__file__), '../../data/' )
+datasets = [
+    # (filename, timestamp columns, struct fields)
+    ( 'occupancy_data/datatraining.txt', "date",
+      [ ("timestamp", "q"), ("Temperature", "d"), ("Humidity", "d"), ("Light", "d"), ("CO2", "d"), ("HumidityRatio", "d"), ("Occupancy", "B") ] ),
+    ( 'air_quality/AirQualityUCI.csv', [ "Date", "Time" ],
+      [ ("timestamp", "q") ] + [ (name, "d") for name in [ "CO(GT)", "PT08.S1(CO)", "NMHC(GT)", "C6H6(GT)", "PT08.S2(NMHC)", "NOx(GT)",
+                                                          "PT08.S3(NOx)", "NO2(GT)", "PT08.S4(NO2)", "PT08.S5(O3)", "T", "RH", "AH" ] ] ),
+    ]
+
+
+
+# Benchmark of serializer strategies for inter-process queues: python -m src.queue.Serializer_benchmark
+# "default" is the existing behaviour: multiprocessing.Queue() pickles each item with HIGHEST_PROTOCOL
+# "record" is the default behaviour with wrapper=Record rows rather than dicts
+def main():
+    for filename, timestamp, fields in datasets:
+        rows = load_rows(os.path.join(datadir, filename), timestamp, fields)
+        print
+        print "%s: %d rows x %d fields" % (filename, len(rows), len(fields))
+        print "%-10s %10s %16s %16s %12s" % ("serializer", "batch_size", "codec rows/sec", "queue rows/sec", "bytes/row")
+
+        records    = [ Record(row) for row in rows ]
+        strategies = [ "default", "record", "pickle", "marshal" ] + ([ "msgpack" ] if msgpack else []) + [ "struct" ]
+        for batch_size in [ 1, 1000 ]:
+            for name in strategies:
+                source     = records if name == "record" else rows
+                items      = source if batch_size == 1 else [ Batch(source[n:n+batch_size]) for n in range(0, len(source), batch_size) ]
+                serializer = None if name in ("default", "record") else get_serializer(fields if name == "struct" else name)
+                codec, size = benchmark_codec(items, serializer)
+                queue       = benchmark_queue(items, serializer)
+                print "%-10s %10d %16d %16d %12.1f" % (name, batch_size, len(rows) / codec, len(rows) / queue, size / float(len(rows)))
+
+
+def load_rows( filename, timestamp, fields ):  # type: (str, Any, List[Tuple[str, str]]) -> List[Dict]
+    """reads rows as dicts of numbers, the typical payload of a sensor data stream"""
+    names  = [ name for name, format in fields ]
+    types  = [ converter(format) for name, format in fields ]
+    reader = CSVReader(filename, queue=ThreadQueue(), start=True, timestamp=timestamp, columns=names[1:])
+    rows   = []
+    while True:
+        item = reader.queue.get()
+        if item is Empty: break
+        if not item.get(names[1]): continue  # blank trailing rows
+        rows.append({ name: type(float(item[name] or "nan")) for name, type in zip(names, types) })
+    return rows
+
+
+def benchmark_codec( items, serializer ):  # type: (List[Any], Any) -> Tuple[float, int]
+    """returns seconds to encode and decode every item as multiprocessing.Queue() would, plus total bytes sent"""
+    start = time.time()
+    size  = 0
+    for item in items:
+        data  = cPickle.dumps(serializer.dumps(item) if serializer else item, cPickle.HIGHEST_PROTOCOL)
+        size += len(data)
+        item  = cPickle.loads(data)
+        if serializer: serializer.loads(item)
+    return time.time() - start, size
+
+
+def consumer( queue ):
+    while queue.get() is not Empty: pass
+
+
+def benchmark_queue( items, serializer ):  # type: (List[Any], Any) -> float
+    """returns seconds to send every item through a multiprocessing.Queue() to a consumer process"""
+    queue   = SerializedQueue(Queue(), serializer) if serializer else Queue()
+    process = Process(target=consumer, args=(queue,))
+    process.start()
+    start = time.time()
+    for item in items: queue.put(item)
+    queue.put(Empty)
+    process.join()
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    CSVReader.debug = False
+    sys.exit(main())
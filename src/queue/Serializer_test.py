@@ -0,0 +1,74 @@
+import os
+from Queue import Empty
+from multiprocessing import Process, Queue
+
+import pytest
+
+from src.readers.CSVReader import CSVReader
+from src.util.Batch import Batch
+from src.util.Record import Record
+from . import SerializedQueue, SortedQueueMultiplexer, StructSerializer, Watermark
+from .Serializer import msgpack, serializers
+
+datafile = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+fields   = [ ("timestamp", "q"), ("CO2", "d") ]
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get(timeout=5)
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+@pytest.mark.parametrize("serializer", [ name for name in sorted(serializers) if name != "msgpack" or msgpack ] + [ fields ])
+def test_SerializedQueue( serializer ):
+    queue = SerializedQueue(Queue(), serializer)
+    row   = { "timestamp": 1422886740, "CO2": 749.2 }
+    queue.put(row)
+    queue.put(Batch([ row, Record(row) ]))
+    queue.put(Watermark(1422886800))  # not encodable by every serializer
+    queue.put(Empty)
+
+    items = read_queue(queue)
+    assert dict(items[0]) == row
+    assert isinstance(items[1], Batch)
+    assert [ dict(item) for item in items[1] ] == [ row, row ]
+    assert items[2].value == 1422886800
+
+
+def test_StructSerializer():
+    serializer = StructSerializer(fields + [ ("Occupancy", "B") ])
+    data       = serializer.dumps({ "timestamp": 1422886740, "CO2": "749.2", "Occupancy": "1", "Light": "585.2" })
+    row        = serializer.loads(data)
+    assert len(data) == 5 + 8 + 8 + 1  # header + fields
+    assert row.timestamp == 1422886740 and row.CO2 == 749.2 and row.Occupancy == 1
+    with pytest.raises(StructSerializer.errors):
+        serializer.dumps({ "timestamp": 1422886740 })
+
+
+def producer( queue, start ):
+    for n in range(start, 1000, 2):
+        queue.put({ "timestamp": n, "CO2": n / 2.0 })
+    queue.put(Empty)
+
+
+def test_QueueMultiplexer_serializer():
+    multiplexer = SortedQueueMultiplexer(sort_key="timestamp", serializer=fields)
+    processes   = [ Process(target=producer, args=(multiplexer.input_queue(), n)) for n in range(2) ]
+    output      = multiplexer.output_queue()
+    for process in processes: process.start()
+
+    multiplexer._run_thread()
+    for process in processes: process.join()
+    assert [ row.timestamp for row in read_queue(output) ] == range(1000)
+
+
+def test_CSVReader_serializer():
+    reader = CSVReader(datafile, queue=Queue(), start=True, timestamp="date", batch_size=1000, serializer=fields)
+    rows   = [ row for batch in read_queue(reader.queue) for row in batch ]
+    assert len(rows) == 2665
+    assert rows[0] == ( 1422886740, 749.2 )
@@ -1 +1,7 @@
-from .QueueMultiplexer import QueueMultiplexer, SortedQueueMultiplexer
+from .QueueMultiplexer import QueueMultiplexer, SortedQueueMultiplexer, Watermark
+from .RingBufferQueue import RingBufferQueue
+from .BroadcastLog import BroadcastLog, BroadcastReader
+from .SortKey import SortKey
+from .EventLoop import EventLoop, LocalQueue
+from .Serializer import SerializedQueue, Serializer, PickleSerializer, MarshalSerializer, MsgpackSerializer, StructSerializer
+from .Router import Router
@@ -1,13 +1,126 @@
 import csv
+from itertools import chain
 
+from typing import Callable, Dict, Iterator, List, Union
+
+from src.util.Record import Record
 from .FileReader import FileReader
+from .RowFilter import Predicate, RowFilter
+from .SidecarCache import SidecarCache
+from .TimestampParser import TimestampParser
 
 
 class CSVReader(FileReader):
+    header_lines     = 1
+    cache_chunk_rows = 10000
+    _reader          = None
+
+    defaults = dict(FileReader.defaults, **{
+        "timestamp":          None,         # type: Union[str, List[str]]  # eg: "date" or ["Date", "Time"]
+        "timestamp_key":      "timestamp",  # type: str   # row[timestamp_key] = int epoch seconds
+        "timestamp_dayfirst": True,         # type: bool  # "10/3/2004" = 10th March 2004
+        "cache":              False,        # type: Union[bool, str]  # True = filename.cache sidecar, str = cache directory
+        "columns":            None,         # type: List[str]  # column projection, only these columns are put onto the queue
+        "where":              None,         # type: Union[Dict, Callable]  # row predicate, see: RowFilter
+        })
+
 
     @property
     def reader( self ):
-        if not self.filehandle:
-            self.filehandle = open(self.filename, 'r', -1)
-            self._reader    = csv.DictReader(self.filehandle)
+        if self._reader is None:
+            cache = self.sidecar_cache()
+            if cache and cache.is_valid():
+                fieldnames = cache.fieldnames()
+                rows       = self.read_cache(cache)
+            else:
+                self.filehandle = self.open()
+                lines       = self.lines()
+                header_line = next(lines, '')
+                first_line  = next(lines, '')
+                fieldnames  = self.infer_fieldnames( next(csv.reader([ header_line ]), []), next(csv.reader([ first_line ]), []) )
+                rows        = csv.reader(chain([ first_line ], lines) if first_line else lines)
+                if cache:
+                    rows = self.write_cache(cache, rows, fieldnames)
+            self.transforms.insert(0, self.row_filter(fieldnames))  # raw csv values -> dict, before other transforms
+            self._reader = rows
         return self._reader
+
+
+    def create_transforms( self ):
+        transforms = FileReader.create_transforms(self)
+        if self.options['timestamp']:
+            transforms.append( self.timestamp_parser() )
+        if callable(self.options['where']):
+            transforms.append( Predicate(self.options['where']) )
+        return transforms
+
+
+    def row_filter( self, fieldnames ):  # type: (List[str]) -> RowFilter
+        """
+        columns= and where={ column: value } are applied to raw csv values, before any dict is created
+        wrapper=Record creates records directly from csv values, unless timestamp= needs to add a column to a dict
+        """
+        keep   = self.options['timestamp'] or []
+        keep   = [ keep ] if isinstance(keep, basestring) else keep  # timestamp source columns
+        record = self.wrapper is Record and not self.options['timestamp']
+        return RowFilter(fieldnames, columns=self.options['columns'], where=self.options['where'], keep=keep, record=record)
+
+
+    def timestamp_parser( self ):  # type: () -> TimestampParser
+        return TimestampParser(self.options['timestamp'], key=self.options['timestamp_key'], dayfirst=self.options['timestamp_dayfirst'])
+
+
+    @staticmethod
+    def infer_fieldnames( header, row ):  # type: (List[str], List[str]) -> List[str]
+        """headers missing a leading row number column (see: data/occupancy_data) are given an "index" column"""
+        if len(row) == len(header) + 1:
+            return [ "index" ] + header
+        return header
+
+
+    ### Sidecar Cache
+
+    def sidecar_cache( self ):  # type: () -> Union[SidecarCache, None]
+        """cache=True is ignored in follow and checkpoint modes, where the file is expected to change"""
+        if not self.options['cache'] or self.options['follow'] or self.options['checkpoint']:
+            return None
+        directory = self.options['cache'] if isinstance(self.options['cache'], basestring) else None
+        return SidecarCache(self.filename, key=self.cache_key(), directory=directory)
+
+
+    def cache_key( self ):  # type: () -> Dict
+        """the cache contains unparsed strings, so is independent of timestamp and wrapper options"""
+        return { "reader": "CSVReader" }
+
+
+    def read_cache( self, cache ):  # type: (SidecarCache) -> Iterator[tuple]
+        if self.debug: print self.__class__.__name__, 'read_cache()', cache.path
+        for chunk in cache.chunks():
+            for values in chunk.tolist():
+                yield values
+
+
+    def write_cache( self, cache, rows, fieldnames ):  # type: (SidecarCache, Iterator[List[str]], List[str]) -> Iterator[List[str]]
+        """passes through raw csv rows, writing the cache once all rows have been read"""
+        try:
+            writer = cache.writer(fieldnames)
+        except (IOError, OSError) as exception:
+            if self.debug: print self.__class__.__name__, 'write_cache()', exception
+            for row in rows: yield row
+            return
+
+        is_complete = False
+        try:
+            buffer = []
+            width  = len(fieldnames)
+            for row in rows:
+                if row: buffer.append( row[:width] + [ '' ] * (width - len(row)) )  # pad short rows, skip blank lines
+                if len(buffer) >= self.cache_chunk_rows:
+                    writer.append_rows(buffer)
+                    buffer = []
+                yield row
+            writer.append_rows(buffer)
+            writer.commit()
+            is_complete = True
+        finally:
+            if not is_complete: writer.abort()  # reader exception or generator.close() before EOF
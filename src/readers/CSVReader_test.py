@@ -0,0 +1,34 @@
+import os
+from Queue import Empty, Queue
+
+from src.util.Batch import Batch
+from .CSVReader import CSVReader
+
+datafile = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def test_CSVReader():
+    items = read_queue( CSVReader(datafile, queue=Queue(), start=True).queue )
+    assert len(items) == 2665
+    assert all( isinstance(item, dict) for item in items )
+    assert items[0]['index'] == "140"                   # header is missing the leading row number column
+    assert items[0]['date']  == "2015-02-02 14:19:00"
+
+
+def test_CSVReader_batch_size():
+    rows    = read_queue( CSVReader(datafile, queue=Queue(), start=True).queue )
+    batches = read_queue( CSVReader(datafile, queue=Queue(), start=True, batch_size=1000).queue )
+
+    assert [ len(batch) for batch in batches ] == [ 1000, 1000, 665 ]
+    assert all( isinstance(batch, Batch) for batch in batches )
+    assert [ row for batch in batches for row in Batch.unpack(batch) ] == rows
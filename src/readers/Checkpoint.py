@@ -0,0 +1,136 @@
+import hashlib
+import os
+import time
+
+import simplejson
+from typing import Dict, List, Tuple
+
+
+class Checkpoint(object):
+    """
+    Persists reader progress (file identity, byte offset, row count) to a local json state file,
+    allowing a restarted reader to resume from the last checkpoint rather than from byte 0
+
+    File identity is (st_dev, st_ino) plus a hash of the first fingerprint_bytes of the file,
+    so a replaced file (or a reused inode) is read again from the start
+
+    State is written atomically (write to .tmp + os.rename), one state file per source file inside directory
+
+    With FileReader(checkpoint_ack=True), consumers append the [first, last) row ranges they have processed
+    to an acknowledgement log next to the state file (see: Tracked.ack). The state file then holds the offset
+    of the first unacknowledged row, and a restarted reader skips rows already in the log
+
+    ### Usage:
+    checkpoint     = Checkpoint("./checkpoints", filename, interval=1.0)
+    offset, rows   = checkpoint.load(filehandle)        # (0, 0) if no valid checkpoint exists
+    checkpoint.save(filehandle, offset, rows)           # no-op if called again within interval seconds
+    skipped        = checkpoint.load_acks(rows)         # [first, last) ranges acknowledged beyond rows
+    """
+
+    fingerprint_bytes = 4096
+
+
+    def __init__( self, directory, filename, interval=1.0 ):  # type: (str, str, float) -> None
+        self.directory = directory
+        self.filename  = os.path.abspath(filename)
+        self.interval  = interval
+        self.save_time = 0
+        self.loaded    = False  # True once load() has found a valid checkpoint for this file
+        self.path      = os.path.join(directory, "%s.%s.checkpoint.json" % (
+            os.path.basename(filename), hashlib.md5(self.filename).hexdigest()[:8]
+        ))
+        self.acks_path   = self.path[:-len('.json')] + '.acks'
+        self.acks_offset = 0    # bytes of the acknowledgement log already returned by read_acks()
+
+
+    def identity( self, filehandle, length ):  # type: (file, int) -> Dict
+        stat = os.fstat(filehandle.fileno())
+        if hasattr(filehandle, 'fingerprint'):
+            fingerprint = filehandle.fingerprint(min(length, self.fingerprint_bytes))  # see: DecompressedFile
+        else:
+            position = filehandle.tell()
+            try:
+                filehandle.seek(0)
+                fingerprint = hashlib.md5(filehandle.read(min(length, self.fingerprint_bytes))).hexdigest()
+            finally:
+                filehandle.seek(position)
+        return { "dev": stat.st_dev, "ino": stat.st_ino, "fingerprint": fingerprint }
+
+
+    def load( self, filehandle ):  # type: (file) -> Tuple[int, int]
+        """returns (offset, rows) from the state file, or (0, 0) if missing or for a different file"""
+        try:
+            with open(self.path, 'r') as file:
+                state = simplejson.load(file)
+        except (IOError, ValueError):
+            return 0, 0
+
+        if state.get("filename") != self.filename:
+            return 0, 0
+        if not hasattr(filehandle, 'fingerprint') and state["offset"] > os.fstat(filehandle.fileno()).st_size:
+            return 0, 0  # truncated file, uncompressed size of a DecompressedFile is unknown
+
+        if state["identity"] != self.identity(filehandle, state["offset"]):
+            return 0, 0
+        self.loaded = True
+        return state["offset"], state["rows"]
+
+
+    def save( self, filehandle, offset, rows, force=False ):  # type: (file, int, int, bool) -> bool
+        if not force and time.time() - self.save_time < self.interval:
+            return False
+
+        state = {
+            "filename": self.filename,
+            "identity": self.identity(filehandle, offset),
+            "offset":   offset,
+            "rows":     rows,
+            "time":     time.time(),
+        }
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with open(self.path + '.tmp', 'w') as file:
+            simplejson.dump(state, file, sort_keys=True)
+            file.flush()
+            os.fsync(file.fileno())
+        os.rename(self.path + '.tmp', self.path)  # atomic on posix
+
+        self.save_time = time.time()
+        return True
+
+
+    ### Acknowledgement Log
+
+    def load_acks( self, rows ):  # type: (int) -> List[Tuple[int, int]]
+        """
+        returns the sorted, merged [first, last) ranges acknowledged beyond rows, then rewrites the log to contain only those
+        Acks are only valid for the file of a loaded checkpoint, otherwise the log is discarded
+        """
+        ranges = self.read_acks() if self.loaded else []
+        merged = []
+        for first, last in sorted( (max(first, rows), last) for first, last in ranges if last > rows ):
+            if merged and first <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(last, merged[-1][1]))
+            else:
+                merged.append((first, last))
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with open(self.acks_path + '.tmp', 'w') as file:
+            file.writelines( "%d %d\n" % (first, last) for first, last in merged )
+        os.rename(self.acks_path + '.tmp', self.acks_path)
+        self.acks_offset = sum( len("%d %d\n" % (first, last)) for first, last in merged )
+        return merged
+
+
+    def read_acks( self ):  # type: () -> List[Tuple[int, int]]
+        """returns [first, last) ranges appended to the acknowledgement log since the previous call"""
+        try:
+            with open(self.acks_path, 'r') as file:
+                file.seek(self.acks_offset)
+                data = file.read()
+        except IOError:
+            return []
+        data = data[:data.rfind('\n') + 1]  # ignore a partially written line
+        self.acks_offset += len(data)
+        return [ tuple(int(value) for value in line.split()) for line in data.splitlines() if line ]
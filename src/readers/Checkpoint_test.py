@@ -0,0 +1,94 @@
+import bz2
+import gzip
+import os
+from Queue import Empty, Queue
+from StringIO import StringIO
+
+import pytest
+
+from src.util.Batch import Batch, Tracked
+from .CSVReader import CSVReader
+
+datafile = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+class CrashingQueue(Queue):
+    """simulates a reader crash: put() raises once crash_at items are queued, the queue itself survives"""
+    def __init__( self, crash_at ):
+        Queue.__init__(self)
+        self.crash_at = crash_at
+
+    def put( self, item, *args, **kwargs ):
+        if self.crash_at is not None and self.qsize() >= self.crash_at: raise IOError("simulated crash")
+        Queue.put(self, item, *args, **kwargs)
+
+
+def test_Checkpoint( tmpdir ):
+    rows    = read_queue( CSVReader(datafile, queue=Queue(), start=True).queue )
+    options = { "checkpoint": str(tmpdir), "checkpoint_interval": 0, "batch_size": 100 }
+
+    # offsets are checkpointed once rows are put, so a reader restarted onto the same queue puts each row once
+    queue = CrashingQueue(crash_at=7)
+    with pytest.raises(IOError):
+        CSVReader(datafile, queue=queue, start=True, **options)
+    queue.crash_at = None
+    resumed = CSVReader(datafile, queue=queue, start=True, **options)
+    assert [ row for batch in read_queue( queue ) for row in batch ] == rows   # no duplicated or lost rows
+    assert resumed.count == len(rows)
+
+    finished = CSVReader(datafile, queue=Queue(), start=True, **options)
+    assert read_queue( finished.queue ) == []                      # resuming a completed file is a no-op
+
+
+def test_Checkpoint_ack( tmpdir ):
+    rows    = read_queue( CSVReader(datafile, queue=Queue(), start=True).queue )
+    options = { "checkpoint": str(tmpdir), "checkpoint_interval": 0, "batch_size": 100, "checkpoint_ack": True }
+
+    # consumer acknowledges items 0 and 2 out of order, then crashes losing every queued item
+    items = read_queue( CSVReader(datafile, queue=Queue(), start=True, **options).queue )
+    assert all( isinstance(item, Tracked) for item in items )
+    Tracked.ack(items[0])
+    Tracked.ack(items[2])
+
+    # queued rows are re-read, acknowledged rows are skipped
+    items = read_queue( CSVReader(datafile, queue=Queue(), start=True, **options).queue )
+    assert [ row for item in items for row in Batch.unpack(item) ] == rows[100:200] + rows[300:]
+    for item in items: Tracked.ack(item)
+
+    finished = CSVReader(datafile, queue=Queue(), start=True, **options)
+    assert read_queue( finished.queue ) == []
+    assert finished.saved[0] == len(rows)                          # checkpoint advanced past every acknowledged row
+
+
+def gzip_compress( data ):
+    output = StringIO()
+    with gzip.GzipFile(fileobj=output, mode='wb') as file: file.write(data)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("extension, compress", [
+    (".gz",  gzip_compress),
+    (".bz2", bz2.compress),
+])
+def test_Checkpoint_compression( tmpdir, extension, compress ):
+    rows = read_queue( CSVReader(datafile, queue=Queue(), start=True).queue )
+    with open(datafile, 'rb') as file:
+        data = file.read()
+    filename = str(tmpdir.join('datatest' + extension))
+    with open(filename, 'wb') as file: file.write(compress(data))
+
+    # resume from checkpoint inside a compressed file
+    options = { "checkpoint": str(tmpdir), "checkpoint_interval": 0 }
+    with pytest.raises(IOError):
+        CSVReader(filename, queue=CrashingQueue(crash_at=1), start=True, batch_size=1000, **options)
+    assert read_queue( CSVReader(filename, queue=Queue(), start=True, **options).queue ) == rows[1000:]
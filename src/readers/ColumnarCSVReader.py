@@ -0,0 +1,210 @@
+import csv
+from Queue import Empty
+from itertools import chain, izip_longest
+
+import numpy
+from typing import Any, Dict, List, Union
+
+from .CSVReader import CSVReader
+from .RowFilter import RowFilter
+from .SidecarCache import SidecarCache, SidecarCacheWriter
+from .TimestampParser import TimestampParser
+
+
+class ColumnarCSVReader(CSVReader):
+    """
+    Columnar CSV reader, parsing fixed-size chunks of rows straight into typed numpy.recarray chunks
+
+    Schema is inferred from the header and first chunk, or can be explicitly set (or partially overridden) via
+    schema={ column: dtype } where dtype is a numpy dtype or "datetime" for int64 epoch seconds (UTC)
+    timestamp=["Date", "Time"] adds an int64 epoch seconds column named timestamp_key
+    columns= and where={ column: value } skip unwanted rows and columns before type conversion,
+    a callable where= is passed each chunk and returns a boolean mask, eg: lambda chunk: chunk['CO2'] > 1000
+    cache=True writes typed chunks to a SidecarCache, which later runs memory-map rather than parsing
+
+    Each chunk is a single queue.put(), consumers can either use vectorized column access: chunk['CO2'].mean()
+    or iterate rows via Batch.unpack(chunk) with numpy.record supporting both row['CO2'] and row.CO2
+
+    ### Usage:
+    reader = ColumnarCSVReader(filename, schema={ "Occupancy": numpy.bool_ }, batch_size=10000, start=True)
+    for chunk in IterableQueue(reader.queue):
+        chunk['CO2']        # numpy.array(dtype=float64)
+        chunk['date']       # numpy.array(dtype=int64)
+    """
+
+    defaults = dict(CSVReader.defaults, **{
+        "batch_size": 10000,  # type: int   # rows per numpy.recarray chunk
+        "schema":     None,   # type: Dict[str, Union[str, numpy.dtype]]
+        })
+
+    inference_order = [ numpy.int64, numpy.float64, "datetime" ]  # first type to parse a whole column wins
+
+
+    def __init__(self, filename, queue=None, wrapper=None, start=False, **kwargs):
+        self.fieldnames   = None  # type: List[str]
+        self.schema       = None  # type: List[tuple]
+        self.timestamp    = None  # type: TimestampParser
+        self.header       = None  # type: List[str]
+        self.filter       = None  # type: RowFilter
+        self.rows         = []    # type: List[List[str]]
+        self.cache_writer = None  # type: SidecarCacheWriter
+        CSVReader.__init__(self, filename, queue=queue, wrapper=wrapper, start=start, **kwargs)
+
+
+    def create_transforms( self ):
+        """timestamp=[columns] is converted using vectorized TimestampParser.parse_columns() rather than per row"""
+        if self.options['timestamp']:
+            self.timestamp = self.timestamp_parser()
+        return []
+
+
+    @property
+    def reader( self ):
+        if self._reader is None:
+            self.filehandle = self.open()
+            self._reader    = csv.reader(self.lines())
+        return self._reader
+
+
+    def start( self ):
+        if self.debug: print self.__class__.__name__, 'start()', self.queue
+        cache = self.sidecar_cache()
+        if cache and cache.is_valid():
+            return self.start_from_cache(cache)
+        self.cache_writer = self.create_cache_writer(cache) if cache else None
+
+        reader = self.reader
+        self.header = next(reader, None)
+        self.rows   = []
+        first_row   = next(reader, None)
+        if first_row is not None:
+            self.fieldnames = self.infer_fieldnames(self.header, first_row)
+            self.filter     = self.row_filter(self.fieldnames)
+            self.fieldnames = self.filter.output_fieldnames()
+            for row in chain([ first_row ], reader):
+                if not self.filter.matches(row): continue
+                self.rows.append( self.filter.project(row) )
+                if len(self.rows) >= self.options['batch_size']:
+                    self.flush()
+        self.flush()
+        self.commit(force=True)
+        if self.cache_writer:
+            self.cache_writer.commit()
+        self.queue.put(Empty)
+
+
+    def flush( self ):  # type: () -> None
+        """converts buffered rows into a numpy.recarray chunk and puts it onto the queue"""
+        if self.rows:
+            if self.schema is None:
+                self.schema = self.infer_schema(self.fieldnames, self.rows)
+            chunk     = self.to_recarray(self.rows)
+            self.rows = []
+            if callable(self.options['where']):
+                chunk = chunk[ self.options['where'](chunk) ]
+            if len(chunk):
+                if self.cache_writer: self.cache_writer.append(chunk)
+                first       = self.count
+                self.count += len(chunk)
+                if self.skipped:  # rows acknowledged before a restart, see: FileReader.resume()
+                    chunk = chunk[ numpy.array([ not self.is_acknowledged(first + n) for n in range(len(chunk)) ], dtype=bool) ]
+                if len(chunk):
+                    self.output.put(chunk)
+            self.commit()
+
+
+    def on_idle( self ):
+        self.flush()
+
+
+    ### Sidecar Cache
+
+    def sidecar_cache( self ):
+        """the cache contains filtered chunks, and callable where= predicates cannot be part of the cache key"""
+        where = self.options['where']
+        if callable(where) or any( callable(rule) for rule in (where or {}).values() ):
+            return None
+        return CSVReader.sidecar_cache(self)
+
+
+    def cache_key( self ):
+        """the cache contains typed chunks, so is dependent on schema, timestamp, columns, where and batch_size options"""
+        return {
+            "reader":     "ColumnarCSVReader",
+            "schema":     { name: str(dtype) for name, dtype in (self.options['schema'] or {}).items() },
+            "timestamp":  [ self.options[key] for key in [ 'timestamp', 'timestamp_key', 'timestamp_dayfirst' ] ],
+            "columns":    self.options['columns'],
+            "where":      { name: sorted( map(str, rule) ) if isinstance(rule, (list, tuple, set, frozenset)) else [ str(rule) ]
+                            for name, rule in (self.options['where'] or {}).items() },
+            "batch_size": self.options['batch_size'],
+        }
+
+
+    def create_cache_writer( self, cache ):  # type: (SidecarCache) -> Union[SidecarCacheWriter, None]
+        try:
+            return cache.writer()
+        except (IOError, OSError) as exception:
+            if self.debug: print self.__class__.__name__, 'create_cache_writer()', exception
+            return None
+
+
+    def start_from_cache( self, cache ):  # type: (SidecarCache) -> None
+        if self.debug: print self.__class__.__name__, 'start_from_cache()', cache.path
+        for chunk in cache.chunks():
+            if self.fieldnames is None: self.fieldnames = list(chunk.dtype.names)
+            self.queue.put( chunk.view(numpy.recarray) )
+            self.count += len(chunk)
+        self.queue.put(Empty)
+
+
+    ### Schema
+
+    def infer_schema( self, fieldnames, rows ):  # type: (List[str], List[List[str]]) -> List[tuple]
+        schema  = []
+        columns = list(izip_longest(*rows, fillvalue=''))  # pad short rows
+        for n, name in enumerate(fieldnames):
+            dtype = (self.options['schema'] or {}).get(name, None)
+            if dtype is None:
+                dtype = object
+                for inferred_dtype in self.inference_order:
+                    try:
+                        self.to_column(columns[n], inferred_dtype)
+                        dtype = inferred_dtype
+                        break
+                    except (ValueError, TypeError, OverflowError): pass
+            schema.append( (name, dtype) )
+        return schema
+
+
+    @staticmethod
+    def to_column( values, dtype ):  # type: (List[str], Any) -> numpy.ndarray
+        if dtype == "datetime":
+            return numpy.array(values, dtype='datetime64[s]').astype(numpy.int64)
+        if dtype == numpy.float64:
+            try:
+                return numpy.array(values, dtype=dtype)
+            except ValueError:
+                return numpy.array([ value.strip() or 'nan' for value in values ], dtype=dtype)  # missing values
+        return numpy.array(values, dtype=dtype)
+
+
+    def to_recarray( self, rows ):  # type: (List[List[str]]) -> numpy.recarray
+        columns = list(izip_longest(*rows, fillvalue=''))  # pad short rows
+        arrays  = []
+        for n, (name, dtype) in enumerate(self.schema):
+            try:
+                if dtype == numpy.int64 and name not in (self.options['schema'] or {}):
+                    try:
+                        arrays.append( self.to_column(columns[n], dtype) )
+                        continue
+                    except (ValueError, TypeError, OverflowError):
+                        dtype = numpy.float64  # widen inferred int columns if a later chunk contains floats
+                        self.schema[n] = (name, dtype)
+                arrays.append( self.to_column(columns[n], dtype) )
+            except (ValueError, TypeError, OverflowError) as exception:
+                raise ValueError("%s: column %s does not match schema %s: %s" % (self.filename, name, dtype, exception))
+        names = [ name for name, dtype in self.schema ]
+        if self.timestamp:
+            arrays.append( self.timestamp.parse_columns([ arrays[names.index(column)] for column in self.timestamp.columns ]) )
+            names.append( self.timestamp.key )
+        return numpy.rec.fromarrays(arrays, names=names)
@@ -0,0 +1,41 @@
+import os
+from Queue import Empty, Queue
+
+import numpy
+
+from src.util.Batch import Batch
+from .ColumnarCSVReader import ColumnarCSVReader
+
+datafile = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def test_ColumnarCSVReader():
+    reader = ColumnarCSVReader(datafile, queue=Queue(), start=True, batch_size=1000)
+    chunks = read_queue( reader.queue )
+
+    assert [ len(chunk) for chunk in chunks ] == [ 1000, 1000, 665 ]
+    assert reader.fieldnames == [ "index", "date", "Temperature", "Humidity", "Light", "CO2", "HumidityRatio", "Occupancy" ]
+    assert chunks[0]['index'].dtype       == numpy.int64
+    assert chunks[0]['date'].dtype        == numpy.int64  # epoch seconds
+    assert chunks[0]['Temperature'].dtype == numpy.float64
+    assert chunks[0]['date'][0]           == 1422886740   # "2015-02-02 14:19:00"
+
+    rows = Batch.unpack( chunks[0] )
+    assert rows[0]['CO2'] == rows[0].CO2 == 749.2
+
+
+def test_ColumnarCSVReader_schema():
+    reader = ColumnarCSVReader(datafile, queue=Queue(), start=True, schema={ "Occupancy": numpy.bool_ })
+    chunks = read_queue( reader.queue )
+    assert len(chunks) == 1
+    assert chunks[0]['Occupancy'].dtype == numpy.bool_
@@ -0,0 +1,186 @@
+import bz2
+import hashlib
+import threading
+import zlib
+from Queue import Queue
+
+from typing import Union
+
+try:
+    import lzma                         # python3
+except ImportError:
+    try:
+        from backports import lzma      # python2: pip install backports.lzma
+    except ImportError:
+        lzma = None
+
+
+
+class DecompressedFile(object):
+    """
+    Read-only file-like object, streaming decompression of gzip / bz2 / xz files on a separate thread
+
+    A background thread reads and inflates compressed blocks onto a bounded Queue, so CPU-bound decompression
+    (zlib/bz2/lzma release the GIL) overlaps with CSV parsing and queue.put() in the reader thread.
+    Concatenated multi-member/multi-stream files (eg: cat a.gz b.gz > c.gz) are supported.
+
+    Implements the subset of the file interface used by FileReader: readline(), tell(), seek(), fileno(), close()
+    tell() and seek() use uncompressed offsets, seek() backwards restarts decompression from the start of the file
+
+    ### Usage:
+    filehandle = open_file("data.csv.gz")     # returns DecompressedFile, or open() for uncompressed files
+    line       = filehandle.readline()
+    """
+
+    block_size = 1024 * 1024  # compressed bytes per read()
+    maxsize    = 16           # decompressed blocks buffered ahead of the reader
+
+    magic_bytes = [
+        ("gzip", "\x1f\x8b"),
+        ("bz2",  "BZh"),
+        ("xz",   "\xfd7zXZ\x00"),
+        ]
+    extensions = {
+        ".gz":  "gzip",
+        ".bz2": "bz2",
+        ".xz":  "xz",
+        }
+
+
+    def __init__( self, filename, compression ):  # type: (str, str) -> None
+        assert compression in self.extensions.values(), 'DecompressedFile(compression) must be gzip, bz2 or xz'
+        if compression == "xz" and lzma is None:
+            raise ImportError("DecompressedFile(): xz requires python3 or: pip install backports.lzma")
+
+        self.filename    = filename
+        self.compression = compression
+        self.closed      = False
+        self.raw         = None
+        self._open()
+
+
+    def _open( self ):  # type: () -> None
+        self.raw      = open(self.filename, 'rb')
+        self.prefix   = self.raw.read(4096)   # compressed file prefix, used for Checkpoint fingerprints
+        self.raw.seek(0)
+        self.blocks   = Queue(maxsize=self.maxsize)
+        self.buffer   = ''
+        self.index    = 0                     # read position within buffer
+        self.position = 0                     # uncompressed offset of buffer[index]
+        self.eof      = False
+        self.stop     = threading.Event()
+        self.thread   = threading.Thread(target=self._decompress_thread, args=(self.raw, self.blocks, self.stop))
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def _decompressor( self ):
+        if self.compression == "gzip": return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.compression == "bz2":  return bz2.BZ2Decompressor()
+        if self.compression == "xz":   return lzma.LZMADecompressor()
+
+
+    def _decompress_thread( self, raw, blocks, stop ):  # type: (file, Queue, threading.Event) -> None
+        try:
+            decompressor = self._decompressor()
+            while not stop.is_set():
+                block = raw.read(self.block_size)
+                if not block: break
+                while block:
+                    data = decompressor.decompress(block)
+                    if data: blocks.put(data)
+                    block = getattr(decompressor, 'unused_data', '')  # start of the next concatenated member
+                    if block: decompressor = self._decompressor()
+            if hasattr(decompressor, 'flush'):
+                data = decompressor.flush()
+                if data: blocks.put(data)
+            blocks.put(None)        # EOF
+        except Exception as exception:
+            blocks.put(exception)   # re-raised in the reader thread
+
+
+    def _fill( self ):  # type: () -> bool
+        """appends the next decompressed block to the buffer, returns False at EOF"""
+        if self.eof: return False
+        block = self.blocks.get()
+        if isinstance(block, Exception): raise block
+        if block is None:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.index:] + block
+        self.index  = 0
+        return True
+
+
+    ### File Interface
+
+    def readline( self ):  # type: () -> str
+        while True:
+            end = self.buffer.find('\n', self.index)
+            if end != -1 or not self._fill():
+                end  = len(self.buffer) if end == -1 else end + 1
+                line = self.buffer[self.index:end]
+                self.position += end - self.index
+                self.index     = end
+                return line
+
+
+    def __iter__( self ):
+        return iter(self.readline, '')
+
+
+    def tell( self ):  # type: () -> int
+        return self.position
+
+
+    def seek( self, offset, whence=0 ):  # type: (int, int) -> None
+        assert whence == 0, 'DecompressedFile.seek() only supports absolute offsets'
+        if offset < self.position:
+            self.close()
+            self.closed = False
+            self._open()
+        while self.position < offset:
+            if self.index >= len(self.buffer) and not self._fill(): break
+            skip = min(offset - self.position, len(self.buffer) - self.index)
+            self.index    += skip
+            self.position += skip
+
+
+    def fingerprint( self, length ):  # type: (int) -> str
+        """md5 of the compressed file prefix, as the uncompressed stream cannot be cheaply reread"""
+        return hashlib.md5(self.prefix[:length]).hexdigest()
+
+
+    def fileno( self ):  # type: () -> int
+        return self.raw.fileno()
+
+
+    def close( self ):  # type: () -> None
+        if not self.closed:
+            self.closed = True
+            self.stop.set()
+            while self.thread.is_alive():   # unblock the decompress thread if waiting on a full queue
+                while not self.blocks.empty(): self.blocks.get_nowait()
+                self.thread.join(0.01)
+            self.raw.close()
+
+
+
+def detect_compression( filename ):  # type: (str) -> Union[str, None]
+    """detects compression by magic bytes, falling back to file extension"""
+    with open(filename, 'rb') as file:
+        header = file.read(6)
+    for compression, magic in DecompressedFile.magic_bytes:
+        if header.startswith(magic): return compression
+    for extension, compression in DecompressedFile.extensions.items():
+        if filename.endswith(extension): return compression
+    return None
+
+
+def open_file( filename, compression="auto" ):  # type: (str, Union[str, None]) -> Union[file, DecompressedFile]
+    """opens filename for reading, with transparent decompression if compression="auto" or gzip / bz2 / xz"""
+    if compression == "auto":
+        compression = detect_compression(filename)
+    if compression:
+        return DecompressedFile(filename, compression)
+    return open(filename, 'r', -1)
@@ -0,0 +1,41 @@
+import bz2
+import gzip
+import os
+from Queue import Empty, Queue
+from StringIO import StringIO
+
+import pytest
+
+from .CSVReader import CSVReader
+
+datafile = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def gzip_compress( data ):
+    output = StringIO()
+    with gzip.GzipFile(fileobj=output, mode='wb') as file: file.write(data)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("extension, compress", [
+    (".gz",  lambda data: gzip_compress(data[:5000]) + gzip_compress(data[5000:])),  # multi-member gzip
+    (".bz2", lambda data: bz2.compress(data)),
+])
+def test_DecompressedFile( tmpdir, extension, compress ):
+    rows = read_queue( CSVReader(datafile, queue=Queue(), start=True).queue )
+    with open(datafile, 'rb') as file:
+        data = file.read()
+
+    filename = str(tmpdir.join('datatest' + extension))
+    with open(filename, 'wb') as file: file.write(compress(data))
+    assert read_queue( CSVReader(filename, queue=Queue(), start=True).queue ) == rows
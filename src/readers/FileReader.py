@@ -1,18 +1,59 @@
 import atexit
+import heapq
+import os
+import time
 from Queue import Empty
+from collections import deque
 from multiprocessing import Queue
 
+from typing import Any, Callable, Iterator, List, Union
+
+from src.queue.Serializer import serialized_queue
+from src.util.Batch import BatchWriter, Tracked
+from .Checkpoint import Checkpoint
+from .DecompressedFile import DecompressedFile, open_file
+
 
 class FileReader:
-    debug = True
-    
-    def __init__(self, filename, queue=None, wrapper=dict, start=False):
+    debug        = True
+    header_lines = 0  # number of lines to skip when reopening a rotated or truncated file in follow mode
+
+    defaults = {
+        "batch_size":     1,      # type: int    # rows per queue.put(); batch_size > 1 emits Batch() envelopes
+        "batch_timeout":  None,   # type: float  # seconds before a partial batch is flushed
+        "follow":         False,  # type: bool   # tail -F: keep reading lines as they are appended to the file
+        "follow_timeout": None,   # type: float  # seconds without new data before follow mode stops, None = until stop()
+        "poll_min":       0.001,  # type: float  # adaptive polling interval, doubles while idle up to poll_max
+        "poll_max":       1.0,    # type: float
+        "checkpoint":     None,   # type: str    # directory for checkpoint state files, allowing resume after restart
+        "checkpoint_interval": 1.0,  # type: float  # minimum seconds between checkpoint writes, 0 = every put()
+        "checkpoint_ack": False,     # type: bool   # items are Tracked() envelopes, rows are checkpointed once consumers Tracked.ack()
+        "compression":    "auto", # type: str    # "auto" (magic bytes / extension), None, "gzip", "bz2" or "xz"
+        "serializer":     None,   # type: str    # queue is wrapped in a SerializedQueue: "pickle", "marshal", "msgpack" or StructSerializer fields
+        }
+
+    def __init__(self, filename, queue=None, wrapper=dict, start=False, **kwargs):
         if self.debug: print self.__class__.__name__, '__init__()', queue
-        
-        self.queue      = queue if queue is not None else Queue()
+
+        self.options    = dict(self.defaults, **kwargs)
+        self.queue      = serialized_queue(queue if queue is not None else Queue(), self.options['serializer'])
         self.filename   = filename
         self.filehandle = None
         self.wrapper    = wrapper
+        self.offset     = 0     # byte offset after the last line read
+        self.count      = 0     # number of items put onto the queue, including those before a checkpoint resume
+        self.is_running = False
+        self.checkpoint = Checkpoint(self.options['checkpoint'], filename, self.options['checkpoint_interval']) \
+                          if self.options['checkpoint'] else None
+        self.position   = (0, 0)   # (count, offset) to checkpoint: rows put, or with checkpoint_ack rows acknowledged
+        self.saved      = (0, 0)   # (count, offset) of the last checkpoint write
+        self.pending    = deque()  # (count, offset) after each put(), awaiting acknowledgement
+        self.acked      = []       # heap of acknowledged [first, last) row ranges, not yet contiguous with acked_count
+        self.acked_count = 0       # every row before acked_count has been acknowledged
+        self.skipped    = deque()  # [first, last) row ranges acknowledged before a restart, which are not put again
+        self.output     = TrackedQueue(self.queue, self) if self.checkpoint and self.options['checkpoint_ack'] else self.queue
+        self.writer     = BatchWriter(self.output, self.options['batch_size'], self.options['batch_timeout'])
+        self.transforms = self.create_transforms()
 
         atexit.register(self.onExit)
         if start == True:
@@ -22,15 +63,169 @@ class FileReader:
     @property
     def reader( self ):
         if not self.filehandle:
-            self.filehandle = open(self.filename, 'r', -1)
-        return self.filehandle
+            self.filehandle = self.open()
+        return self.lines()
+
+
+    def open( self ):  # type: () -> file
+        """opens self.filename, with streaming decompression of gzip / bz2 / xz files on a separate thread"""
+        filehandle = open_file(self.filename, self.options['compression'])
+        assert not (self.options['follow'] and isinstance(filehandle, DecompressedFile)), \
+            'FileReader(follow=True) does not support compressed files'
+        return filehandle
+
+
+    def lines( self ):  # type: () -> Iterator[str]
+        """
+        generator of lines from self.filehandle, using readline() to keep self.offset accurate
+
+        In follow mode, waits for new lines to be appended using adaptive polling: the poll interval doubles
+        while idle (up to poll_max) and resets to poll_min as soon as data arrives, so idle files cost almost no CPU.
+        Rotated files (new inode) are reopened, truncated files are reread from the start,
+        skipping header_lines in both cases.
+
+        With checkpoint= the header_lines are returned, then reading resumes from the last checkpointed offset
+        """
+        self.is_running = True
+        if self.checkpoint:
+            for line in self.resume(): yield line
+
+        partial   = ''
+        skip      = 0  # header_lines still to be read from a reopened file, which may not have been written yet
+        poll      = self.options['poll_min']
+        idle_time = time.time()
+        while self.is_running:
+            line = self.filehandle.readline()
+            if line:
+                if self.options['follow'] and not line.endswith('\n'):
+                    partial += line  # wait for the rest of a partially written line
+                    continue
+                self.offset = self.filehandle.tell()
+                poll        = self.options['poll_min']
+                idle_time   = time.time()
+                if skip: skip -= 1
+                else:    yield partial + line
+                partial = ''
+                continue
+
+            if not self.options['follow']:
+                if partial: yield partial
+                break
+
+            self.on_idle()
+            if self.options['follow_timeout'] is not None and time.time() - idle_time >= self.options['follow_timeout']:
+                break
+            if self.is_rotated():
+                self.reopen()
+                partial = ''
+                skip    = self.header_lines
+                continue
+
+            time.sleep(poll)
+            poll = min(poll * 2, self.options['poll_max'])
+        self.is_running = False
+
+
+    def resume( self ):  # type: () -> List[str]
+        """
+        seeks to the last checkpoint offset, returning header_lines to be reparsed
+        With checkpoint_ack, rows acknowledged after that offset are loaded into self.skipped
+        """
+        (offset, self.count) = self.checkpoint.load(self.filehandle)
+        header = [ line for line in [ self.filehandle.readline() for n in range(self.header_lines) ] if line ]
+        if offset > self.filehandle.tell():
+            if self.debug: print self.__class__.__name__, 'resume()', self.filename, offset, self.count
+            self.filehandle.seek(offset)
+        self.offset   = self.filehandle.tell()
+        self.position = self.saved = (self.count, self.offset)
+
+        if self.options['checkpoint_ack']:
+            self.skipped     = deque(self.checkpoint.load_acks(self.count))
+            self.acked       = list(self.skipped)
+            self.acked_count = self.output.first = self.count
+            self.checkpoint.save(self.filehandle, self.offset, self.count, force=True)  # acks are only loaded for a valid checkpoint
+        return header
+
+
+    def is_acknowledged( self, index ):  # type: (int) -> bool
+        """True if row index was acknowledged before a restart, called with increasing index"""
+        while self.skipped and self.skipped[0][1] <= index:
+            self.skipped.popleft()
+        return bool(self.skipped) and self.skipped[0][0] <= index
+
+
+    def commit( self, force=False ):  # type: (bool) -> None
+        """
+        called after items have been put onto the queue, to checkpoint the current offset
+        With checkpoint_ack, the checkpoint is the offset of the last put() whose rows have all been acknowledged
+        """
+        if not self.checkpoint: return
+        if self.options['checkpoint_ack']:
+            if not self.pending or self.pending[-1][0] != self.count:
+                self.pending.append((self.count, self.offset))
+            for ack in self.checkpoint.read_acks():
+                heapq.heappush(self.acked, ack)
+            while self.acked and self.acked[0][0] <= self.acked_count:
+                self.acked_count = max(self.acked_count, heapq.heappop(self.acked)[1])
+            while self.pending and self.pending[0][0] <= self.acked_count:
+                self.position = self.pending.popleft()
+        else:
+            self.position = (self.count, self.offset)
+
+        if self.position != self.saved:
+            (count, offset) = self.position
+            if self.checkpoint.save(self.filehandle, offset, count, force=force):
+                self.saved = self.position
+
+
+    def is_rotated( self ):  # type: () -> bool
+        """returns True if filename now points to a new file (log rotation) or the file has been truncated"""
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return False  # rotated file has not yet been recreated
+        fstat = os.fstat(self.filehandle.fileno())
+        return (stat.st_ino, stat.st_dev) != (fstat.st_ino, fstat.st_dev) or stat.st_size < self.filehandle.tell()
+
+
+    def reopen( self ):  # type: () -> None
+        if self.debug: print self.__class__.__name__, 'reopen()', self.filename
+        self.filehandle.close()
+        self.filehandle = self.open()
+        self.offset     = self.filehandle.tell()
+        self.pending.clear()  # offsets in the rotated file no longer apply
+
+
+    def on_idle( self ):  # type: () -> None
+        """called in follow mode while waiting for new data, flushes any partial batch"""
+        self.writer.flush()
+        self.commit()
+
+
+    def stop( self ):  # type: () -> None
+        """stops follow mode after the current poll interval"""
+        self.is_running = False
+
+
+    def create_transforms( self ):  # type: () -> List[Callable]
+        """list of picklable callables applied to each item before wrapper(), returning None will skip the item"""
+        return []
 
 
     def start( self ):
         if self.debug: print self.__class__.__name__, 'start()', self.queue
         for linenumber, item in enumerate(self.reader):
+            item = apply_transforms(self.transforms, item)
+            if item is None: continue
+            if self.skipped and self.is_acknowledged(self.count):
+                self.count += 1
+                continue
             output = self.wrapper(item)
-            self.queue.put(output)
+            self.count += 1
+            if self.writer.put(output):
+                self.commit()
+        self.writer.flush()
+        self.commit(force=True)
         self.queue.put(Empty)
 
 
@@ -42,3 +237,26 @@ class FileReader:
         try:
             self.filehandle.close()
         except: pass
+
+
+
+def apply_transforms( transforms, item ):  # type: (List[Callable], Any) -> Any
+    for transform in transforms:
+        item = transform(item)
+        if item is None: break
+    return item
+
+
+
+class TrackedQueue(object):
+    """put() wraps each item in a Tracked() envelope, with the rows counted by reader since the previous put()"""
+
+    def __init__( self, queue, reader ):  # type: (Any, FileReader) -> None
+        self.queue  = queue
+        self.reader = reader
+        self.first  = 0
+
+    def put( self, item, block=True, timeout=None ):  # type: (Any, bool, Union[float, None]) -> None
+        last = self.reader.count
+        self.queue.put(Tracked(item, self.reader.checkpoint.acks_path, self.first, last), block, timeout)
+        self.first = last
@@ -0,0 +1,63 @@
+import os
+import threading
+from Queue import Empty, Queue
+
+from .CSVReader import CSVReader
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def test_FileReader_follow( tmpdir ):
+    filename = str(tmpdir.join('follow.csv'))
+    with open(filename, 'w') as file: file.write('a,b\n1,2\n')
+
+    reader = CSVReader(filename, queue=Queue(), follow=True, follow_timeout=None, poll_max=0.01)
+    idle   = threading.Event()
+    def on_idle():
+        idle.set()
+        CSVReader.on_idle(reader)
+    reader.on_idle = on_idle
+
+    def wait_for_idle():  # two idle polls, so everything written before the call has been read
+        for n in range(2):
+            idle.clear()
+            assert idle.wait(5)
+
+    def get():
+        item = reader.queue.get(timeout=5)
+        return (item['a'], item['b'])
+
+    thread = threading.Thread(target=reader.start)
+    thread.start()
+    assert get() == ('1','2')
+
+    with open(filename, 'a') as file:
+        file.write('3,4\n5,'); file.flush()                           # partially written line
+        assert get() == ('3','4')
+        wait_for_idle()
+        file.write('6\n')
+    assert get() == ('5','6')
+
+    os.rename(filename, filename + '.1')                              # log rotation
+    with open(filename, 'w') as file: file.write('a,b\n7,8\n9,10\n')
+    assert [ get(), get() ] == [ ('7','8'), ('9','10') ]
+
+    with open(filename, 'w') as file: file.write('a,b\n11,12\n')      # truncation
+    assert get() == ('11','12')
+
+    reader.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert read_queue( reader.queue ) == []                          # Queue.Empty is put after stop()
+
+    # follow_timeout ends follow mode once the file has been idle for follow_timeout seconds
+    reader = CSVReader(filename, queue=Queue(), follow=True, follow_timeout=0, start=True)
+    assert [ (item['a'], item['b']) for item in read_queue( reader.queue ) ] == [ ('11','12') ]
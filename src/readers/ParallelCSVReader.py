@@ -0,0 +1,111 @@
+import csv
+import mmap
+import multiprocessing
+import os
+from Queue import Empty
+
+from typing import Any, Callable, List, Tuple
+
+from src.util.Batch import Batch
+from src.util.MultiProcessing import MultiProcessing
+from .CSVReader import CSVReader
+from .DecompressedFile import detect_compression
+from .FileReader import apply_transforms
+from .RowFilter import RowFilter
+
+
+class ParallelCSVReader(CSVReader):
+    """
+    Parallel CSV reader, splitting a single large file into line-aligned byte ranges
+    which are parsed in MultiProcessing().GlobalProcessPool() workers
+
+    Workers return their rows already packed into batch_size Batch() envelopes, which are put onto the queue unchanged.
+    Byte ranges are in file order and pool.imap() returns results in submission order,
+    so rows are put onto the queue in original file order, which can then be registered as
+    a SortedQueueMultiplexer input_queue alongside other (sorted) sensor files
+
+    NOTE: assumes no quoted newlines inside CSV fields, as byte ranges are aligned to the next "\\n"
+    NOTE: ProcessPool workers cannot create nested pools, so call .start() from the main process
+    NOTE: compressed files, follow=, checkpoint= and cache= fall back to a sequential CSVReader.start()
+
+    ### Usage:
+    reader = ParallelCSVReader(filename, queue=Manager().Queue(), chunk_bytes=16*1024*1024, batch_size=1000)
+    reader.start()
+    """
+
+    defaults = dict(CSVReader.defaults, **{
+        "chunk_bytes": 16 * 1024 * 1024,  # type: int   # approximate size of each byte range
+        "ncpus":       None,              # type: int   # GlobalProcessPool(ncpus=) if pool does not yet exist
+        })
+
+
+    def start( self ):
+        if detect_compression(self.filename) or self.options['follow'] or self.options['checkpoint'] or self.options['cache']:
+            return CSVReader.start(self)  # compressed files, follow, checkpoint and cache modes read the file sequentially
+
+        if self.debug: print self.__class__.__name__, 'start()', self.queue
+        fieldnames, byte_ranges = self.byte_ranges()
+        if byte_ranges:
+            count = len(byte_ranges)
+            pool  = MultiProcessing().GlobalProcessPool(ncpus=self.options['ncpus'] or min(count, 1 + multiprocessing.cpu_count()))
+            row_filter = self.row_filter(fieldnames)  # columns= and where= are applied inside the workers, reducing IPC
+            for items in pool.imap(read_byte_range, [self.filename]*count, byte_ranges, [fieldnames]*count, [self.wrapper]*count,
+                                   [self.transforms]*count, [row_filter]*count, [self.options['batch_size']]*count):
+                for item in items:
+                    self.queue.put(item)  # Batch() envelopes are forwarded without unpacking
+                    self.count += len(item) if isinstance(item, Batch) else 1
+        self.queue.put(Empty)
+
+
+    def byte_ranges( self ):  # type: () -> Tuple[List[str], List[Tuple[int,int]]]
+        """returns the csv header fieldnames and a list of (start, end) byte offsets aligned to line boundaries"""
+        return split_byte_ranges(self.filename, self.options['chunk_bytes'])
+
+
+
+def split_byte_ranges( filename, chunk_bytes ):  # type: (str, int) -> Tuple[List[str], List[Tuple[int,int]]]
+    with open(filename, 'rb') as filehandle:
+        size = os.fstat(filehandle.fileno()).st_size
+        if size == 0: return [], []
+
+        memory = mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header_end = memory.find('\n') + 1 or size
+            first_end  = memory.find('\n', header_end) + 1 or size
+            fieldnames = CSVReader.infer_fieldnames( next(csv.reader([ memory[0:header_end] ]), []),
+                                                     next(csv.reader([ memory[header_end:first_end] ]), []) )
+
+            byte_ranges = []
+            start = header_end
+            while start < size:
+                end = memory.find('\n', min(start + chunk_bytes, size) - 1) + 1 or size  # align to end of line
+                byte_ranges.append( (start, end) )
+                start = end
+            return fieldnames, byte_ranges
+        finally:
+            memory.close()
+
+
+def read_byte_range( filename, byte_range, fieldnames, wrapper=dict, transforms=(), row_filter=None, batch_size=1 ):
+    # type: (str, Tuple[int,int], List[str], Callable, List[Callable], RowFilter, int) -> List[Any]
+    """
+    ProcessPool worker function: parses a line-aligned (start, end) byte range of a csv file
+    returns a list of rows, or with batch_size > 1 a list of Batch() envelopes ready to be put onto the queue
+    """
+    transforms = [ row_filter or RowFilter(fieldnames) ] + list(transforms)
+    (start, end) = byte_range
+    with open(filename, 'rb') as filehandle:
+        memory = mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            lines = memory[start:end].splitlines(True)
+        finally:
+            memory.close()
+
+    output = []
+    for values in csv.reader(lines):
+        row = apply_transforms(transforms, values)
+        if row is not None:
+            output.append( wrapper(row) )
+    batch_size = max(1, int(batch_size or 1))
+    if batch_size == 1: return output
+    return [ Batch(output[n:n+batch_size]) for n in range(0, len(output), batch_size) ]
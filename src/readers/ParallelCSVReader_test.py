@@ -0,0 +1,48 @@
+import os
+from Queue import Empty, Queue
+
+from src.util.Batch import Batch
+from .CSVReader import CSVReader
+from .ParallelCSVReader import ParallelCSVReader, read_byte_range, split_byte_ranges
+
+datafile = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def test_ParallelCSVReader_byte_ranges():
+    rows = read_queue( CSVReader(datafile, queue=Queue(), start=True).queue )
+
+    fieldnames, byte_ranges = split_byte_ranges(datafile, chunk_bytes=10000)
+    assert len(byte_ranges) > 10
+    assert all( byte_ranges[n][1] == byte_ranges[n+1][0] for n in range(len(byte_ranges)-1) )  # contiguous
+
+    # pytest doesn't like running code in separate processes, so run workers synchronously
+    parallel_rows = []
+    for byte_range in byte_ranges:
+        parallel_rows += read_byte_range(datafile, byte_range, fieldnames)
+    assert parallel_rows == rows
+
+    # workers pack rows into Batch() envelopes, which the reader forwards without unpacking
+    batches = read_byte_range(datafile, byte_ranges[0], fieldnames, batch_size=100)
+    assert all( isinstance(batch, Batch) and len(batch) <= 100 for batch in batches )
+    assert [ row for batch in batches for row in batch ] == read_byte_range(datafile, byte_ranges[0], fieldnames)
+
+
+def test_ParallelCSVReader_fallback( tmpdir ):
+    rows = read_queue( CSVReader(datafile, queue=Queue(), start=True).queue )
+
+    # checkpoint= and cache= fall back to a sequential CSVReader.start(), rather than being ignored
+    for options in [ { "checkpoint": str(tmpdir) }, { "cache": str(tmpdir) }, { "cache": str(tmpdir) } ]:
+        reader = ParallelCSVReader(datafile, queue=Queue(), start=True, chunk_bytes=10000, **options)
+        assert read_queue( reader.queue ) == rows, options
+        assert reader.count == len(rows)
+    assert any( name.endswith('.cache') for name in os.listdir(str(tmpdir)) )  # sidecar cache written, then read
@@ -0,0 +1,117 @@
+from itertools import izip
+
+from typing import Any, Callable, Dict, List, Union
+
+from src.util.Record import Record
+
+
+class RowFilter(object):
+    """
+    Column projection and predicate pushdown for CSV rows
+
+    Converts the raw list of fields from csv.reader() into a dict, but only for rows matching where=,
+    and only containing the columns= requested, so discarded rows and columns never cost a dict or a queue.put()
+
+    where= dict rules are evaluated against the raw string fields, before the dict is constructed:
+        { "Occupancy": "1" }                             # equality, non-string values are compared as str(value)
+        { "Occupancy": [ "0", "1" ] }                    # list is an OR statement
+        { "CO2": lambda value: float(value) > 1000 }     # callable is passed the raw string value
+    where= callable is evaluated against the (projected) row dict, after transforms such as timestamp=
+
+    Without columns= or where= rows are identical to csv.DictReader(), including restkey=None for extra fields
+    record=True returns a Record (see: src/util/Record.py) rather than a dict, without constructing an intermediate dict
+
+    ### Usage:
+    row_filter = RowFilter(fieldnames, columns=["date", "CO2"], where={ "Occupancy": "1" })
+    row        = row_filter(values)                  # dict, or None if filtered out
+    """
+
+    def __init__( self, fieldnames, columns=None, where=None, keep=(), record=False ):
+        # type: (List[str], Union[List[str],None], Union[Dict,Callable,None], List[str], bool) -> None
+        self.fieldnames = list(fieldnames)
+        self.columns    = list(columns) + [ column for column in keep if column not in columns ] if columns else None
+        self.indices    = None
+        self.sets       = []    # type: List[tuple]  # (index, frozenset) membership tests
+        self.tests      = []    # type: List[tuple]  # (index, callable) tests
+        if isinstance(where, dict):
+            self.compile_rules(where)
+
+        if self.columns:
+            missing = [ column for column in self.columns if column not in self.fieldnames ]
+            assert not missing, 'RowFilter(columns) not found in csv header: %s' % missing
+            self.indices = [ (column, self.fieldnames.index(column)) for column in self.columns ]
+        self.record = Record.type(self.output_fieldnames()) if record else None
+
+
+    def compile_rules( self, where ):  # type: (Dict) -> None
+        """compiles where={ column: rule } into set membership and callable tests on raw string fields by index"""
+        for column, rule in where.items():
+            assert column in self.fieldnames, 'RowFilter(where) column not found in csv header: %s' % column
+            index = self.fieldnames.index(column)
+            if callable(rule):
+                self.tests.append( (index, rule) )
+            elif isinstance(rule, (list, tuple, set, frozenset)):
+                self.sets.append( (index, frozenset( str(value) for value in rule )) )
+            else:
+                self.sets.append( (index, frozenset([ str(rule) ])) )
+
+
+    def __getstate__( self ):
+        return dict(self.__dict__, record=self.record is not None)  # generated Record types are not picklable
+
+    def __setstate__( self, state ):
+        self.__dict__.update(state)
+        self.record = Record.type(self.output_fieldnames()) if state['record'] else None
+
+
+    def matches( self, values ):  # type: (List[str]) -> bool
+        if not values: return False  # csv.DictReader skips blank lines
+        length = len(values)
+        for index, rule in self.sets:
+            if index >= length or values[index] not in rule: return False
+        for index, rule in self.tests:
+            if index >= length or not rule(values[index]): return False
+        return True
+
+
+    def project( self, values ):  # type: (List[str]) -> List[str]
+        """returns values for columns= in order, as used by ColumnarCSVReader"""
+        if self.indices is None: return values
+        return [ values[index] if index < len(values) else '' for column, index in self.indices ]
+
+
+    def output_fieldnames( self ):  # type: () -> List[str]
+        return self.columns or self.fieldnames
+
+
+    def __call__( self, values ):  # type: (List[str]) -> Union[Dict[str,Any],Record,None]
+        if not self.matches(values): return None
+
+        if self.record is not None:
+            if self.indices is not None:
+                return self.record([ values[index] if index < len(values) else None for column, index in self.indices ])
+            if len(values) == len(self.fieldnames):
+                return self.record(values)
+            return self.record( (list(values) + [ None ] * len(self.fieldnames))[:len(self.fieldnames)] )  # extra fields are dropped
+
+        if self.indices is not None:
+            return { column: values[index] if index < len(values) else None for column, index in self.indices }
+
+        row = dict(izip(self.fieldnames, values))
+        if len(values) != len(self.fieldnames):  # csv.DictReader compatibility for ragged rows
+            if len(values) > len(self.fieldnames):
+                row[None] = values[len(self.fieldnames):]
+            else:
+                for column in self.fieldnames[len(values):]: row[column] = None
+        return row
+
+
+
+class Predicate(object):
+    """FileReader transform for a where= callable, returning None to filter out the row"""
+
+    def __init__( self, where ):  # type: (Callable) -> None
+        self.where = where
+
+    def __call__( self, row ):  # type: (Dict) -> Union[Dict,None]
+        return row if self.where(row) else None
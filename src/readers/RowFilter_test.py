@@ -0,0 +1,53 @@
+import os
+from Queue import Empty, Queue
+
+from .CSVReader import CSVReader
+from .ColumnarCSVReader import ColumnarCSVReader
+from .ParallelCSVReader import read_byte_range, split_byte_ranges
+from .RowFilter import RowFilter
+
+datafile = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def test_RowFilter():
+    rows     = read_queue( CSVReader(datafile, queue=Queue(), start=True).queue )
+    expected = [ { "date": row['date'], "CO2": row['CO2'] } for row in rows if row['Occupancy'] == "1" ]
+
+    options  = { "columns": [ "date", "CO2" ], "where": { "Occupancy": 1 } }
+    assert read_queue( CSVReader(datafile, queue=Queue(), start=True, **options).queue ) == expected
+    assert read_queue( CSVReader(datafile, queue=Queue(), start=True, where={ "Occupancy": [ "0", "1" ] }).queue ) == rows
+    assert read_queue( CSVReader(datafile, queue=Queue(), start=True, columns=[ "date" ], where={
+        "CO2": lambda value: float(value) > 1000
+    }).queue ) == [ { "date": row['date'] } for row in rows if float(row['CO2']) > 1000 ]
+
+    # callable where= is applied after transforms, timestamp source columns are kept
+    items = read_queue( CSVReader(datafile, queue=Queue(), start=True, columns=[ "CO2" ], timestamp="date",
+                                  where=lambda row: row['timestamp'] < 1422886799).queue )
+    assert items == [ { "CO2": "749.2", "date": "2015-02-02 14:19:00", "timestamp": 1422886740 } ]
+
+    fieldnames, byte_ranges = split_byte_ranges(datafile, chunk_bytes=10000)
+    row_filter    = RowFilter(fieldnames, **options)
+    parallel_rows = []
+    for byte_range in byte_ranges:
+        parallel_rows += read_byte_range(datafile, byte_range, fieldnames, row_filter=row_filter)
+    assert parallel_rows == expected
+
+    reader = ColumnarCSVReader(datafile, queue=Queue(), start=True, **options)
+    chunks = read_queue( reader.queue )
+    assert reader.fieldnames == [ "date", "CO2" ]
+    assert chunks[0].dtype.names == ( "date", "CO2" )
+    assert sum( len(chunk) for chunk in chunks ) == len(expected)
+    assert chunks[0]['CO2'][0] == float(expected[0]['CO2'])
+
+    chunks = read_queue( ColumnarCSVReader(datafile, queue=Queue(), start=True, where=lambda chunk: chunk['CO2'] > 1000).queue )
+    assert sum( len(chunk) for chunk in chunks ) == len([ row for row in rows if float(row['CO2']) > 1000 ])
@@ -0,0 +1,153 @@
+import hashlib
+import mmap
+import os
+
+import numpy
+import simplejson
+from typing import Any, Dict, Iterator, List, Union
+
+
+class SidecarCache(object):
+    """
+    Binary columnar sidecar cache for CSV files, allowing repeat runs to skip CSV parsing
+
+    The cache is two files: filename.cache containing the raw bytes of each numpy structured array chunk,
+    and filename.cache.json containing the chunk index (offset, length, dtype) and the cache key
+    The cache is only valid if the source path, size and mtime, and reader key (eg: schema) all match,
+    otherwise it is rebuilt by the next reader. The index is written last, so a partial cache is never used.
+
+    Cached chunks are memory-mapped and returned with zero parsing, numpy object columns are stored as
+    fixed-width strings sized to the longest value in each chunk
+
+    ### Usage:
+    cache = SidecarCache(filename, key={ "reader": "CSVReader" })   # directory=None writes next to filename
+    if cache.is_valid():
+        for chunk in cache.chunks(): pass                           # read-only numpy structured arrays
+    else:
+        writer = cache.writer()
+        writer.append(chunk)
+        writer.commit()
+    """
+
+    def __init__( self, filename, key=None, directory=None ):  # type: (str, Dict, Union[str,None]) -> None
+        self.filename = os.path.abspath(filename)
+        self.key      = simplejson.loads(simplejson.dumps(key or {}, sort_keys=True))  # normalize for comparison
+        if directory:
+            self.path = os.path.join(directory, "%s.%s.cache" % (
+                os.path.basename(filename), hashlib.md5(self.filename).hexdigest()[:8]
+            ))
+        else:
+            self.path = self.filename + '.cache'
+        self.index_path = self.path + '.json'
+
+
+    def source( self ):  # type: () -> Dict
+        stat = os.stat(self.filename)
+        return { "path": self.filename, "size": stat.st_size, "mtime": stat.st_mtime }
+
+
+    def index( self ):  # type: () -> Union[Dict,None]
+        try:
+            with open(self.index_path, 'r') as file:
+                return simplejson.load(file)
+        except (IOError, ValueError):
+            return None
+
+
+    def is_valid( self ):  # type: () -> bool
+        index = self.index()
+        try:
+            return bool( index
+                     and index["source"] == self.source()
+                     and index["key"]    == self.key
+                     and os.path.getsize(self.path) == index["size"] )
+        except OSError:
+            return False
+
+
+    def fieldnames( self ):  # type: () -> List[str]
+        return self.index()["fieldnames"]
+
+
+    def chunks( self ):  # type: () -> Iterator[numpy.ndarray]
+        """generator of read-only numpy structured arrays, memory-mapped from the cache file"""
+        index = self.index()
+        if not index["size"]: return
+        with open(self.path, 'rb') as file:
+            memory = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        for chunk in index["chunks"]:
+            dtype = numpy.dtype([ tuple(field) for field in chunk["dtype"] ])
+            yield numpy.frombuffer(memory, dtype=dtype, count=chunk["length"], offset=chunk["offset"])
+
+
+    def writer( self, fieldnames=None ):  # type: (List[str]) -> SidecarCacheWriter
+        return SidecarCacheWriter(self, fieldnames)
+
+
+
+class SidecarCacheWriter(object):
+    """Appends numpy chunks to a temporary cache file, commit() atomically replaces the sidecar cache"""
+
+    def __init__( self, cache, fieldnames=None ):  # type: (SidecarCache, List[str]) -> None
+        self.cache      = cache
+        self.fieldnames = fieldnames
+        self.source     = cache.source()  # source stat before reading, in case the file changes while reading
+        self.chunks     = []
+        self.size       = 0
+        self.file       = open(cache.path + '.tmp', 'wb')
+
+
+    def append( self, chunk ):  # type: (numpy.ndarray) -> None
+        chunk = self.to_fixed_width(chunk)
+        self.file.write(chunk.tostring())
+        self.chunks.append({ "offset": self.size, "length": len(chunk), "dtype": chunk.dtype.descr })
+        self.size += chunk.nbytes
+
+
+    def append_rows( self, rows ):  # type: (List[List[str]]) -> None
+        """appends a list of string rows as a fixed-width string chunk"""
+        if not rows: return
+        columns = zip(*rows)
+        dtype   = [ ('f%d' % n, 'S%d' % max(1, max(len(value) for value in column))) for n, column in enumerate(columns) ]
+        self.append( numpy.array([ tuple(row) for row in rows ], dtype=dtype) )
+
+
+    @staticmethod
+    def to_fixed_width( chunk ):  # type: (numpy.ndarray) -> numpy.ndarray
+        """object columns cannot be memory-mapped, so convert to fixed-width strings"""
+        if not any( chunk.dtype[name] == object for name in chunk.dtype.names ):
+            return numpy.asarray(chunk)
+        dtype = []
+        for name in chunk.dtype.names:
+            if chunk.dtype[name] == object:
+                width = max([ 1 ] + [ len(str(value)) for value in chunk[name] ])
+                dtype.append( (name, 'S%d' % width) )
+            else:
+                dtype.append( (name, chunk.dtype[name]) )
+        return numpy.asarray(chunk).astype(dtype)
+
+
+    def commit( self ):  # type: () -> None
+        self.file.close()
+        if self.cache.source() != self.source:
+            return self.abort()  # source file was modified while reading
+
+        try:    os.remove(self.cache.index_path)  # invalidate the previous cache before replacing it
+        except OSError: pass
+        os.rename(self.cache.path + '.tmp', self.cache.path)
+        index = {
+            "source":     self.source,
+            "key":        self.cache.key,
+            "fieldnames": self.fieldnames,
+            "chunks":     self.chunks,
+            "size":       self.size,
+        }
+        with open(self.cache.index_path + '.tmp', 'w') as file:
+            simplejson.dump(index, file, sort_keys=True)
+        os.rename(self.cache.index_path + '.tmp', self.cache.index_path)
+
+
+    def abort( self ):  # type: () -> None
+        self.file.close()
+        try:    os.remove(self.cache.path + '.tmp')
+        except OSError: pass
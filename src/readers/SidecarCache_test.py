@@ -0,0 +1,60 @@
+import os
+from Queue import Empty, Queue
+
+import numpy
+
+from .CSVReader import CSVReader
+from .ColumnarCSVReader import ColumnarCSVReader
+from .TimestampParser import TimestampParser
+
+datafile       = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+airqualityfile = os.path.join( os.path.dirname(__file__), '../../data/air_quality/AirQualityUCI.csv' )
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def test_SidecarCache( tmpdir ):
+    rows    = read_queue( CSVReader(datafile, queue=Queue(), start=True).queue )
+    options = { "cache": str(tmpdir), "timestamp": "date" }
+
+    written = CSVReader(datafile, queue=Queue(), start=True, **options)
+    cache   = written.sidecar_cache()
+    assert cache.is_valid()
+    assert read_queue( written.queue ) == [ dict(row, timestamp=TimestampParser("date").parse(row['date'])) for row in rows ]
+
+    cached  = CSVReader(datafile, queue=Queue(), start=True, **options)
+    assert cached.filehandle is None                                  # csv file was never opened
+    assert read_queue( cached.queue )[0]['timestamp'] == 1422886740  # transforms are applied to cached rows
+    assert read_queue( CSVReader(datafile, queue=Queue(), start=True, cache=str(tmpdir)).queue ) == rows
+
+    # cache is rebuilt when the source file changes
+    filename = str(tmpdir.join('datatest.txt'))
+    with open(datafile) as source, open(filename, 'w') as file: file.write(source.read())
+    assert read_queue( CSVReader(filename, queue=Queue(), start=True, cache=True).queue ) == rows
+    with open(filename, 'a') as file: file.write('"9999","2015-02-04 10:00:00",1,2,3,4,5,0\n')
+    assert not CSVReader(filename, cache=True).sidecar_cache().is_valid()
+    assert len(read_queue( CSVReader(filename, queue=Queue(), start=True, cache=True).queue )) == len(rows) + 1
+    assert CSVReader(filename, cache=True).sidecar_cache().is_valid()
+
+
+def test_SidecarCache_columnar( tmpdir ):
+    options = { "cache": str(tmpdir), "timestamp": ["Date", "Time"], "batch_size": 1000 }
+    written = read_queue( ColumnarCSVReader(airqualityfile, queue=Queue(), start=True, **options).queue )
+    reader  = ColumnarCSVReader(airqualityfile, queue=Queue(), start=True, **options)
+    cached  = read_queue( reader.queue )
+
+    assert reader.filehandle is None
+    assert len(cached) == len(written) == 10
+    for chunk_written, chunk_cached in zip(written, cached):
+        assert chunk_cached.dtype.names == chunk_written.dtype.names
+        assert numpy.all( chunk_cached['timestamp'] == chunk_written['timestamp'] )
+        assert numpy.all( chunk_cached['CO(GT)']    == chunk_written['CO(GT)'] )
+        assert list(chunk_cached['Date'])           == list(chunk_written['Date'])
@@ -0,0 +1,145 @@
+import calendar
+import re
+
+import numpy
+from typing import Any, Dict, List, Union
+
+
+class TimestampParser(object):
+    """
+    Converts timestamp column(s) into int epoch seconds (UTC), for use as a SortedQueueMultiplexer sort_key
+
+    The date format is detected once, from the first value, then converted with a specialised parser:
+    - date part is parsed once per unique date string and cached (most rows share the same date)
+    - time part uses fixed-offset slicing of "HH:MM:SS" / "HH.MM.SS", falling back to split() for irregular values
+    Generic per-row strptime() is avoided entirely
+
+    Supported formats:
+        "2015-02-04 17:51:00"               # occupancy_data: single column
+        "10/3/2004", "18.00.00"             # AirQualityUCI: separate Date/Time columns, dayfirst=True
+        "1423072260"                        # epoch seconds
+
+    ### Usage:
+    parser = TimestampParser(["Date", "Time"], key="timestamp")
+    row    = parser({ "Date": "10/3/2004", "Time": "18.00.00" })  # adds row["timestamp"] = 1078941600
+    column = parser.parse_columns([ dates, times ])              # vectorized over numpy.recarray chunk columns
+    """
+
+    formats = [
+        ("epoch", re.compile(r'^\s*-?\d+(\.\d*)?\s*$')),
+        ("ymd",   re.compile(r'^\s*(\d{4})-(\d{1,2})-(\d{1,2})(?:([ T])(.*))?$')),
+        ("dmy",   re.compile(r'^\s*(\d{1,2})/(\d{1,2})/(\d{4})(?:([ T])(.*))?$')),
+        ]
+
+
+    def __init__( self, columns, key="timestamp", dayfirst=True, cache_size=100000 ):
+        # type: (Union[str, List[str]], str, bool, int) -> None
+        self.columns    = [ columns ] if isinstance(columns, basestring) else list(columns)
+        self.key        = key
+        self.dayfirst   = dayfirst
+        self.cache_size = cache_size
+        self.format     = None  # type: str
+        self.separator  = None  # type: str   # date/time separator within a single column
+        self.date_cache = {}    # type: Dict[str, int]
+        assert 1 <= len(self.columns) <= 2, 'TimestampParser(columns) must be a date column, or [date, time] columns'
+
+
+    def __call__( self, row ):  # type: (Dict) -> Dict
+        """FileReader transform: adds row[key] = int epoch seconds"""
+        if len(self.columns) == 1:
+            row[self.key] = self.parse(row[self.columns[0]])
+        else:
+            row[self.key] = self.parse(row[self.columns[0]], row[self.columns[1]])
+        return row
+
+
+    ### Format Detection
+
+    def detect( self, value ):  # type: (str) -> str
+        for name, regex in self.formats:
+            match = regex.match(value)
+            if match:
+                self.format = name
+                if name == "dmy" and not self.dayfirst: self.format = "mdy"
+                if name != "epoch":                     self.separator = match.group(4) or ' '
+                return self.format
+        raise ValueError("TimestampParser.detect(): unknown timestamp format: %r" % value)
+
+
+    ### Row Parsing
+
+    def parse( self, value, time=None ):  # type: (str, Union[str,None]) -> int
+        if self.format is None: self.detect(value)
+        if self.format == "epoch":
+            return int(float(value))
+        if time is None:
+            (value, separator, time) = value.strip().partition(self.separator)
+        return self.parse_date(value) + self.parse_time(time)
+
+
+    def parse_date( self, date ):  # type: (str) -> int
+        """epoch seconds at midnight, cached per unique date string"""
+        try:
+            return self.date_cache[date]
+        except KeyError:
+            if len(self.date_cache) >= self.cache_size: self.date_cache = {}
+
+            if self.format == "ymd":
+                (year, month, day) = date.strip().split('-')
+            else:
+                (day, month, year) = date.strip().split('/')
+                if self.format == "mdy": (day, month) = (month, day)
+
+            self.date_cache[date] = calendar.timegm((int(year), int(month), int(day), 0, 0, 0))
+            return self.date_cache[date]
+
+
+    @staticmethod
+    def parse_time( time ):  # type: (str) -> int
+        """seconds since midnight from "HH:MM:SS" or "HH.MM.SS", fractional seconds are truncated"""
+        if not time: return 0
+        if len(time) >= 8 and time[2] in (':', '.') and time[5] == time[2]:
+            return int(time[0:2]) * 3600 + int(time[3:5]) * 60 + int(time[6:8])  # fixed-offset fast path
+
+        fields = re.split(r'[:.]', time.strip()) + [ 0, 0 ]
+        return int(fields[0] or 0) * 3600 + int(fields[1] or 0) * 60 + int(fields[2] or 0)
+
+
+    ### Vectorized Parsing
+
+    def parse_columns( self, columns ):  # type: (List[numpy.ndarray]) -> numpy.ndarray
+        """vectorized conversion of a chunk of date (and time) columns into int64 epoch seconds"""
+        dates = numpy.asarray(columns[0])
+        if len(dates) == 0: return numpy.array([], dtype=numpy.int64)
+        if self.format is None: self.detect(str(dates[0]))
+
+        if self.format == "epoch":
+            return dates.astype(numpy.float64).astype(numpy.int64)
+
+        if len(columns) == 1:
+            parts = numpy.char.partition(numpy.char.strip(dates.astype(str)), self.separator)
+            (dates, times) = (parts[:,0], parts[:,2])
+        else:
+            times = numpy.asarray(columns[1]).astype(str)
+
+        # date part: parse each unique date once
+        (unique_dates, inverse) = numpy.unique(dates, return_inverse=True)
+        output = numpy.array([ self.parse_date(date) for date in unique_dates ], dtype=numpy.int64)[inverse]
+
+        # time part: fixed-width "HH?MM?SS" via uint8 view of the string bytes, with per-item fallback
+        fixed  = numpy.char.str_len(times) == 8
+        digits = times.astype('S8').view(numpy.uint8).reshape(-1, 8).astype(numpy.int64)
+        fixed &= (digits[:,2] == digits[:,5]) & numpy.in1d(digits[:,2], [ ord(':'), ord('.') ])
+        digits -= ord('0')
+        output += numpy.where(fixed, (digits[:,0]*10 + digits[:,1]) * 3600
+                                   + (digits[:,3]*10 + digits[:,4]) * 60
+                                   + (digits[:,6]*10 + digits[:,7]), 0)
+        for n in numpy.flatnonzero(~fixed):
+            output[n] += self.parse_time(times[n])
+        return output
+
+
+    ### Pickling for ProcessPool workers
+
+    def __getstate__( self ):
+        return dict(self.__dict__, date_cache={})
@@ -0,0 +1,54 @@
+import os
+from Queue import Empty, Queue
+
+import numpy
+
+from .CSVReader import CSVReader
+from .ColumnarCSVReader import ColumnarCSVReader
+from .TimestampParser import TimestampParser
+
+datafile       = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+airqualityfile = os.path.join( os.path.dirname(__file__), '../../data/air_quality/AirQualityUCI.csv' )
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def test_TimestampParser():
+    parser = TimestampParser("date")
+    assert parser({ "date": "2015-02-02 14:19:00" })["timestamp"] == 1422886740
+    assert parser.format == "ymd"
+
+    parser = TimestampParser(["Date", "Time"], key="epoch")
+    assert parser({ "Date": "10/3/2004",  "Time": "18.00.00" })["epoch"] == 1078941600
+    assert parser({ "Date": "26/01/2005", "Time": "4.00.00"  })["epoch"] == 1106712000       # irregular hour
+    assert parser({ "Date": "30/09/2004", "Time": "09.00.00.-200" })["epoch"] == 1096534800  # trailing garbage
+    assert parser.format == "dmy"
+
+    for time, seconds in [ ("18", 64800), ("8", 28800), ("18:", 64800), ("18:30", 66600), ("18.30.5", 66605), ("", 0) ]:
+        assert TimestampParser.parse_time(time) == seconds, time                              # short times skip the fast path
+    assert parser.parse_columns([ numpy.array([ "10/3/2004" ] * 3), numpy.array([ "18", "18.30", "18.30.05" ]) ]).tolist() \
+        == [ 1078941600, 1078943400, 1078943405 ]
+
+    assert TimestampParser("date", dayfirst=False).parse("3/10/2004 18:00:00") == 1078941600
+    assert TimestampParser("date").parse("1078941600") == 1078941600
+
+
+def test_TimestampParser_readers():
+    items = read_queue( CSVReader(airqualityfile, queue=Queue(), start=True, timestamp=["Date", "Time"]).queue )
+    assert items[0]['timestamp'] == 1078941600
+    assert all( items[n]['timestamp'] == items[n-1]['timestamp'] + 3600 for n in range(1, len(items)) )
+
+    # vectorized parse_columns() matches row by row parse()
+    chunks = read_queue( ColumnarCSVReader(airqualityfile, queue=Queue(), start=True, timestamp=["Date", "Time"]).queue )
+    assert [ row.timestamp for row in chunks[0] ] == [ item['timestamp'] for item in items ]
+
+    chunks = read_queue( ColumnarCSVReader(datafile, queue=Queue(), start=True, timestamp="date", schema={ "date": str }).queue )
+    assert chunks[0]['timestamp'][0] == 1422886740
@@ -0,0 +1,133 @@
+import os
+import time
+from operator import itemgetter
+
+import numpy
+from typing import Any, List, Union
+
+
+
+class Batch(list):
+    """
+    Envelope allowing several queue items to be sent as a single queue.put()
+
+    Each queue.put() is pickled and sent through a pipe (or a Manager proxy round-trip),
+    so batching rows amortizes the per-item IPC cost across the whole batch
+
+    ### Usage:
+    for item in Batch.unpack( queue.get() ):    # consumers unpack batches transparently
+        print item
+    """
+
+    @staticmethod
+    def is_batch( item ):  # type: (Any) -> bool
+        """Batch envelopes and numpy.recarray chunks (see: ColumnarCSVReader) both contain multiple items"""
+        return isinstance(item, (Batch, numpy.recarray))
+
+
+    @staticmethod
+    def unpack( item ):  # type: (Any) -> List[Any]
+        """returns list of items inside a Batch envelope or numpy.recarray chunk, or single item as list"""
+        if isinstance(item, Tracked): item = item[0]
+        if Batch.is_batch(item): return item
+        else:                    return [ item ]
+
+
+
+class Tracked(tuple):
+    """
+    Envelope around a queue item put by FileReader(checkpoint_ack=True): (item, acks_path, first, last)
+
+    Consumers call Tracked.ack(item) once the item has been processed, which appends the row range [first, last)
+    to the reader's acknowledgement log. A file rather than shared memory, so acks can be written from any process
+    (including pool workers) and survive a crash: a restarted reader skips acknowledged rows and re-reads the others
+
+    ### Usage:
+    item = queue.get()
+    for row in Batch.unpack(item): ...          # Batch.unpack() unwraps Tracked envelopes
+    Tracked.ack(item)                           # no-op for untracked items
+    """
+
+    __slots__ = ()
+    item      = property(itemgetter(0))
+    acks_path = property(itemgetter(1))
+    first     = property(itemgetter(2))
+    last      = property(itemgetter(3))
+
+    def __new__( cls, item, acks_path, first, last ):  # type: (Any, str, int, int) -> Tracked
+        return tuple.__new__(cls, (item, acks_path, first, last))
+
+    def __reduce__( self ):
+        return Tracked, tuple(self)
+
+
+    @staticmethod
+    def unwrap( item ):  # type: (Any) -> Any
+        return item[0] if isinstance(item, Tracked) else item
+
+
+    @staticmethod
+    def ack( item ):  # type: (Any) -> None
+        """appends [first, last) to the acknowledgement log, a single O_APPEND write is atomic between processes"""
+        if not isinstance(item, Tracked): return
+        handle = os.open(item.acks_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(handle, "%d %d\n" % (item.first, item.last))
+        finally:
+            os.close(handle)
+
+
+
+class BatchWriter(object):
+    """
+    Wraps a queue, and buffers put() calls into Batch envelopes
+
+    A batch is flushed when it contains batch_size items, or when the first item in the batch
+    is older than batch_timeout seconds. batch_size=1 writes items directly without an envelope
+
+    ### Usage:
+    writer = BatchWriter(queue, batch_size=1000, batch_timeout=0.1)
+    writer.put(item)        # returns True if the batch was flushed
+    writer.flush()          # flush any remaining items before queue.put(Queue.Empty)
+    """
+
+    def __init__( self, queue, batch_size=1, batch_timeout=None ):
+        # type: (Any, int, Union[float,None]) -> None
+        assert hasattr(queue, 'put'), 'BatchWriter(queue) must be of type Manager().Queue()'
+
+        self.queue         = queue
+        self.batch_size    = max(1, int(batch_size or 1))
+        self.batch_timeout = batch_timeout
+        self.batch         = Batch()
+        self.batch_time    = None
+
+
+    def put( self, item ):  # type: (Any) -> bool
+        if self.batch_size == 1:
+            self.queue.put(item)  # short-circuit unbatched case
+            return True
+
+        if not self.batch: self.batch_time = time.time()
+        self.batch.append(item)
+
+        if len(self.batch) >= self.batch_size or self.is_expired():
+            return self.flush()
+        return False
+
+
+    def is_expired( self ):  # type: () -> bool
+        """returns True if the oldest item in the batch has exceeded batch_timeout"""
+        return bool( self.batch
+                 and self.batch_timeout is not None
+                 and time.time() - self.batch_time >= self.batch_timeout )
+
+
+    def flush( self ):  # type: () -> bool
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = Batch()
+        return True
+
+
+    def __len__( self ):
+        return len(self.batch)
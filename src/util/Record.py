@@ -0,0 +1,104 @@
+from operator import itemgetter
+
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+
+
+class Record(tuple):
+    """
+    Compact tuple-backed row record, with a record type generated once per set of fieldnames
+
+    A tuple subclass with __slots__ = () has no per-instance __dict__, so costs a fraction of the memory of a dict
+    (120 vs 1048 bytes for an 8 column row). Records pickle as R(schema, *values), where schema is the fieldnames
+    joined into a single string, shared by every record of the same type, so only written once per pickle (eg: once per Batch envelope).
+    A single schema string costs 1 byte per field rather than 4 for the keys of a dict,
+    so unbatched records with 8 columns pickle smaller than the equivalent dict, see: Serializer_benchmark
+
+    Supports both row["CO2"] and row.CO2 access, plus "CO2" in row, row.get(), keys(), values(), items() and dict(row),
+    so Condition.matches() and SortedQueueMultiplexer(sort_key=) work unchanged.
+    Iteration and len() follow tuple semantics and return the values
+
+    ### Usage:
+    CSVReader(filename, queue=queue, wrapper=Record)    # generates a record type from the csv header
+    Row = Record.type(["date", "CO2"])
+    row = Row(["2015-02-02 14:19:00", "749.2"])
+    row = Record({ "date": "2015-02-02 14:19:00", "CO2": "749.2" })     # record type from dict keys
+    row["CO2"] == row.CO2 == "749.2"
+    """
+
+    __slots__ = ()
+    _fields   = ()  # type: Tuple[str]
+    _index    = {}  # type: Dict[str, int]
+    _schema   = ()  # type: Union[str, Tuple]  # pickled in place of _fields, see: R()
+    _types    = {}  # type: Dict[Union[str, Tuple], type]   # shared cache of generated record types, by fieldnames and by schema
+
+
+    def __new__( cls, values=() ):  # type: (Union[Dict, Iterable]) -> Record
+        if cls is Record:
+            if isinstance(values, Record): return values
+            return Record.type(values.keys())(values.values())  # dict.keys() and dict.values() share the same order
+        if type(values) is cls:
+            return values  # already a record of this type, records are immutable
+        return tuple.__new__(cls, values)
+
+
+    @staticmethod
+    def type( fieldnames ):  # type: (Iterable[str]) -> type
+        """returns the (cached) record type for fieldnames"""
+        fieldnames = tuple(fieldnames)
+        if fieldnames not in Record._types:
+            schema    = ','.join(fieldnames) if fieldnames and all( isinstance(name, basestring) and ',' not in name for name in fieldnames ) \
+                        else fieldnames
+            namespace = { "__slots__": (), "_fields": fieldnames, "_index": { name: n for n, name in enumerate(fieldnames) }, "_schema": schema }
+            for n, name in enumerate(fieldnames):
+                if isinstance(name, basestring) and name not in Record.__dict__:
+                    namespace[name] = property(itemgetter(n))  # attribute access, overrides tuple.index and tuple.count
+            Record._types[fieldnames] = Record._types[schema] = type('Record', (Record,), namespace)
+        return Record._types[fieldnames]
+
+
+    ### Dictionary Access
+
+    def __getitem__( self, key ):
+        if key in self._index:                  return tuple.__getitem__(self, self._index[key])
+        if isinstance(key, (int, long, slice)): return tuple.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__( self, key ):
+        return key in self._index
+
+    def get( self, key, default=None ):  # type: (str, Any) -> Any
+        return tuple.__getitem__(self, self._index[key]) if key in self._index else default
+
+    def keys( self ):  # type: () -> List[str]
+        return list(self._fields)
+
+    def values( self ):  # type: () -> List[Any]
+        return list(self)
+
+    def items( self ):  # type: () -> List[Tuple[str, Any]]
+        return zip(self._fields, self)
+
+    def to_dict( self ):  # type: () -> Dict[str, Any]
+        return dict(zip(self._fields, self))
+
+
+    ### Serialization
+
+    def __reduce__( self ):
+        return R, (self._schema,) + tuple(self)
+
+    def __repr__( self ):
+        return 'Record(%s)' % ', '.join( '%s=%r' % (name, value) for name, value in zip(self._fields, self) )
+
+
+
+def R( schema, *values ):  # type: (Union[str, Tuple], *Any) -> Record
+    """
+    pickle constructor, so records can be unpickled in processes which have not yet generated the record type.
+    The short name and module path are written into every unbatched pickle
+    """
+    cls = Record._types.get(schema) or Record.type(schema.split(',') if isinstance(schema, basestring) else schema)
+    return tuple.__new__(cls, values)
+
+R.__module__ = 'src.util'  # re-exported by src/util/__init__.py, so pickles reference the shorter path src.util.R
@@ -0,0 +1,54 @@
+import os
+import pickle
+import subprocess
+import sys
+from Queue import Empty, Queue
+
+from src.event.Condition import Condition
+from src.readers.CSVReader import CSVReader
+from src.util.Batch import Batch
+from .Record import Record
+
+datafile = os.path.join( os.path.dirname(__file__), '../../data/occupancy_data/datatest.txt' )
+
+
+
+def read_queue( queue ):
+    items = []
+    while True:
+        item = queue.get()
+        if item is Empty: break
+        items.append( item )
+    return items
+
+
+def test_Record():
+    rows    = read_queue( CSVReader(datafile, queue=Queue(), start=True).queue )
+    records = read_queue( CSVReader(datafile, queue=Queue(), start=True, wrapper=Record).queue )
+
+    assert all( isinstance(record, Record) for record in records )
+    assert [ record.to_dict() for record in records ] == rows
+    assert records[0]['CO2'] == records[0].CO2 == "749.2"
+    assert records[0].index == "140"                               # fieldnames override tuple methods
+    assert "CO2" in records[0] and "missing" not in records[0]
+    assert type(records[0]) is type(records[-1])                   # record type is generated once per file
+    assert Condition({ "Occupancy": "1" }).matches(records[0])
+
+    assert sys.getsizeof(records[0]) < sys.getsizeof(rows[0]) / 4
+    assert pickle.loads(pickle.dumps(Batch(records), 2)) == records
+    assert len(pickle.dumps(Batch(records), 2)) < len(pickle.dumps(Batch(rows), 2))
+    assert type(pickle.loads(pickle.dumps(records[0], 2))) is type(records[0])
+
+    # unbatched bytes/row, as multiprocessing.Queue() pickles each item, see: Serializer_benchmark
+    assert sum( len(pickle.dumps(record, 2)) for record in records ) < sum( len(pickle.dumps(row, 2)) for row in rows )
+
+    # a process which has never imported src.util.Record can unpickle records
+    root   = os.path.join( os.path.dirname(__file__), '../..' )
+    script = "import pickle, sys; print repr(pickle.loads(sys.stdin.read()))"
+    output = subprocess.Popen([ sys.executable, "-c", script ], cwd=root, stdin=subprocess.PIPE, stdout=subprocess.PIPE) \
+                       .communicate(pickle.dumps(records[0], 2))[0]
+    assert output.strip() == repr(records[0])
+
+    records = read_queue( CSVReader(datafile, queue=Queue(), start=True, wrapper=Record, columns=[ "CO2" ], timestamp="date").queue )
+    assert records[0].timestamp == 1422886740
+    assert sorted(records[0].keys()) == [ "CO2", "date", "timestamp" ]
@@ -0,0 +1 @@
+from .Record import Record, R